@@ -0,0 +1,207 @@
+"""
+Headless Batch-Tagging für viele Decks.
+
+Liest Moxfield Deck-IDs oder URLs (eine pro Zeile) aus einer Datei oder von stdin,
+lädt und verarbeitet die Decks parallel und schreibt pro Deck eine NDJSON-Zeile mit
+der angewendeten Tag-Auswahl. Bereits erfolgreich verarbeitete Decks in der
+Ausgabedatei werden beim erneuten Start übersprungen.
+
+Beispiel:
+    python batch_tagger.py decks.txt -o tagged.ndjson --tags removal,ramp,card-draw
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from functions.async_pipeline import ingest_decks
+from functions.deck_render import DeckRenderModel
+from functions.general_funs import DEFAULT_BOARDS, parse_deck_id, tag_deck_cards
+from functions.webapp_funs import flush_deck_tag_index
+
+
+TAG_TREE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tag_trees', 'cleaned_tag_tree.pkl')
+
+# Wird in jedem Worker-Prozess einmal geladen
+_worker_tag_tree = None
+
+
+def _init_worker(tag_tree_path):
+    global _worker_tag_tree
+    with open(tag_tree_path, "rb") as f:
+        _worker_tag_tree = pickle.load(f)
+
+
+def tag_processed_deck(deck_id, deck_data, selected_tags):
+    """
+    CPU-Teil der Pipeline: wendet die Tag-Auswahl auf ein verarbeitetes Deck an.
+
+    :return: Das Ergebnis-Objekt für die NDJSON-Ausgabe.
+    """
+    tagged_cards = tag_deck_cards(deck_data, selected_tags, _worker_tag_tree)
+    return {
+        "deck_id": deck_id,
+        "status": "ok",
+        "cards": [
+            {
+                "quantity": card_data.get("quantity", 0),
+                "name": card_data.get("name", ""),
+                "set": card_data.get("set", ""),
+                "cn": card_data.get("cn", ""),
+                "board": card_data.get("board"),
+                "tags": tags,
+            }
+            for card_data, tags in tagged_cards
+        ],
+        "deck_string": DeckRenderModel(deck_data, _worker_tag_tree).render(selected_tags),
+    }
+
+
+def read_entries(lines):
+    """Liest Einträge (Deck-IDs, URLs oder Tags) zeilenweise, leere Zeilen und Kommentare (#) werden ignoriert."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def read_finished_deck_ids(output_path):
+    """Deck-IDs, die in einer vorhandenen Ausgabedatei bereits erfolgreich verarbeitet wurden."""
+    finished = set()
+    if not output_path or not os.path.exists(output_path):
+        return finished
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Letzte Zeile nach einem Absturz evtl. unvollständig
+                continue
+            if record.get("status") == "ok":
+                finished.add(record["deck_id"])
+    return finished
+
+
+def run_batch(deck_inputs, output, selected_tags, workers=8, processes=None, boards=DEFAULT_BOARDS,
+              refresh=False, skip=frozenset(), tag_tree_path=TAG_TREE_PATH):
+    """
+    Verarbeitet alle Decks und schreibt die Ergebnisse fortlaufend nach output.
+
+    Laden, Auflösen und Speichern der Decks übernimmt die asyncio-Pipeline aus
+    functions.async_pipeline (begrenzte Warteschlangen, Limits pro Host, gemeinsame
+    Rate-Limits des http_client), das Anwenden der Tag-Auswahl ein Prozess-Pool.
+    Karten-Cache und Tag-Index werden einmal am Ende geschrieben.
+
+    :return: Ein Dictionary mit Zählern für ok, error und skipped.
+    """
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    def write(record):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        counts[record["status"]] += 1
+
+    def write_error(deck_id, error):
+        write({"deck_id": deck_id, "status": "error", "error": f"{type(error).__name__}: {error}"})
+
+    def deck_ids():
+        seen = set()
+        for deck_input in deck_inputs:
+            try:
+                deck_id = parse_deck_id(deck_input)
+            except ValueError as e:
+                write({"deck_id": deck_input, "status": "error", "error": str(e)})
+                continue
+            if deck_id in skip or deck_id in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(deck_id)
+            yield deck_id
+
+    async def tag_decks(cpu_pool):
+        loop = asyncio.get_running_loop()
+        pending = {}  # Future -> Deck-ID
+
+        async def drain(return_when):
+            done, _ = await asyncio.wait(pending, return_when=return_when)
+            for future in done:
+                deck_id = pending.pop(future)
+                try:
+                    write(future.result())
+                except Exception as e:
+                    write_error(deck_id, e)
+
+        results = ingest_decks(deck_ids(), boards=boards, use_cache=not refresh,
+                               fetch_workers=workers, resolve_workers=workers, tag_workers=max(1, workers // 2))
+        async with contextlib.aclosing(results):
+            async for result in results:
+                if result.error is not None:
+                    write_error(result.deck_id, result.error)
+                    continue
+                future = loop.run_in_executor(cpu_pool, tag_processed_deck, result.deck_id, result.data, selected_tags)
+                pending[future] = result.deck_id
+                # Backpressure: nicht mehr Decks gleichzeitig im Speicher als nötig
+                if len(pending) >= workers * 4:
+                    await drain(asyncio.FIRST_COMPLETED)
+        while pending:
+            await drain(asyncio.ALL_COMPLETED)
+
+    # Kein fork: die Worker-Prozesse starten erst beim ersten Deck, wenn die Threads der Pipeline schon laufen
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(start_method),
+                             initializer=_init_worker, initargs=(tag_tree_path,)) as cpu_pool:
+        asyncio.run(tag_decks(cpu_pool))
+
+    # Der Karten-Cache wird am Ende der Pipeline gespeichert, der Tag-Index einmal pro Batch
+    flush_deck_tag_index()
+
+    counts["seconds"] = round(time.perf_counter() - start, 3)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taggt viele Moxfield Decks ohne Web-Oberfläche.")
+    parser.add_argument("input", nargs="?", default="-", help="Datei mit Deck-IDs oder URLs, '-' für stdin")
+    parser.add_argument("-o", "--output", help="NDJSON Ausgabedatei (wird fortgesetzt), sonst stdout")
+    parser.add_argument("--tags", default="", help="Kommagetrennte Tag-Auswahl")
+    parser.add_argument("--tags-file", help="Datei mit einem ausgewählten Tag pro Zeile")
+    parser.add_argument("--workers", type=int, default=8, help="Parallele Worker pro Stufe der Lade-Pipeline")
+    parser.add_argument("--processes", type=int, default=None, help="Prozesse für das Tagging (Standard: CPU-Kerne)")
+    parser.add_argument("--boards", default=",".join(DEFAULT_BOARDS), help="Kommagetrennte Boards, z.B. commanders,mainboard")
+    parser.add_argument("--refresh", action="store_true", help="Decks neu von Moxfield laden statt den Cache zu nutzen")
+    args = parser.parse_args(argv)
+
+    selected_tags = [tag.strip() for tag in args.tags.split(",") if tag.strip()]
+    if args.tags_file:
+        with open(args.tags_file, "r", encoding="utf-8") as f:
+            selected_tags.extend(read_entries(f))
+    boards = tuple(board.strip() for board in args.boards.split(",") if board.strip())
+
+    if args.input == "-":
+        deck_inputs = list(read_entries(sys.stdin))
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            deck_inputs = list(read_entries(f))
+
+    skip = read_finished_deck_ids(args.output)
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = run_batch(deck_inputs, output, selected_tags, workers=args.workers, processes=args.processes,
+                           boards=boards, refresh=args.refresh, skip=skip)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(counts), file=sys.stderr)
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Misst den Kaltstart der Web-App in frischen Prozessen: Import der App-Module, erstes
+Laden von Tag-Baum, Tag-Store und Baum-Index sowie, falls Streamlit installiert ist,
+den ersten Lauf und einen erneuten Lauf des App-Skripts über streamlit.testing.
+
+Mit --ref wird derselbe Ablauf zusätzlich für einen älteren Commit gemessen (vorher/nachher).
+
+Aufruf aus dem Projektordner:
+    python benchmarks/bench_cold_start.py [--ref HEAD~1] [--deck <Deck-ID>] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Nicht versionierte Artefakte, die für einen fairen Vergleich in den alten Stand verlinkt werden
+SHARED_PATHS = ("cache", os.path.join("ressources", "card_tag_store"), os.path.join("ressources", "oracle_id_index.bin"))
+
+MEASURE = r"""
+import json, pickle, sys, time
+start = time.perf_counter()
+import functions.general_funs, functions.webapp_funs
+imported = time.perf_counter()
+result = {"import_ms": (imported - start) * 1e3,
+          "heavy_modules": [m for m in ("requests", "tqdm", "bs4", "pandas") if m in sys.modules]}
+
+with open("tag_trees/cleaned_tag_tree.pkl", "rb") as f:
+    tag_tree = pickle.load(f)
+from functions.tag_store import get_tag_store
+get_tag_store()
+try:
+    from functions.tag_tree_index import get_tag_tree_index
+    get_tag_tree_index(tag_tree)
+except ImportError:
+    pass
+result["resources_ms"] = (time.perf_counter() - imported) * 1e3
+
+try:
+    from streamlit.testing.v1 import AppTest
+except ImportError:
+    AppTest = None
+if AppTest is not None:
+    app = AppTest.from_file("mtg_deck_tagger_app.py", default_timeout=120)
+    run_start = time.perf_counter()
+    app.run()
+    result["first_run_ms"] = (time.perf_counter() - run_start) * 1e3
+    deck = sys.argv[1] if len(sys.argv) > 1 else ""
+    if deck:
+        run_start = time.perf_counter()
+        app.text_input[0].input(deck).run()
+        result["deck_run_ms"] = (time.perf_counter() - run_start) * 1e3
+    run_start = time.perf_counter()
+    app.run()
+    result["rerun_ms"] = (time.perf_counter() - run_start) * 1e3
+print(json.dumps(result))
+"""
+
+
+def measure(tree, deck, repeat):
+    """Führt die Messung repeat-mal in frischen Prozessen aus und liefert pro Wert das Minimum."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", MEASURE, deck], cwd=tree, check=True,
+                                capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    summary = {key: round(min(run[key] for run in runs), 1) for key in runs[0] if key.endswith("_ms")}
+    summary["heavy_modules"] = runs[0]["heavy_modules"]
+    return summary
+
+
+def export_ref(ref, folder):
+    """Entpackt den Stand eines Commits nach folder und verlinkt die gemeinsamen Artefakte."""
+    archive = os.path.join(folder, "ref.tar")
+    subprocess.run(["git", "archive", "--format=tar", "-o", archive, ref], cwd=ROOT, check=True)
+    tree = os.path.join(folder, "tree")
+    with tarfile.open(archive) as tar:
+        tar.extractall(tree)
+    for path in SHARED_PATHS:
+        source = os.path.join(ROOT, path)
+        if os.path.exists(source) and not os.path.exists(os.path.join(tree, path)):
+            os.symlink(source, os.path.join(tree, path))
+    return tree
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ref", help="Älterer Commit zum Vergleich, z.B. HEAD~1")
+    parser.add_argument("--deck", default="", help="Deck-ID für einen Lauf mit (zwischengespeichertem) Deck")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        if args.ref:
+            results[args.ref] = measure(export_ref(args.ref, folder), args.deck, args.repeat)
+        results["working tree"] = measure(ROOT, args.deck, args.repeat)
+
+    for name, summary in results.items():
+        print(f"{name:14s} " + "  ".join(f"{key} {value}" for key, value in summary.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Vergleicht filter_tag_tree (einzelner Post-Order Durchlauf) mit der vorherigen
+Index-basierten Variante und der ursprünglichen rekursiven Implementierung.
+
+Aufruf aus dem Projektordner: python benchmarks/bench_filter_tag_tree.py
+"""
+import os
+import pickle
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions.general_funs import extract_unique_tags, filter_tag_tree
+from functions.tag_tree_index import get_tag_tree_index
+from functions.webapp_funs import iter_cached_processed_decks
+
+
+def filter_tag_tree_recursive(tag_tree, all_tags):
+    """Ursprüngliche Implementierung, die jeden Teilbaum pro Ebene erneut durchläuft."""
+    def filter_hierarchy(tag):
+        if tag not in tag_tree:
+            return {}
+        filtered_children = {
+            child: filter_hierarchy(child)
+            for child in tag_tree[tag]
+            if child in all_tags or any(desc in all_tags for desc in get_all_descendants(child, tag_tree))
+        }
+        if tag in all_tags or filtered_children:
+            return filtered_children
+        return {}
+
+    def get_all_descendants(tag, tree):
+        descendants = set()
+        if tag in tree:
+            for child in tree[tag]:
+                descendants.add(child)
+                descendants.update(get_all_descendants(child, tree))
+        return descendants
+
+    return {
+        tag: filter_hierarchy(tag)
+        for tag in tag_tree
+        if tag in all_tags or any(desc in all_tags for desc in get_all_descendants(tag, tag_tree))
+    }
+
+
+def filter_tag_tree_index(tag_tree, all_tags):
+    """Index-basierte Variante: pro Knoten ein Bitset-Vergleich mit der Teilbaum-Maske."""
+    index = get_tag_tree_index(tag_tree)
+    deck_mask = index.mask(all_tags)
+
+    def filter_hierarchy(subtree):
+        return {
+            tag: filter_hierarchy(sub_tags)
+            for tag, sub_tags in subtree.items()
+            if index.subtree_mask(tag) & deck_mask
+        }
+
+    return filter_hierarchy(tag_tree)
+
+
+def load_deck_tag_sets():
+    return [extract_unique_tags(deck) for _, deck in iter_cached_processed_decks()]
+
+
+def main(repeat=20):
+    with open(os.path.join(ROOT, "tag_trees", "cleaned_tag_tree.pkl"), "rb") as f:
+        tag_tree = pickle.load(f)
+    tag_sets = load_deck_tag_sets()
+    # Extremfall: alle Tags des Baums sind im Deck
+    tag_sets.append(get_tag_tree_index(tag_tree).tags)
+
+    for all_tags in tag_sets:
+        assert filter_tag_tree(tag_tree, all_tags) == filter_tag_tree_index(tag_tree, all_tags)
+
+    print(f"{len(tag_sets)} tag sets, {len(get_tag_tree_index(tag_tree))} tags in tree")
+    for name, func in [("recursive (original)", filter_tag_tree_recursive),
+                       ("index", filter_tag_tree_index),
+                       ("post-order", filter_tag_tree)]:
+        seconds = min(timeit.repeat(lambda: [func(tag_tree, tags) for tags in tag_sets], number=1, repeat=repeat))
+        print(f"{name:22s} {seconds / len(tag_sets) * 1e3:8.3f} ms per deck")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Offline-Benchmark-Suite für alle heißen Pfade der Deck-Verarbeitung, von einem
+60-Karten-Deck bis zu einer Sammlung mit 50.000 Karten.
+
+Es wird nichts aus dem Netz geladen: Als Vorlage für die Karten dienen die
+aufgezeichneten Moxfield-Antworten in cache/*.json, Scryfall wird über den
+transport-Parameter durch einen Stub ersetzt. Zum Taggen werden der mitgelieferte
+cleaned_tag_tree.pkl und der aus card_tags_dict.pkl gebaute Tag-Store verwendet.
+Die Oracle IDs stammen aus den zwischengespeicherten Decks und werden bei größeren
+Decks mit zufälligen (aber reproduzierbaren) Karten aus dem Tag-Store aufgefüllt.
+
+Die Ergebnisse werden als JSON gespeichert, standardmäßig unter
+benchmarks/results/<commit>.json. Mit --compare wird gegen eine frühere
+Ergebnisdatei verglichen; Verschlechterungen über --threshold führen zu Exit-Code 1.
+
+Aufruf aus dem Projektordner:
+    python benchmarks/bench_suite.py [--sizes 60 100 1000 10000 50000] [--only filter_tag_tree ...]
+                                     [--output results.json] [--compare benchmarks/results/<alt>.json]
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions import card_cache, general_funs, metrics
+from functions.deck_render import DeckRenderModel
+from functions.general_funs import (add_oracle_ids, add_selected_tags, add_tags_to_deck, build_deck_string,
+                                    build_oracle_id_index, convert_to_tree_select_format, extract_card_data,
+                                    extract_deck_cards, extract_unique_tags, filter_tag_tree, flatten_dict,
+                                    get_matching_tags)
+from functions.tag_store import get_tag_store
+from functions.tag_tree_index import get_tag_tree_index
+from functions.tree_select_payload import LAZY_DEPTH, TreeSelectPayload, count_cards_per_tag
+from functions.webapp_funs import iter_cached_processed_decks
+
+RESULTS_FOLDER = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_SIZES = (60, 100, 1000, 10000, 50000)
+SELECTION_SIZE = 20  # Anzahl ausgewählter Tags für Matching und Deckstring
+
+
+class ScryfallStub:
+    """Ersetzt den POST auf /cards/collection, antwortet aus einer Zuordnung Scryfall ID -> Oracle ID."""
+
+    def __init__(self, oracle_ids):
+        self.oracle_ids = oracle_ids
+        self.requests = 0
+
+    def __call__(self, url, payload):
+        self.requests += 1
+        data, not_found = [], []
+        for identifier in payload["identifiers"]:
+            oracle_id = self.oracle_ids.get(identifier.get("id"))
+            if oracle_id is None:
+                not_found.append(identifier)
+            else:
+                data.append({"object": "card", "id": identifier["id"], "oracle_id": oracle_id})
+        return {"object": "list", "not_found": not_found, "data": data}
+
+
+def load_recorded_decks():
+    """Liest die aufgezeichneten Moxfield-Antworten (cache/<Deck-ID>.json)."""
+    decks = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "cache", "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            deck = json.load(f)
+        if isinstance(deck, dict) and "boards" in deck:
+            decks.append(deck)
+    if not decks:
+        raise SystemExit("Keine aufgezeichneten Moxfield-Antworten in cache/*.json gefunden.")
+    return decks
+
+
+def card_pool(size, rng):
+    """
+    Liefert size Paare (Scryfall ID, Oracle ID): zuerst echte Drucke aus den
+    zwischengespeicherten Decks, danach zufällige Drucke von Karten aus dem Tag-Store.
+    """
+    pairs = {}
+    for _, deck in iter_cached_processed_decks():
+        for card_data in deck.values():
+            if card_data.get("scryfall_id") and card_data.get("oracle_id"):
+                pairs[card_data["scryfall_id"]] = card_data["oracle_id"]
+    pool = sorted(pairs.items())[:size]
+    if len(pool) < size:
+        oracle_ids = [oracle_id for oracle_id, _ in get_tag_store().items()]
+        while len(pool) < size:
+            pool.append((str(uuid.UUID(int=rng.getrandbits(128), version=4)), rng.choice(oracle_ids)))
+    return pool
+
+
+def synthetic_deck(recorded_decks, pool):
+    """Baut eine Moxfield-Antwort mit einer Mainboard-Karte pro Eintrag in pool."""
+    templates = [entry for deck in recorded_decks for entry in deck["boards"]["mainboard"]["cards"].values()]
+    cards = {}
+    for i, (scryfall_id, _) in enumerate(pool):
+        template = templates[i % len(templates)]
+        cards[f"c{i:06d}"] = dict(template, card=dict(template["card"], scryfall_id=scryfall_id))
+    deck = dict(recorded_decks[0])
+    deck["boards"] = {"mainboard": {"count": len(cards), "cards": cards}}
+    return deck
+
+
+def fresh_card_cache(folder):
+    """Ersetzt den prozessweiten Karten-Cache durch einen leeren, der nie gespeichert wird."""
+    card_cache._card_cache = card_cache.CardCache(os.path.join(folder, "card_cache.pkl"))
+    return card_cache._card_cache
+
+
+def use_oracle_id_index(path):
+    """Lässt lookup_oracle_id den Index unter path verwenden (ein fehlender Pfad schaltet ihn ab)."""
+    general_funs.ORACLE_ID_INDEX_PATH = path
+    general_funs._oracle_id_index = None
+
+
+def copy_cards(cards, drop=()):
+    return {key: {field: value for field, value in card_data.items() if field not in drop}
+            for key, card_data in cards.items()}
+
+
+def measure(func, setup=None, repeat=5, max_time=2.0):
+    """
+    Führt func bis zu repeat-mal aus, aber nicht länger als max_time Sekunden (mindestens einmal).
+    setup() wird vor jedem Lauf außerhalb der Messung aufgerufen und liefert die Argumente.
+    """
+    times = []
+    deadline = time.perf_counter() + max_time
+    while len(times) < repeat:
+        args = setup() if setup else ()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        if time.perf_counter() > deadline:
+            break
+    return times
+
+
+def run_size(size, recorded_decks, tag_tree, folder, only, repeat, max_time):
+    """Führt alle Benchmarks für ein Deck mit size Karten aus und liefert die Messreihen pro Benchmark."""
+    rng = random.Random(size)
+    pool = card_pool(size, rng)
+    oracle_ids = dict(pool)
+    stub = ScryfallStub(oracle_ids)
+    deck_json = synthetic_deck(recorded_decks, pool)
+    raw_json = json.dumps(deck_json)
+
+    # Lokaler Index aus einer synthetischen Bulk-Datei mit genau diesen Drucken
+    bulk_path = os.path.join(folder, f"bulk_{size}.json")
+    index_path = os.path.join(folder, f"oracle_id_index_{size}.bin")
+    with open(bulk_path, "w", encoding="utf-8") as f:
+        json.dump([{"object": "card", "id": scryfall_id, "oracle_id": oracle_id} for scryfall_id, oracle_id in pool], f)
+    build_oracle_id_index(bulk_path, index_path)
+    no_index_path = os.path.join(folder, "no_index.bin")
+
+    cards = extract_deck_cards(deck_json)
+
+    # Verarbeitetes Deck als Grundlage für alle Schritte nach dem Taggen
+    fresh_card_cache(folder)
+    use_oracle_id_index(no_index_path)
+    processed = add_tags_to_deck(add_oracle_ids(copy_cards(cards), transport=stub, progress=False))
+    all_tags = sorted(extract_unique_tags(processed))
+    deck_tag_tree = filter_tag_tree(tag_tree, all_tags)
+    card_counts = count_cards_per_tag(processed, tag_tree)
+    selection = list(dict.fromkeys(list(deck_tag_tree)[:SELECTION_SIZE // 4] +
+                                   all_tags[::max(1, len(all_tags) // SELECTION_SIZE)]))[:SELECTION_SIZE]
+    other_selection = selection[1:] + [tag for tag in all_tags if tag not in selection][:1]
+
+    def oracle_setup(index_path, warm):
+        def setup():
+            cache = fresh_card_cache(folder)
+            if warm:
+                cache.put_oracle_ids(oracle_ids)
+            use_oracle_id_index(index_path)
+            return (copy_cards(cards, drop=("oracle_id", "tags")),)
+        return setup
+
+    def tags_setup(warm):
+        def setup():
+            cache = fresh_card_cache(folder)
+            deck = copy_cards(processed, drop=("tags",))
+            if warm:
+                add_tags_to_deck(copy_cards(deck))
+            cache.stats = dict.fromkeys(cache.stats, 0)
+            return (deck,)
+        return setup
+
+    def render_changed_selection():
+        model = DeckRenderModel(processed, tag_tree)
+        model.render(selection)
+        return (model,)
+
+    def full_deck_string(deck):
+        deck_tags = sorted(extract_unique_tags(deck))
+        convert_to_tree_select_format(filter_tag_tree(tag_tree, deck_tags))
+        return DeckRenderModel(deck, tag_tree).render(selection)
+
+    benchmarks = {
+        "parse_moxfield_json": (json.loads, lambda: (raw_json,)),
+        "flatten_extract_card_data": (lambda deck: extract_card_data(flatten_dict(deck)), lambda: (deck_json,)),
+        "extract_deck_cards": (extract_deck_cards, lambda: (deck_json,)),
+        "oracle_ids_scryfall_stub": (lambda deck: add_oracle_ids(deck, transport=stub, progress=False),
+                                     oracle_setup(no_index_path, warm=False)),
+        "oracle_ids_local_index": (lambda deck: add_oracle_ids(deck, transport=stub, progress=False),
+                                   oracle_setup(index_path, warm=False)),
+        "oracle_ids_card_cache": (lambda deck: add_oracle_ids(deck, transport=stub, progress=False),
+                                  oracle_setup(no_index_path, warm=True)),
+        "add_tags_to_deck_cold": (add_tags_to_deck, tags_setup(warm=False)),
+        "add_tags_to_deck_warm": (add_tags_to_deck, tags_setup(warm=True)),
+        "filter_tag_tree": (lambda: filter_tag_tree(tag_tree, all_tags), None),
+        "get_matching_tags": (lambda: [get_matching_tags(selection, tag_tree, card_data.get("tags", []))
+                                       for card_data in processed.values()], None),
+        "convert_to_tree_select_format": (lambda: convert_to_tree_select_format(deck_tag_tree), None),
+        "count_cards_per_tag": (lambda: count_cards_per_tag(processed, tag_tree), None),
+        "tree_select_payload_full": (lambda: TreeSelectPayload(tag_tree, all_tags, card_counts).nodes(), None),
+        "tree_select_payload_lazy": (lambda: TreeSelectPayload(tag_tree, all_tags, card_counts).nodes(
+            (), depth=LAZY_DEPTH), None),
+        "build_deck_string": (lambda: build_deck_string(add_selected_tags(processed, selection)), None),
+        "render_model_build": (lambda: DeckRenderModel(processed, tag_tree), None),
+        "render_selection_change": (lambda model: model.render(other_selection), render_changed_selection),
+        "deck_string_end_to_end": (full_deck_string, lambda: (processed,)),
+    }
+
+    info = {"cards": size, "deck_tags": len(all_tags), "tree_nodes": len(get_tag_tree_index(deck_tag_tree)),
+            "selected_tags": len(selection)}
+    results = {}
+    for name, (func, setup) in benchmarks.items():
+        if only and name not in only:
+            continue
+        stub.requests = 0
+        times = measure(func, setup, repeat, max_time)
+        results[name] = {"runs": len(times), "min_s": min(times), "median_s": statistics.median(times),
+                         "mean_s": statistics.fmean(times), "per_card_us": min(times) / size * 1e6}
+        if name == "oracle_ids_scryfall_stub":
+            results[name]["requests_per_run"] = stub.requests / len(times)
+    return info, results
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    try:
+        return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--", "functions"))
+    except OSError:
+        return "unknown", False
+
+
+def compare(results, baseline_path, threshold):
+    """Vergleicht die Minima mit einer früheren Ergebnisdatei und liefert die Anzahl der Verschlechterungen."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    base = {(entry["benchmark"], entry["cards"]): entry for entry in baseline["results"]}
+    regressions = 0
+    print(f"\nVergleich mit {baseline['meta']['commit']} ({baseline_path}):")
+    for entry in results:
+        old = base.get((entry["benchmark"], entry["cards"]))
+        if old is None:
+            continue
+        ratio = entry["min_s"] / old["min_s"] if old["min_s"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  <-- langsamer"
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = "  schneller"
+        print(f"{entry['benchmark']:30s} {entry['cards']:>6d}  {old['min_s'] * 1e3:10.3f} ms -> "
+              f"{entry['min_s'] * 1e3:10.3f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline-Benchmarks der Deck-Verarbeitung")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Anzahl Karten pro Deck")
+    parser.add_argument("--only", nargs="+", help="Nur diese Benchmarks ausführen")
+    parser.add_argument("--repeat", type=int, default=5, help="Maximale Anzahl Läufe pro Messung")
+    parser.add_argument("--max-time", type=float, default=2.0, help="Zeitbudget pro Messung in Sekunden")
+    parser.add_argument("--output", help="Ergebnisdatei, Standard: benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="Frühere Ergebnisdatei zum Vergleich")
+    parser.add_argument("--threshold", type=float, default=1.10, help="Faktor, ab dem eine Messung als langsamer gilt")
+    args = parser.parse_args(argv)
+
+    # Messungen sollen nicht von MTG_TAGGER_METRICS abhängen
+    metrics.enable(False)
+    with open(os.path.join(ROOT, "tag_trees", "cleaned_tag_tree.pkl"), "rb") as f:
+        tag_tree = pickle.load(f)
+    get_tag_tree_index(tag_tree)
+    get_tag_store()
+    recorded_decks = load_recorded_decks()
+
+    commit, dirty = git_revision()
+    results, decks = [], []
+    original_index_path = general_funs.ORACLE_ID_INDEX_PATH
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for size in sorted(args.sizes):
+                info, size_results = run_size(size, recorded_decks, tag_tree, folder, args.only, args.repeat,
+                                              args.max_time)
+                decks.append(info)
+                print(f"\n{size} Karten, {info['deck_tags']} Tags, {info['tree_nodes']} Knoten im Deck-Baum")
+                for name, result in size_results.items():
+                    print(f"  {name:30s} {result['min_s'] * 1e3:10.3f} ms  {result['per_card_us']:8.2f} us/Karte"
+                          f"  ({result['runs']} Läufe)")
+                    results.append({"benchmark": name, "cards": size, **result})
+    finally:
+        use_oracle_id_index(original_index_path)
+        card_cache._card_cache = None
+
+    report = {
+        "meta": {"commit": commit, "dirty": dirty, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "tag_store_version": get_tag_store().version, "repeat": args.repeat, "max_time": args.max_time},
+        "decks": decks,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_FOLDER, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nErgebnisse gespeichert in {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Vergleicht card_tags_dict.pkl mit dem CSR Tag-Store: Ladezeit, zusätzlicher
+Speicher (RSS) und Latenz pro Lookup. Jede Variante läuft in einem eigenen
+Prozess, damit sich die Speichermessungen nicht gegenseitig beeinflussen.
+
+Aufruf aus dem Projektordner: python benchmarks/bench_tag_store.py
+"""
+import os
+import pickle
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(variant, lookups=20000):
+    import numpy as np
+    from functions import tag_store
+
+    # Stichprobe direkt aus den Schlüsseln ziehen, ohne eine der Varianten vorab zu laden
+    store_path = tag_store._current_store_path(tag_store.TAG_STORE_FOLDER)
+    keys = np.load(os.path.join(store_path, "oracle_keys.npy"))
+    random.seed(0)
+    sample = []
+    for _ in range(lookups):
+        hex_key = bytes(random.choice(keys)).ljust(16, b"\0").hex()
+        sample.append(f"{hex_key[:8]}-{hex_key[8:12]}-{hex_key[12:16]}-{hex_key[16:20]}-{hex_key[20:]}")
+    del keys
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    if variant == "pickle":
+        with open(tag_store.CARD_TAGS_DICT_PATH, "rb") as f:
+            card_tags_dict = pickle.load(f)
+        lookup = lambda oracle_id: card_tags_dict.get(oracle_id, [])
+    else:
+        store = tag_store.get_tag_store()
+        lookup = store.get_tags
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for oracle_id in sample:
+        lookup(oracle_id)
+    lookup_seconds = (time.perf_counter() - start) / lookups
+    rss_delta = rss_bytes() - rss_before
+
+    print(f"{variant:8s} load {load_seconds * 1e3:8.2f} ms   rss +{rss_delta / 2 ** 20:7.2f} MiB   "
+          f"lookup {lookup_seconds * 1e6:6.2f} us")
+
+
+def main():
+    # Store einmal vorab bauen, damit nur das Laden gemessen wird
+    from functions.tag_store import get_tag_store
+    get_tag_store()
+    for variant in ("pickle", "store"):
+        subprocess.run([sys.executable, __file__, variant], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,165 @@
+"""
+Vergleicht den Aufbau des Tag-Baums aus den Tagger-Seiten: die ursprüngliche serielle
+Variante (html.parser, merge_dicts, zweimal remove_duplicates_at_lowest_level) mit
+build_tag_tree aus tag_trees/parse_tag_tree_htmls.py.
+
+Ohne geladene Seiten in tag_trees/tmp/ werden synthetische Seiten erzeugt.
+
+Aufruf aus dem Projektordner: python benchmarks/bench_tag_tree_build.py [--pages 3000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tag_trees"))
+
+from parse_tag_tree_htmls import HTML_FOLDER, build_tag_tree
+
+
+def extract_tag_hierarchy_from_html_original(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    tag_hierarchy = {}
+    parent_stack = []
+    for div in soup.find_all('div', class_='tags-list__row'):
+        depth = next((x for x in div.get('class', []) if x.startswith('depth-')), None)
+        if depth:
+            depth_number = int(depth.split('-')[1])
+            if depth_number < 4:
+                a_tag = div.find('a')
+                if a_tag:
+                    tag_text = a_tag.get_text(strip=True).replace(' ', '-')
+                else:
+                    continue
+                while len(parent_stack) + 1 > depth_number:
+                    parent_stack.pop()
+                if len(parent_stack) == 0:
+                    tag_hierarchy[tag_text] = {}
+                    parent_stack.append(tag_hierarchy[tag_text])
+                else:
+                    parent_stack[-1][tag_text] = {}
+                    parent_stack.append(parent_stack[-1][tag_text])
+    return tag_hierarchy
+
+
+def remove_duplicates_at_lowest_level_original(hierarchy):
+    tmp_hier = hierarchy.copy()
+
+    def traverse(node, depth, key_depths):
+        for key, child in node.items():
+            key_depths.setdefault(key, []).append(depth)
+            if child:
+                traverse(child, depth + 1, key_depths)
+
+    def clean(node, depth, key_depths):
+        for key in list(node.keys()):
+            if (len(key_depths[key]) > 1) and (max(key_depths[key]) == depth):
+                del node[key]
+            elif node[key]:
+                clean(node[key], depth + 1, key_depths)
+
+    key_depths = {}
+    traverse(tmp_hier, 0, key_depths)
+    clean(tmp_hier, 0, key_depths)
+    return tmp_hier
+
+
+def merge_dicts_original(d1, d2):
+    merged = {}
+    for key in set(d1.keys()).union(d2.keys()):
+        if key in d1 and key in d2:
+            if isinstance(d1[key], dict) and isinstance(d2[key], dict):
+                merged[key] = merge_dicts_original(d1[key], d2[key])
+            else:
+                merged[key] = [d1[key], d2[key]] if d1[key] != d2[key] else d1[key]
+        elif key in d1:
+            merged[key] = d1[key]
+        else:
+            merged[key] = d2[key]
+    return merged
+
+
+def build_tag_tree_original(folder_path):
+    combined_hierarchy = {}
+    for filename in os.listdir(folder_path):
+        if filename.endswith(".html"):
+            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
+                combined_hierarchy = merge_dicts_original(combined_hierarchy,
+                                                          extract_tag_hierarchy_from_html_original(file.read()))
+    cleaned_tags = remove_duplicates_at_lowest_level_original(combined_hierarchy)
+    cleaned_tags = remove_duplicates_at_lowest_level_original(cleaned_tags)
+    return {k: v for k, v in sorted(cleaned_tags.items())}
+
+
+def write_synthetic_pages(folder, pages, seed=0):
+    """
+    Erzeugt Seiten wie die des Taggers: Vorfahren-Ketten eines Tags und seine Nachfahren,
+    wobei Tags mehrere Eltern haben können (dadurch entstehen Duplikate im Baum).
+    """
+    rng = random.Random(seed)
+    tags = [f"tag-{i}" for i in range(pages)]
+    parents = {tag: rng.sample(tags[:i], k=min(i, rng.choice((1, 1, 1, 2)))) if i > pages // 10 else []
+               for i, tag in enumerate(tags)}
+    children = {tag: [] for tag in tags}
+    for tag, tag_parents in parents.items():
+        for parent in tag_parents:
+            children[parent].append(tag)
+
+    def chain(tag):
+        tag_parents = parents[tag]
+        return chain(tag_parents[0]) + [tag] if tag_parents else [tag]
+
+    for tag in tags:
+        rows = []
+        path = chain(tag)
+        for depth, ancestor in enumerate(path, start=1):
+            rows.append((depth, ancestor))
+
+        def descend(node, depth):
+            for child in children[node]:
+                rows.append((depth, child))
+                if depth < 5:
+                    descend(child, depth + 1)
+
+        descend(tag, len(path) + 1)
+        if len(rows) <= 2:
+            continue
+        body = "\n".join(
+            f'<div class="tags-list__row depth-{depth}">\n  <span class="icon"></span>\n  <a href="/tags/card/{name}">\n    {name.replace("-", " ")}\n  </a>\n</div>'
+            for depth, name in rows
+        )
+        with open(os.path.join(folder, f"{tag}.html"), "w", encoding="utf-8") as f:
+            f.write(f'<div class="site-body">\n<h1>{tag}</h1>\n{body}\n<footer>' + "x" * 2000 + '</footer>\n</div>\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=3000, help="Anzahl synthetischer Seiten")
+    parser.add_argument("--folder", default=None, help="Ordner mit Tagger-Seiten (Standard: tag_trees/tmp oder synthetisch)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        folder = args.folder or (HTML_FOLDER if os.path.isdir(HTML_FOLDER) else None)
+        if folder is None:
+            folder = tmp_folder
+            write_synthetic_pages(folder, args.pages)
+        print(f"{sum(name.endswith('.html') for name in os.listdir(folder))} pages in {folder}")
+
+        start = time.perf_counter()
+        original = build_tag_tree_original(folder)
+        print(f"{'original (serial)':22s} {time.perf_counter() - start:8.2f} s")
+        for processes in (1, None):
+            start = time.perf_counter()
+            new = build_tag_tree(folder, processes=processes)
+            label = f"new ({processes or os.cpu_count()} processes)"
+            print(f"{label:22s} {time.perf_counter() - start:8.2f} s")
+            assert new == original, "trees differ"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Lasttest für den Tagging-Dienst (functions/tagging_service.py): schickt Anfragen mit
+zufälligen Tag-Auswahlen parallel an den Dienst und gibt p50/p90/p99-Latenz sowie
+Anfragen pro Sekunde aus.
+
+Ohne --url wird der Dienst in einem eigenen Prozess gestartet, und zwar in einem
+temporären Ordner, dessen Cache frische Kopien der zwischengespeicherten Decks aus
+cache/ enthält. So läuft der Test offline und der Cache des Projekts bleibt unberührt.
+Mit --url wird ein bereits laufender Dienst getestet; die Deck-IDs kommen dann aus
+--decks oder aus cache/.
+
+Aufruf aus dem Projektordner:
+    python benchmarks/load_test_service.py [--requests 2000] [--concurrency 16] [--workers 4]
+                                           [--format json] [--url http://127.0.0.1:8765] [--output result.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions import webapp_funs
+from functions.general_funs import DEFAULT_BOARDS, extract_unique_tags
+
+
+def load_decks():
+    """Liest Deck-ID und Tags aller zwischengespeicherten Decks aus cache/."""
+    return {deck_id: (deck, sorted(extract_unique_tags(deck))) for deck_id, deck in webapp_funs.iter_cached_processed_decks()}
+
+
+def prepare_cache(folder, decks):
+    """Schreibt die Decks als gültige Einträge der aktuellen Tag-Version in folder/cache."""
+    cache_folder, tag_index_path = webapp_funs.cache_folder, webapp_funs.TAG_INDEX_PATH
+    webapp_funs.cache_folder = os.path.join(folder, "cache")
+    webapp_funs.TAG_INDEX_PATH = os.path.join(webapp_funs.cache_folder, "tag_index.pkl")
+    try:
+        for deck_id, (deck, _) in decks.items():
+            webapp_funs.save_processed_deck(deck_id, deck, meta={"last_updated": None, "boards": list(DEFAULT_BOARDS)})
+        webapp_funs.flush_deck_tag_index()
+    finally:
+        # Sonst schreibt der atexit-Handler den Index des temporären Caches nach cache/
+        webapp_funs._tag_index = None
+        webapp_funs.cache_folder, webapp_funs.TAG_INDEX_PATH = cache_folder, tag_index_path
+
+
+def start_service(folder, workers):
+    """Startet den Dienst mit folder/cache als Deck-Cache auf einem freien Port und liefert (Prozess, URL)."""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+               **{webapp_funs.CACHE_FOLDER_ENV_VAR: os.path.join(folder, "cache")})
+    process = subprocess.Popen([sys.executable, "-m", "functions.tagging_service", "--port", "0",
+                                "--workers", str(workers), "--metrics"],
+                               cwd=folder, env=env, stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()
+    if "http://" not in line:
+        process.kill()
+        raise SystemExit(f"Dienst konnte nicht gestartet werden: {line}{process.stderr.read()}")
+    # stderr weiter leeren, damit der Dienst nie an einer vollen Pipe hängen bleibt
+    threading.Thread(target=process.stderr.read, daemon=True).start()
+    return process, line[line.index("http://"):].strip()
+
+
+def run_load(url, decks, requests, concurrency, tags_per_request, output_format, seed):
+    """Schickt requests Anfragen mit concurrency parallelen Verbindungen und liefert (Latenzen, Fehler, Dauer)."""
+    split = urlsplit(url)
+    rng = random.Random(seed)
+    deck_ids = sorted(decks)
+    bodies = []
+    for _ in range(requests):
+        deck_id = rng.choice(deck_ids)
+        tags = decks[deck_id][1]
+        bodies.append(json.dumps({"deck": deck_id, "tags": rng.sample(tags, min(tags_per_request, len(tags))),
+                                  "format": output_format}))
+
+    local = threading.local()
+    errors = []
+
+    def send(body):
+        connection = getattr(local, "connection", None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection(split.hostname, split.port, timeout=120)
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/tag", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            local.connection = None
+            status = type(e).__name__
+        latency = time.perf_counter() - start
+        if status != 200:
+            errors.append(status)
+        return latency
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(send, bodies))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, seconds):
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_statuses": sorted({str(status) for status in errors}),
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 1),
+        "p50_ms": round(percentiles[49] * 1e3, 2),
+        "p90_ms": round(percentiles[89] * 1e3, 2),
+        "p99_ms": round(percentiles[98] * 1e3, 2),
+        "max_ms": round(max(latencies) * 1e3, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1e3, 2),
+    }
+
+
+def service_counters(url):
+    """Liest die Zähler des Dienstes aus /metrics (ohne Labels)."""
+    split = urlsplit(url)
+    connection = http.client.HTTPConnection(split.hostname, split.port, timeout=10)
+    try:
+        connection.request("GET", "/metrics")
+        text = connection.getresponse().read().decode("utf-8")
+    except (OSError, http.client.HTTPException):
+        return {}
+    finally:
+        connection.close()
+    counters = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name.startswith("mtg_tagger_") and "{" not in name and not name.startswith("#"):
+            counters[name] = float(value)
+    return counters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lasttest für den Tagging-Dienst")
+    parser.add_argument("--url", help="Laufender Dienst, sonst wird einer gestartet")
+    parser.add_argument("--decks", nargs="+", help="Deck-IDs für --url, Standard: Decks aus cache/")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallele Verbindungen")
+    parser.add_argument("--workers", type=int, default=4, help="Worker-Threads des gestarteten Dienstes")
+    parser.add_argument("--tags", type=int, default=10, help="Tags pro Anfrage")
+    parser.add_argument("--format", choices=("json", "text"), default="json")
+    parser.add_argument("--warmup", type=int, default=50, help="Anfragen vor der Messung")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Ergebnis zusätzlich als JSON speichern")
+    args = parser.parse_args(argv)
+
+    decks = load_decks()
+    if args.decks:
+        decks = {deck_id: decks.get(deck_id, ({}, [])) for deck_id in args.decks}
+    if not decks:
+        raise SystemExit("Keine Decks gefunden, bitte --decks angeben oder Decks in cache/ ablegen.")
+
+    with tempfile.TemporaryDirectory() as folder:
+        process = None
+        url = args.url
+        if url is None:
+            prepare_cache(folder, decks)
+            process, url = start_service(folder, args.workers)
+        try:
+            run_load(url, decks, args.warmup, args.concurrency, args.tags, args.format, args.seed + 1)
+            before = service_counters(url)
+            latencies, errors, seconds = run_load(url, decks, args.requests, args.concurrency, args.tags,
+                                                  args.format, args.seed)
+            after = service_counters(url)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    result = summarize(latencies, errors, seconds)
+    result.update({"url": url if args.url else "local", "decks": len(decks), "concurrency": args.concurrency,
+                   "workers": None if args.url else args.workers, "format": args.format,
+                   "tags_per_request": args.tags})
+    shared = after.get("mtg_tagger_singleflight_shared_total", 0) - before.get("mtg_tagger_singleflight_shared_total", 0)
+    if after:
+        result["singleflight_shared"] = shared
+
+    print(f"{result['requests']} Anfragen, {result['errors']} Fehler, {result['concurrency']} parallel, "
+          f"{result['decks']} Decks")
+    print(f"p50 {result['p50_ms']} ms   p90 {result['p90_ms']} ms   p99 {result['p99_ms']} ms   "
+          f"max {result['max_ms']} ms   {result['rps']} Anfragen/s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Taggt ganze Sammlungen (CSV-Export oder Textliste) im Streaming-Verfahren.
+
+Die Einträge werden in Batches gelesen, aufgelöst und sofort als getaggte Zeilen
+geschrieben, der Speicherbedarf hängt also nur von der Batch-Größe ab.
+
+Beispiel:
+    python collection_tagger.py sammlung.csv -o sammlung_getaggt.txt --tags removal,ramp
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+
+from functions.card_cache import get_card_cache
+from functions.collection_funs import COLLECTION_BATCH_SIZE, read_collection_rows, tag_collection
+
+
+TAG_TREE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tag_trees', 'cleaned_tag_tree.pkl')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taggt eine Kartensammlung zeilenweise.")
+    parser.add_argument("input", nargs="?", default="-", help="CSV-Export oder Textliste, '-' für stdin")
+    parser.add_argument("-o", "--output", help="Ausgabedatei, sonst stdout")
+    parser.add_argument("--tags", default="", help="Kommagetrennte Tag-Auswahl")
+    parser.add_argument("--format", choices=("csv", "text"), help="Eingabeformat (Standard: automatisch)")
+    parser.add_argument("--batch-size", type=int, default=COLLECTION_BATCH_SIZE, help="Einträge pro Batch")
+    args = parser.parse_args(argv)
+
+    selected_tags = [tag.strip() for tag in args.tags.split(",") if tag.strip()]
+    with open(TAG_TREE_PATH, "rb") as f:
+        tag_tree = pickle.load(f)
+
+    def progress(stats):
+        print(f"\r{stats['cards']} Karten, {stats['cards_per_second']:.0f} Karten/s", end="", file=sys.stderr)
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8-sig", newline="")
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        stats = tag_collection(read_collection_rows(source, args.format), output, selected_tags, tag_tree,
+                               batch_size=args.batch_size, progress=progress)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        get_card_cache().save()
+
+    print(file=sys.stderr)
+    print(json.dumps({key: round(value, 3) if isinstance(value, float) else value for key, value in stats.items()}),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from functions.tag_tree_index import get_tag_tree_index
+
+
+# Zwischenergebnisse der Auswertungen als Feather-Dateien
+ANALYTICS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "analytics")
+CARD_TAGS_FILE = "card_tags.feather"
+FINGERPRINT_FILE = "fingerprint.json"
+
+
+def build_card_tag_frame(decks: Iterable[Tuple[str, Dict[str, dict]]]) -> pd.DataFrame:
+    """
+    Builds the long (coordinate) card x tag table of a deck corpus.
+
+    Every row is one tag of one card of one deck. Deck IDs, card names and tags are
+    categorical columns, so the table stores integer codes instead of strings.
+
+    :param decks: (deck_id, processed deck) pairs, e.g. from iter_cached_processed_decks().
+    :return: A DataFrame with the columns deck_id, card_key, name, quantity and tag.
+    """
+    columns = {"deck_id": [], "card_key": [], "name": [], "quantity": [], "tag": []}
+    for deck_id, deck_data in decks:
+        for card_key, card_data in deck_data.items():
+            tags = card_data.get("tags") or []
+            columns["deck_id"].extend([deck_id] * len(tags))
+            columns["card_key"].extend([card_key] * len(tags))
+            columns["name"].extend([card_data.get("name", "")] * len(tags))
+            columns["quantity"].extend([card_data.get("quantity", 1)] * len(tags))
+            columns["tag"].extend(tags)
+
+    frame = pd.DataFrame(columns)
+    for column in ("deck_id", "card_key", "name", "tag"):
+        frame[column] = frame[column].astype("category")
+    frame["quantity"] = frame["quantity"].astype(np.int32)
+    return frame
+
+
+def _fingerprint(folder: str) -> str:
+    """
+    Hash over name, size and modification time of all processed-deck cache files.
+
+    Cache hits only touch the access time of a file, so the fingerprint changes when a
+    deck is written, removed or re-tagged, not when it is read.
+    """
+    digest = hashlib.sha1()
+    for filename in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        if filename.startswith("processed_deck_") and filename.endswith(".pkl"):
+            stat = os.stat(os.path.join(folder, filename))
+            digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def _cache_folder(cache_folder: str = None) -> str:
+    from functions import webapp_funs
+
+    return webapp_funs.cache_folder if cache_folder is None else cache_folder
+
+
+def load_card_tag_frame(cache_folder: str = None, analytics_folder: str = ANALYTICS_FOLDER) -> pd.DataFrame:
+    """
+    Returns the card x tag table of all cached decks, rebuilt only when the deck cache changed.
+
+    :param cache_folder: The processed-deck cache folder, by default that of webapp_funs.
+    :param analytics_folder: Where the table is stored as Feather file.
+    :return: The table as built by build_card_tag_frame.
+    """
+    from functions.webapp_funs import iter_cached_processed_decks
+
+    cache_folder = _cache_folder(cache_folder)
+    fingerprint = _fingerprint(cache_folder)
+    frame_path = os.path.join(analytics_folder, CARD_TAGS_FILE)
+    fingerprint_path = os.path.join(analytics_folder, FINGERPRINT_FILE)
+
+    try:
+        with open(fingerprint_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return pd.read_feather(frame_path)
+    except (OSError, ValueError):
+        pass
+
+    frame = build_card_tag_frame(iter_cached_processed_decks(cache_folder))
+    os.makedirs(analytics_folder, exist_ok=True)
+    frame.to_feather(frame_path + ".tmp")
+    os.replace(frame_path + ".tmp", frame_path)
+    with open(fingerprint_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+    os.replace(fingerprint_path + ".tmp", fingerprint_path)
+    return frame
+
+
+def _card_ids(frame: pd.DataFrame) -> np.ndarray:
+    """One integer per (deck, card) pair."""
+    return frame["deck_id"].cat.codes.to_numpy(np.int64) * (len(frame["card_key"].cat.categories) + 1) \
+        + frame["card_key"].cat.codes.to_numpy(np.int64)
+
+
+def tag_counts(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-tag statistics of the corpus.
+
+    :param frame: The card x tag table.
+    :return: Per tag the number of cards, copies (quantity-weighted), decks and the
+             share of decks containing it (prevalence), sorted by cards.
+    """
+    deck_total = frame["deck_id"].nunique()
+    grouped = frame.groupby("tag", observed=True)
+    counts = pd.DataFrame({
+        "cards": grouped.size(),
+        "copies": grouped["quantity"].sum(),
+        "decks": grouped["deck_id"].nunique(),
+    })
+    counts["prevalence"] = counts["decks"] / deck_total if deck_total else 0.0
+    return counts.sort_values("cards", ascending=False)
+
+
+def _ancestor_table(tags: pd.Index, tag_tree: dict) -> pd.DataFrame:
+    """Table tag -> ancestor (including the tag itself) for all given tags."""
+    index = get_tag_tree_index(tag_tree)
+    rows_tag, rows_ancestor = [], []
+    for tag in tags:
+        ancestors = [tag] + index.ancestors(tag)
+        rows_tag.extend([tag] * len(ancestors))
+        rows_ancestor.extend(ancestors)
+    return pd.DataFrame({"tag": pd.Categorical(rows_tag, categories=tags), "subtree": rows_ancestor})
+
+
+def subtree_counts(frame: pd.DataFrame, tag_tree: dict) -> pd.DataFrame:
+    """
+    Rolls the tag statistics up the tag tree.
+
+    A card counts for a subtree once if it has the root tag or any of its descendants.
+
+    :param frame: The card x tag table.
+    :param tag_tree: The nested tag tree, e.g. from cleaned_tag_tree.pkl.
+    :return: Per subtree root the number of cards, copies, decks and the prevalence.
+    """
+    deck_total = frame["deck_id"].nunique()
+    ancestors = _ancestor_table(frame["tag"].cat.categories, tag_tree)
+    cards = pd.DataFrame({
+        "card": _card_ids(frame),
+        "deck": frame["deck_id"].cat.codes.to_numpy(),
+        "quantity": frame["quantity"].to_numpy(),
+        "tag": frame["tag"],
+    })
+    rolled = cards.merge(ancestors, on="tag", how="inner").drop_duplicates(["card", "subtree"])
+    grouped = rolled.groupby("subtree")
+    counts = pd.DataFrame({
+        "cards": grouped.size(),
+        "copies": grouped["quantity"].sum(),
+        "decks": grouped["deck"].nunique(),
+    })
+    counts["prevalence"] = counts["decks"] / deck_total if deck_total else 0.0
+    return counts.sort_values("cards", ascending=False)
+
+
+def cooccurrence(frame: pd.DataFrame, top_n: int = 50, level: str = "card") -> pd.DataFrame:
+    """
+    Co-occurrence matrix of the most frequent tags.
+
+    :param frame: The card x tag table.
+    :param top_n: Number of tags (by card count) included.
+    :param level: "card" counts cards carrying both tags, "deck" counts decks containing both.
+    :return: A symmetric tag x tag DataFrame; the diagonal holds the counts of the tags themselves.
+    """
+    top_tags = frame["tag"].value_counts().index[:top_n]
+    subset = frame[frame["tag"].isin(top_tags)]
+    rows = _card_ids(subset) if level == "card" else subset["deck_id"].cat.codes.to_numpy(np.int64)
+    row_codes, row_positions = np.unique(rows, return_inverse=True)
+    tag_codes = pd.Categorical(subset["tag"].astype(str), categories=list(top_tags)).codes
+
+    # Inzidenzmatrix Zeilen x Tags, das Produkt mit sich selbst zählt gemeinsame Vorkommen
+    incidence = np.zeros((len(row_codes), len(top_tags)), dtype=np.int32)
+    incidence[row_positions, tag_codes] = 1
+    matrix = incidence.T @ incidence
+    return pd.DataFrame(matrix, index=list(top_tags), columns=list(top_tags))
+
+
+def tag_report(tag_tree: dict, cache_folder: str = None, analytics_folder: str = ANALYTICS_FOLDER) -> pd.DataFrame:
+    """
+    Per-tag and per-subtree statistics of all cached decks, cached as Feather file.
+
+    :param tag_tree: The nested tag tree.
+    :param cache_folder: The processed-deck cache folder, by default that of webapp_funs.
+    :param analytics_folder: Where the table and the report are stored.
+    :return: Per tag its own statistics and those of its subtree (columns prefixed with subtree_).
+    """
+    cache_folder = _cache_folder(cache_folder)
+    frame = load_card_tag_frame(cache_folder, analytics_folder)
+    fingerprint = _fingerprint(cache_folder) + hashlib.sha1(repr(tag_tree).encode()).hexdigest()
+    report_path = os.path.join(analytics_folder, "tag_report.feather")
+    fingerprint_path = os.path.join(analytics_folder, "tag_report.json")
+
+    try:
+        with open(fingerprint_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return pd.read_feather(report_path).set_index("tag")
+    except (OSError, ValueError):
+        pass
+
+    report = tag_counts(frame).join(subtree_counts(frame, tag_tree).add_prefix("subtree_"), how="outer")
+    report.index.name = "tag"
+    report = report.sort_values("subtree_cards", ascending=False)
+
+    os.makedirs(analytics_folder, exist_ok=True)
+    report.reset_index().to_feather(report_path + ".tmp")
+    os.replace(report_path + ".tmp", report_path)
+    with open(fingerprint_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+    os.replace(fingerprint_path + ".tmp", fingerprint_path)
+    return report
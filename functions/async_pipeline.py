@@ -0,0 +1,169 @@
+import asyncio
+import contextlib
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from functions.card_cache import get_card_cache
+from functions.general_funs import (DEFAULT_BOARDS, add_oracle_ids, add_tags_to_deck, get_decklist, parse_deck_id,
+                                    prepare_deck_cards)
+from functions.webapp_funs import compare_with_cached_deck, get_cached_processed_deck, save_processed_deck
+
+
+# Maximale Anzahl gleichzeitiger Anfragen pro Host (zusätzlich zu den Rate-Limits des http_client)
+HOST_CONCURRENCY = {
+    "api2.moxfield.com": 4,
+    "api.scryfall.com": 4,
+}
+QUEUE_SIZE = 16  # Größe der Warteschlangen zwischen den Stufen
+
+_DONE = object()
+
+
+class DeckResult(NamedTuple):
+    deck_id: str
+    data: Optional[Dict[str, Dict[str, Any]]]
+    error: Optional[BaseException]
+
+
+async def ingest_decks(deck_inputs: Iterable[str], boards=DEFAULT_BOARDS, use_cache: bool = True,
+                       fetch_workers: int = 4, resolve_workers: int = 4, tag_workers: int = 2,
+                       queue_size: int = QUEUE_SIZE):
+    """
+    Loads and processes many decks concurrently and yields them as they finish.
+
+    The pipeline has three stages connected by bounded queues: deck fetch (Moxfield),
+    Oracle ID resolution (card cache, local index, Scryfall) and tagging plus caching.
+    A full queue blocks the stage before it, so memory stays bounded. The blocking
+    HTTP and file work runs in threads; per-host semaphores cap the number of
+    concurrent requests on top of the shared rate limits.
+
+    Each deck is handled like webapp_funs.load_processed_deck: cached decks are only
+    served for the same boards, and a fetched deck is compared with its (possibly
+    expired) cache entry, so only new or changed printings are resolved and tagged.
+    The card cache is saved once when the pipeline finishes.
+
+    :param deck_inputs: Deck IDs or URLs.
+    :param boards: The boards to extract.
+    :param use_cache: Whether decks from the processed-deck cache are served directly,
+                      like refresh=False in load_processed_deck.
+    :param fetch_workers: Concurrent deck fetches.
+    :param resolve_workers: Concurrent Oracle ID resolutions.
+    :param tag_workers: Concurrent tagging jobs.
+    :param queue_size: Capacity of each queue between the stages.
+    :return: An async generator of DeckResult in completion order.
+    """
+    semaphores = {host: asyncio.Semaphore(limit) for host, limit in HOST_CONCURRENCY.items()}
+    fetch_queue = asyncio.Queue(queue_size)
+    resolve_queue = asyncio.Queue(queue_size)
+    tag_queue = asyncio.Queue(queue_size)
+    result_queue = asyncio.Queue(queue_size)
+
+    async def limited(host, func, *args):
+        async with semaphores[host]:
+            return await asyncio.to_thread(func, *args)
+
+    async def feed():
+        for deck_input in deck_inputs:
+            await fetch_queue.put(deck_input)
+
+    async def fetch():
+        while (deck_input := await fetch_queue.get()) is not _DONE:
+            try:
+                deck_id = parse_deck_id(deck_input)
+                if use_cache:
+                    cached = await asyncio.to_thread(get_cached_processed_deck, deck_id, boards)
+                    if cached is not None:
+                        await result_queue.put(DeckResult(deck_id, cached, None))
+                        continue
+                deck_data = await limited("api2.moxfield.com", get_decklist, deck_id)
+                meta, previous, unchanged, reuse_tags = await asyncio.to_thread(
+                    compare_with_cached_deck, deck_id, deck_data, boards)
+            except Exception as e:
+                await result_queue.put(DeckResult(deck_input, None, e))
+                continue
+            if unchanged:
+                # Unverändert: ohne Auflösen direkt zum Speichern
+                await tag_queue.put((deck_id, meta, previous, {}))
+            else:
+                await resolve_queue.put((deck_id, meta, deck_data, previous, reuse_tags))
+
+    async def resolve():
+        while (item := await resolve_queue.get()) is not _DONE:
+            deck_id, meta, deck_data, previous, reuse_tags = item
+            try:
+                deck_dict, changed = prepare_deck_cards(deck_data, previous, boards, reuse_tags)
+                missing = {key: card for key, card in changed.items() if "oracle_id" not in card}
+                if missing:
+                    await limited("api.scryfall.com", add_oracle_ids, missing)
+            except Exception as e:
+                await result_queue.put(DeckResult(deck_id, None, e))
+                continue
+            await tag_queue.put((deck_id, meta, deck_dict, changed))
+
+    def tag_and_save(deck_id, meta, deck_dict, changed):
+        if changed:
+            add_tags_to_deck(changed)
+        save_processed_deck(deck_id, deck_dict, meta=meta)
+        return deck_dict
+
+    async def tag():
+        while (item := await tag_queue.get()) is not _DONE:
+            deck_id = item[0]
+            try:
+                deck_dict = await asyncio.to_thread(tag_and_save, *item)
+            except Exception as e:
+                await result_queue.put(DeckResult(deck_id, None, e))
+                continue
+            await result_queue.put(DeckResult(deck_id, deck_dict, None))
+
+    async def stage(worker, count, next_queue, next_count):
+        # Wenn alle Worker einer Stufe fertig sind, wird das Ende an die nächste Stufe weitergereicht,
+        # auch nach einem Fehler (z.B. beim Lesen von deck_inputs), sonst warten die folgenden Stufen ewig
+        try:
+            await asyncio.gather(*(worker() for _ in range(count)))
+        finally:
+            for _ in range(next_count):
+                await next_queue.put(_DONE)
+
+    tasks = [
+        asyncio.create_task(stage(feed, 1, fetch_queue, fetch_workers)),
+        asyncio.create_task(stage(fetch, fetch_workers, resolve_queue, resolve_workers)),
+        asyncio.create_task(stage(resolve, resolve_workers, tag_queue, tag_workers)),
+        asyncio.create_task(stage(tag, tag_workers, result_queue, 1)),
+    ]
+    try:
+        while (result := await result_queue.get()) is not _DONE:
+            yield result
+        # Fehler in den Stufen selbst nicht verschlucken
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        get_card_cache().save()
+
+
+async def ingest_deck(deck_id_or_url: str, boards=DEFAULT_BOARDS, use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Async counterpart of webapp_funs.load_processed_deck for a single deck.
+
+    :raises: The error of the failed stage.
+    """
+    results = ingest_decks([deck_id_or_url], boards=boards, use_cache=use_cache,
+                           fetch_workers=1, resolve_workers=1, tag_workers=1)
+    # Beim vorzeitigen return den Generator schließen, damit die Stufen beendet und der Karten-Cache gespeichert wird
+    async with contextlib.aclosing(results):
+        async for result in results:
+            if result.error is not None:
+                raise result.error
+            return result.data
+
+
+def ingest_decks_sync(deck_inputs: Iterable[str], **kwargs) -> list:
+    """
+    Runs ingest_decks to completion from synchronous code (e.g. a script or a worker thread).
+
+    :return: The list of DeckResult in completion order.
+    """
+    async def collect():
+        return [result async for result in ingest_decks(deck_inputs, **kwargs)]
+
+    return asyncio.run(collect())
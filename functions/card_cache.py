@@ -0,0 +1,186 @@
+import os
+import pickle
+import tempfile
+import threading
+from typing import Dict, List, Tuple
+
+from functions import metrics
+
+
+# Gemeinsamer Cache pro Druck (Scryfall ID), wird zwischen allen Decks geteilt
+CARD_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "card_cache.pkl")
+
+
+class CardCache:
+    """
+    Process-wide cache mapping a printing (Scryfall ID) to its Oracle ID and interned tag IDs.
+
+    Oracle IDs never change for a printing and are kept across tag store versions;
+    tag IDs are only valid for the tag store version they were read from and are
+    dropped when the version changes. The number of printings is bounded by
+    Scryfall's card pool, so the cache is not evicted.
+
+    :param path: The file the cache is persisted to.
+    """
+
+    def __init__(self, path: str = CARD_CACHE_PATH):
+        self.path = path
+        self.oracle_ids: Dict[str, str] = {}
+        self.tag_ids: Dict[str, Tuple[int, ...]] = {}
+        self.tags_version = None
+        self.stats = {"oracle_hits": 0, "oracle_misses": 0, "tag_hits": 0, "tag_misses": 0}
+        self.dirty = False
+        self.lock = threading.Lock()
+        # Schnappschuss, Schreiben und Umbenennen unter einer Sperre, sonst kann ein älterer Stand zuletzt umbenannt werden
+        self.save_lock = threading.Lock()
+
+    def load(self):
+        """Reads the persisted cache if it exists."""
+        try:
+            with open(self.path, "rb") as f:
+                content = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        with self.lock:
+            self.oracle_ids.update(content.get("oracle_ids", {}))
+            if self.tags_version in (None, content.get("tags_version")):
+                self.tags_version = content.get("tags_version")
+                self.tag_ids.update(content.get("tag_ids", {}))
+
+    def save(self):
+        """Writes the cache atomically if it changed since the last save."""
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                content = {"oracle_ids": dict(self.oracle_ids), "tag_ids": dict(self.tag_ids),
+                           "tags_version": self.tags_version}
+                self.dirty = False
+            folder = os.path.dirname(self.path) or "."
+            os.makedirs(folder, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".card_cache_", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                # Der Stand ist nicht gespeichert, beim nächsten Aufruf erneut versuchen
+                with self.lock:
+                    self.dirty = True
+                raise
+
+    def get_oracle_ids(self, scryfall_ids: List[str]) -> Dict[str, str]:
+        """
+        :param scryfall_ids: The printings to look up.
+        :return: The cached Oracle IDs of those printings that are known.
+        """
+        found = {}
+        with self.lock:
+            for scryfall_id in scryfall_ids:
+                oracle_id = self.oracle_ids.get(scryfall_id)
+                if oracle_id is not None:
+                    found[scryfall_id] = oracle_id
+            self.stats["oracle_hits"] += len(found)
+            self.stats["oracle_misses"] += len(scryfall_ids) - len(found)
+        metrics.inc("cache_hits", len(found), cache="card_oracle_ids")
+        metrics.inc("cache_misses", len(scryfall_ids) - len(found), cache="card_oracle_ids")
+        return found
+
+    def put_oracle_ids(self, oracle_ids: Dict[str, str]):
+        """Stores resolved Oracle IDs, keyed by Scryfall ID."""
+        with self.lock:
+            for scryfall_id, oracle_id in oracle_ids.items():
+                if self.oracle_ids.get(scryfall_id) != oracle_id:
+                    self.oracle_ids[scryfall_id] = oracle_id
+                    self.dirty = True
+
+    def _check_version(self, tags_version: str):
+        # Tag IDs aus einer anderen Store-Version sind ungültig
+        if self.tags_version != tags_version:
+            self.tag_ids.clear()
+            self.tags_version = tags_version
+            self.dirty = True
+
+    def get_tag_ids(self, scryfall_id: str, tags_version: str):
+        """
+        :param scryfall_id: The printing to look up.
+        :param tags_version: The version of the tag store the caller works with.
+        :return: The cached tag IDs or None on a miss.
+        """
+        with self.lock:
+            self._check_version(tags_version)
+            tag_ids = self.tag_ids.get(scryfall_id)
+            self.stats["tag_hits" if tag_ids is not None else "tag_misses"] += 1
+        metrics.inc("cache_hits" if tag_ids is not None else "cache_misses", cache="card_tag_ids")
+        return tag_ids
+
+    def put_tag_ids(self, scryfall_id: str, tag_ids, tags_version: str):
+        """Stores the interned tag IDs of a printing for the given tag store version."""
+        with self.lock:
+            self._check_version(tags_version)
+            self.tag_ids[scryfall_id] = tuple(tag_ids)
+            self.dirty = True
+
+    def migrate_tag_ids(self, old_version: str, new_version: str, id_map: Dict[int, int], changed_oracle_ids):
+        """
+        Carries the cached tag IDs over to a new tag store version instead of dropping them.
+
+        Printings of changed cards are dropped; the tag IDs of all others are translated
+        into the IDs of the new version.
+
+        :param old_version: The tag store version the cached tag IDs belong to.
+        :param new_version: The new tag store version.
+        :param id_map: Old tag ID -> new tag ID for every label that still exists.
+        :param changed_oracle_ids: Oracle IDs whose tags were added, removed or changed.
+        """
+        changed_oracle_ids = set(changed_oracle_ids)
+        with self.lock:
+            if self.tags_version != old_version:
+                self._check_version(new_version)
+                return
+            migrated = {}
+            for scryfall_id, tag_ids in self.tag_ids.items():
+                oracle_id = self.oracle_ids.get(scryfall_id)
+                if oracle_id is None or oracle_id in changed_oracle_ids:
+                    continue
+                if all(tag_id in id_map for tag_id in tag_ids):
+                    migrated[scryfall_id] = tuple(id_map[tag_id] for tag_id in tag_ids)
+            self.tag_ids = migrated
+            self.tags_version = new_version
+            self.dirty = True
+
+    def hit_rates(self) -> dict:
+        """
+        :return: The raw counters plus the hit rates for Oracle ID and tag lookups.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        for kind in ("oracle", "tag"):
+            total = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = stats[f"{kind}_hits"] / total if total else 0.0
+        stats["printings"] = len(self.oracle_ids)
+        return stats
+
+
+_card_cache = None
+_card_cache_lock = threading.Lock()
+
+
+def get_card_cache() -> CardCache:
+    """
+    Returns the process-wide card cache, loading the persisted state on first use.
+
+    :return: The shared CardCache.
+    """
+    global _card_cache
+    if _card_cache is None:
+        with _card_cache_lock:
+            if _card_cache is None:
+                card_cache = CardCache()
+                card_cache.load()
+                _card_cache = card_cache
+    return _card_cache
@@ -0,0 +1,232 @@
+import csv
+import re
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List
+
+from functions.general_funs import (FINISH_MARKERS, add_oracle_ids, add_tags_to_deck, fetch_collection_cards,
+                                    format_deck_line)
+from functions.tag_tree_index import get_tag_tree_index
+
+
+# Spaltennamen der gängigen Sammlungs-Exporte (Moxfield, ManaBox, Deckbox, ...)
+CSV_COLUMNS = {
+    "quantity": ("count", "quantity", "qty"),
+    "name": ("name", "card name"),
+    "set": ("edition", "set", "set code"),
+    "cn": ("collector number", "card number", "collector_number", "cn"),
+    "scryfall_id": ("scryfall id", "scryfall_id"),
+}
+COLLECTION_BATCH_SIZE = 500
+LOOKUP_CACHE_SIZE = 20000  # Aufgelöste Identifier, die zwischen den Batches behalten werden
+
+# z.B. "1 Sol Ring (C21) 263", "1 Sol Ring (C21) 263 *F*" oder "2x Lightning Bolt"; Markierungen wie *F*, *E*
+# oder *CMDR* am Ende gehören nicht zum Namen
+TEXT_LINE_PATTERN = re.compile(
+    r"^\s*(\d+)x?\s+(.+?)(?:\s+\(([A-Za-z0-9]+)\)(?:\s+([^\s*]\S*))?)?((?:\s+\*[A-Za-z]+\*)*)\s*$")
+MARKER_PATTERN = re.compile(r"\*([A-Za-z]+)\*")
+FINISHES = {marker: finish for finish, marker in FINISH_MARKERS.items()}
+SET_CODE_PATTERN = re.compile(r"^[A-Za-z0-9]{2,6}$")
+
+
+def _read_csv_rows(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    reader = csv.DictReader(lines)
+    columns = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for column in reader.fieldnames or []:
+            if column.strip().lower() in aliases:
+                columns[field] = column
+                break
+
+    for row in reader:
+        card_data = {}
+        for field, column in columns.items():
+            value = (row.get(column) or "").strip()
+            if value:
+                card_data[field] = value
+        if "name" not in card_data and "scryfall_id" not in card_data:
+            continue
+        card_data["quantity"] = int(card_data["quantity"]) if card_data.get("quantity", "").isdigit() else 1
+        # Volle Set-Namen (z.B. bei Deckbox) sind keine Set-Codes
+        if "set" in card_data and not SET_CODE_PATTERN.match(card_data["set"]):
+            del card_data["set"]
+        yield card_data
+
+
+def _read_text_rows(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith(("#", "//")):
+            continue
+        match = TEXT_LINE_PATTERN.match(line.rstrip("\n"))
+        if match:
+            quantity, name, set_code, cn, markers = match.groups()
+            card_data = {"quantity": int(quantity), "name": name}
+        else:
+            set_code = cn = markers = None
+            card_data = {"quantity": 1, "name": line.strip()}
+        if set_code:
+            card_data["set"] = set_code
+        if cn:
+            card_data["cn"] = cn
+        for marker in MARKER_PATTERN.findall(markers or ""):
+            if marker.upper() in FINISHES:
+                card_data["finish"] = FINISHES[marker.upper()]
+        yield card_data
+
+
+def read_collection_rows(file_obj, file_format: str = None) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily reads the entries of a collection export.
+
+    CSV exports are recognised by their header (Count/Quantity, Name, Edition/Set,
+    Collector Number, Scryfall ID), text lists by lines like "1 Sol Ring (C21) 263".
+
+    :param file_obj: A text file object.
+    :param file_format: "csv" or "text"; detected from the first line if omitted.
+    :return: A generator over card dictionaries with 'quantity', 'name' and, if known,
+             'set', 'cn', 'scryfall_id' and 'finish' ("foil" or "etched").
+    """
+    first_line = file_obj.readline()
+    if file_format is None:
+        header = [column.strip().strip('"').lower() for column in first_line.split(",")]
+        file_format = "csv" if "name" in header or "scryfall id" in header else "text"
+
+    lines = _chain_first(first_line, file_obj)
+    if file_format == "csv":
+        return _read_csv_rows(lines)
+    return _read_text_rows(lines)
+
+
+def _chain_first(first_line: str, file_obj) -> Iterator[str]:
+    if first_line:
+        yield first_line
+    yield from file_obj
+
+
+def _identifier(card_data: Dict[str, Any]) -> dict:
+    """Builds the most specific Scryfall identifier available for a collection entry."""
+    if card_data.get("set") and card_data.get("cn"):
+        return {"set": card_data["set"].lower(), "collector_number": card_data["cn"]}
+    if card_data.get("set"):
+        return {"name": card_data["name"], "set": card_data["set"].lower()}
+    return {"name": card_data["name"]}
+
+
+def _identifier_key(identifier: dict) -> tuple:
+    if "collector_number" in identifier:
+        return ("set_cn", identifier["set"], identifier["collector_number"].lower())
+    if "set" in identifier:
+        return ("name_set", identifier["name"].lower(), identifier["set"])
+    return ("name", identifier["name"].lower())
+
+
+def _card_keys(card: Dict[str, Any]) -> List[tuple]:
+    """All identifier keys under which a returned Scryfall card may have been requested."""
+    set_code = card.get("set", "").lower()
+    names = [card.get("name", "")] + [face.get("name", "") for face in card.get("card_faces", [])]
+    keys = [("set_cn", set_code, card.get("collector_number", "").lower())]
+    for name in filter(None, names):
+        keys.append(("name_set", name.lower(), set_code))
+        keys.append(("name", name.lower()))
+    return keys
+
+
+def resolve_collection_batch(batch: List[Dict[str, Any]], lookup_cache: dict = None,
+                             transport=None) -> List[Dict[str, Any]]:
+    """
+    Adds 'scryfall_id', 'oracle_id' and 'tags' to a batch of collection entries.
+
+    Entries with a Scryfall ID go through add_oracle_ids (card cache, local index,
+    Scryfall). The others are resolved by set/collector number or name via the
+    collection endpoint, deduplicated within the batch and remembered in lookup_cache;
+    entries without set or collector number get those of the resolved printing.
+
+    :param batch: The collection entries, modified in place.
+    :param lookup_cache: Dictionary identifier key -> (scryfall_id, set, collector_number), shared
+                         between batches. Keys used by the batch are moved to the end, so the
+                         caller can drop the least recently used ones from the front.
+    :param transport: Optional transport for the Scryfall requests.
+    :return: The batch.
+    """
+    lookup_cache = {} if lookup_cache is None else lookup_cache
+
+    missing = {}
+    for card_data in batch:
+        if "scryfall_id" in card_data or "name" not in card_data:
+            continue
+        identifier = _identifier(card_data)
+        key = _identifier_key(identifier)
+        if key in lookup_cache:
+            lookup_cache[key] = lookup_cache.pop(key)
+        else:
+            missing[key] = identifier
+
+    if missing:
+        for card in fetch_collection_cards(missing.values(), transport=transport):
+            for key in _card_keys(card):
+                if key in missing and key not in lookup_cache and card.get("id"):
+                    lookup_cache[key] = (card["id"], card.get("set"), card.get("collector_number"))
+
+    for card_data in batch:
+        if "scryfall_id" not in card_data and "name" in card_data:
+            printing = lookup_cache.get(_identifier_key(_identifier(card_data)))
+            if printing:
+                scryfall_id, set_code, collector_number = printing
+                card_data["scryfall_id"] = scryfall_id
+                if set_code and not card_data.get("set"):
+                    card_data["set"] = set_code
+                if collector_number and not card_data.get("cn"):
+                    card_data["cn"] = collector_number
+
+    deck_data = {str(position): card_data for position, card_data in enumerate(batch)}
+    # Kein Fortschrittsbalken pro Batch, der Aufrufer zeigt den Gesamtfortschritt
+    add_oracle_ids(deck_data, transport=transport, progress=False)
+    add_tags_to_deck(deck_data)
+    return batch
+
+
+def tag_collection(rows: Iterable[Dict[str, Any]], output, selected_tags: List[str], tag_tree: dict,
+                   batch_size: int = COLLECTION_BATCH_SIZE, transport=None, progress=None) -> dict:
+    """
+    Streams a collection through the tagging pipeline and writes one tagged line per entry.
+
+    Only one batch of entries is held in memory at a time; lines are written in input
+    order as soon as their batch is resolved. Resolved identifiers are shared between
+    batches, at most the LOOKUP_CACHE_SIZE most recently used ones.
+
+    :param rows: The collection entries, e.g. from read_collection_rows.
+    :param output: A text file object the tagged lines are written to.
+    :param selected_tags: The selected tags.
+    :param tag_tree: The nested tag tree.
+    :param batch_size: Number of entries resolved together.
+    :param transport: Optional transport for the Scryfall requests.
+    :param progress: Optional callable receiving the running statistics after each batch.
+    :return: Statistics with the number of cards, resolved cards, seconds and cards per second.
+    """
+    index = get_tag_tree_index(tag_tree)
+    lookup_cache = {}
+    stats = {"cards": 0, "resolved": 0, "seconds": 0.0, "cards_per_second": 0.0}
+    start = time.perf_counter()
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        resolve_collection_batch(batch, lookup_cache=lookup_cache, transport=transport)
+        for key in list(islice(lookup_cache, max(0, len(lookup_cache) - LOOKUP_CACHE_SIZE))):
+            del lookup_cache[key]
+
+        output.write("".join([
+            format_deck_line(card_data, index.matching_tags(selected_tags, card_data.get("tags", []))) + "\n"
+            for card_data in batch
+        ]))
+
+        stats["cards"] += len(batch)
+        stats["resolved"] += sum(1 for card_data in batch if "oracle_id" in card_data)
+        stats["seconds"] = time.perf_counter() - start
+        stats["cards_per_second"] = stats["cards"] / stats["seconds"] if stats["seconds"] else 0.0
+        if progress is not None:
+            progress(dict(stats))
+
+    return stats
@@ -0,0 +1,77 @@
+from typing import Dict, Iterable, List
+
+from functions import metrics
+from functions.general_funs import format_deck_line
+from functions.tag_tree_index import get_tag_tree_index
+
+
+class DeckRenderModel:
+    """
+    Precomputed rendering state of a deck for fast regeneration of the deck string.
+
+    For every card the sorted position, the static line prefix and the ancestor-closed
+    set of tags it matches (its own tags plus all their ancestors in the tag tree) are
+    computed once. A selected tag applies to a card exactly if it is in that set, so a
+    change of the selection only touches the cards that carry one of the added or
+    removed tags; all other lines are reused.
+
+    :param deck_data: The processed deck dictionary with tags for each card.
+    :param tag_tree: The nested tag tree.
+    """
+
+    def __init__(self, deck_data: Dict[str, dict], tag_tree: dict):
+        index = get_tag_tree_index(tag_tree)
+        sorted_cards = sorted(deck_data.values(), key=lambda card_data: card_data.get('name', '').lower())
+
+        self.prefixes: List[str] = []
+        self.closures: List[frozenset] = []
+        self.cards_by_tag: Dict[str, List[int]] = {}
+        for position, card_data in enumerate(sorted_cards):
+            card_tags = card_data.get('tags', [])
+            closure = frozenset(card_tags).union(index.tags_of(index.ancestor_closure(card_tags)))
+            self.prefixes.append(format_deck_line(card_data, []))
+            self.closures.append(closure)
+            for tag in closure:
+                self.cards_by_tag.setdefault(tag, []).append(position)
+
+        self.selected_tags: List[str] = []
+        self.lines: List[str] = list(self.prefixes)
+        self.deck_string = None
+
+    def __len__(self) -> int:
+        return len(self.prefixes)
+
+    def _render_line(self, position: int) -> str:
+        closure = self.closures[position]
+        return self.prefixes[position] + " ".join([f"#{tag}" for tag in self.selected_tags if tag in closure])
+
+    @metrics.timed("stage", stage="render_deck_string")
+    def render(self, selected_tags: Iterable[str]) -> str:
+        """
+        Renders the deck string for a tag selection, reusing the lines of the previous selection.
+
+        :param selected_tags: The selected tags; their order is the order of the hashtags.
+        :return: The deck string, one line per card sorted by name, each ending with a newline.
+        """
+        selected_tags = list(dict.fromkeys(selected_tags))
+        if selected_tags == self.selected_tags and self.deck_string is not None:
+            return self.deck_string
+
+        previous = self.selected_tags
+        changed_tags = set(previous).symmetric_difference(selected_tags)
+        kept_tags = [tag for tag in selected_tags if tag not in changed_tags]
+        self.selected_tags = selected_tags
+
+        if kept_tags != [tag for tag in previous if tag not in changed_tags]:
+            # Reihenfolge der beibehaltenen Tags geändert: alle Zeilen neu aufbauen
+            affected = range(len(self.prefixes))
+        else:
+            affected = set()
+            for tag in changed_tags:
+                affected.update(self.cards_by_tag.get(tag, ()))
+
+        for position in affected:
+            self.lines[position] = self._render_line(position)
+
+        self.deck_string = "".join([line + "\n" for line in self.lines])
+        return self.deck_string
@@ -1,11 +1,13 @@
-import requests
 from typing import Dict, Any
-from tqdm import tqdm
-import time
-import pickle
 import os
 import re
-from collections import defaultdict
+import json
+import mmap
+import uuid
+from functions import http_client, metrics
+from functions.card_cache import get_card_cache
+from functions.tag_store import get_tag_store
+from functions.tag_tree_index import get_tag_tree_index
 
 
 # Header für alle API requests
@@ -14,30 +16,156 @@ header = {
     "Accept": 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
 }
 
+# Scryfall erlaubt maximal 75 Identifier pro /cards/collection Abfrage
+SCRYFALL_COLLECTION_ENDPOINT = 'https://api.scryfall.com/cards/collection'
+SCRYFALL_COLLECTION_BATCH_SIZE = 75
 
-# Globale Variable für das Rate-Limit
-SCRYFALL_RATE_LIMIT = 10  # Maximal 10 Abfragen pro Sekunde
-SLEEP_TIME = 1 / SCRYFALL_RATE_LIMIT  # Berechnet die Zeit, die wir zwischen den Anfragen warten müssen
+# Lokaler Index Scryfall ID -> Oracle ID, sortierte 16-Byte UUID Paare
+ORACLE_ID_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ressources', 'oracle_id_index.bin')
+ORACLE_ID_INDEX_RECORD_SIZE = 32
+
+_oracle_id_index = None
 
 
 def get_card_tags_dict():
-    url = "https://api.scryfall.com/private/tags/oracle?pretty=true"
-    output_path = "../ressources/card_tags_dict.pkl"
-    response = requests.get(url)
-    data = response.json()
+    """
+    Downloads the current card tags from Scryfall and updates card_tags_dict.pkl, the tag
+    store and the cached decks incrementally, see functions.tag_refresh.refresh_card_tags.
 
-    flipped_mapping = defaultdict(list)
+    :return: The summary of the refresh.
+    """
+    # Erst hier importiert, tag_refresh hängt selbst von diesem Modul ab
+    from functions.tag_refresh import refresh_card_tags
+    return refresh_card_tags()
 
-    for entry in data["data"]:
-        label = entry["label"]
-        for oracle_id in entry["oracle_ids"]:
-            flipped_mapping[oracle_id].append(label)
 
-    flipped_mapping = dict(flipped_mapping)
+def _iter_json_array(fp, key: str = None, chunk_size: int = 1 << 16):
+    """
+    Lazily yields the elements of a JSON array from a text file object.
+    
+    Only the current element is decoded at a time, so files far larger than memory
+    can be processed. The elements are expected to be objects or arrays.
+    
+    :param fp: A file-like object opened in text mode.
+    :param key: If given, the array stored under this key of the top-level object is read.
+    :param chunk_size: Number of characters read per chunk.
+    :return: A generator over the decoded array elements.
+    """
+    decoder = json.JSONDecoder()
+    marker = f'"{key}"' if key else None
+    buffer = ""
+
+    # Springe bis zum Beginn des Arrays
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        if marker:
+            idx = buffer.find(marker)
+            if idx < 0:
+                buffer = buffer[-len(marker):]
+                continue
+            buffer = buffer[idx + len(marker):]
+            marker = None
+        idx = buffer.find("[")
+        if idx >= 0:
+            buffer = buffer[idx + 1:]
+            break
+        buffer = ""
+
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                raise
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+
+
+def build_oracle_id_index(bulk_path: str, output_path: str = ORACLE_ID_INDEX_PATH) -> int:
+    """
+    Builds the local Scryfall ID -> Oracle ID index from a Scryfall "Default Cards" bulk file.
+    
+    The bulk file is streamed card by card. The index is a flat binary file of sorted
+    32 byte records (16 byte Scryfall UUID followed by 16 byte Oracle UUID). To download
+    the bulk file and build the index, run `python -m functions.oracle_id_index`.
+    
+    :param bulk_path: Path to the downloaded bulk JSON file.
+    :param output_path: Where the index is written to.
+    :return: The number of printings in the index.
+    """
+    records = []
+    with open(bulk_path, "r", encoding="utf-8") as f:
+        for card in _iter_json_array(f):
+            oracle_id = _card_oracle_id(card)
+            if card.get("id") and oracle_id:
+                records.append(uuid.UUID(card["id"]).bytes + uuid.UUID(oracle_id).bytes)
+
+    records.sort()
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(records))
+    os.replace(tmp_path, output_path)
 
-    with open(output_path, "wb") as f:
-        pickle.dump(flipped_mapping, f)
+    global _oracle_id_index
+    _oracle_id_index = None
 
+    return len(records)
+
+
+def _load_oracle_id_index():
+    """
+    Memory-maps the local oracle ID index once per process.
+    
+    :return: The mapped index, or None if no (non-empty) index has been built.
+    """
+    global _oracle_id_index
+    if _oracle_id_index is None:
+        if not os.path.exists(ORACLE_ID_INDEX_PATH) or os.path.getsize(ORACLE_ID_INDEX_PATH) == 0:
+            return None
+        with open(ORACLE_ID_INDEX_PATH, "rb") as f:
+            _oracle_id_index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _oracle_id_index
+
+
+def lookup_oracle_id(scryfall_id: str) -> str:
+    """
+    Looks up the Oracle ID of a printing in the local index via binary search.
+    
+    :param scryfall_id: The Scryfall ID of the card.
+    :return: The Oracle ID or None if the printing is not in the index.
+    """
+    index = _load_oracle_id_index()
+    if index is None:
+        return None
+    try:
+        key = uuid.UUID(scryfall_id).bytes
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+    lo, hi = 0, len(index) // ORACLE_ID_INDEX_RECORD_SIZE
+    while lo < hi:
+        mid = (lo + hi) // 2
+        offset = mid * ORACLE_ID_INDEX_RECORD_SIZE
+        mid_key = index[offset:offset + 16]
+        if mid_key < key:
+            lo = mid + 1
+        elif mid_key > key:
+            hi = mid
+        else:
+            return str(uuid.UUID(bytes=index[offset + 16:offset + ORACLE_ID_INDEX_RECORD_SIZE]))
+    return None
 
 
 def fetch_oracle_id(scryfall_id: str) -> str:
@@ -49,19 +177,122 @@ def fetch_oracle_id(scryfall_id: str) -> str:
     """
     scryfall_api_endpoint = 'https://api.scryfall.com/cards/'
     try:
-        response = requests.get(scryfall_api_endpoint + scryfall_id, headers=header)
+        response = http_client.get(scryfall_api_endpoint + scryfall_id, headers=header)
         response.raise_for_status()
         response_json = response.json()
-        
-        # Delay the next request to respect rate limit
-        time.sleep(SLEEP_TIME)
-        
         return response_json["oracle_id"]
-    except requests.RequestException as e:
+    except http_client.RequestException as e:
         print(f"Error fetching Oracle ID for Scryfall ID {scryfall_id}: {e}")
         return None
 
 
+def _post_json(url: str, payload: dict) -> dict:
+    """
+    Default transport for Scryfall POST requests.
+    
+    :param url: The endpoint to post to.
+    :param payload: The JSON body of the request.
+    :return: The decoded JSON response.
+    :raises: requests.RequestException if the request fails.
+    """
+    response = http_client.post(url, json=payload, headers=header)
+    response.raise_for_status()
+    return response.json()
+
+
+def _card_oracle_id(card: Dict[str, Any]) -> str:
+    """
+    Reads the Oracle ID from a Scryfall card object.
+    
+    Reversible cards carry their Oracle ID on the faces instead of the card itself.
+    
+    :param card: A Scryfall card object.
+    :return: The Oracle ID or None if the card has none.
+    """
+    if card.get("oracle_id"):
+        return card["oracle_id"]
+    for face in card.get("card_faces", []):
+        if face.get("oracle_id"):
+            return face["oracle_id"]
+    return None
+
+
+def fetch_collection_cards(identifiers, transport=None):
+    """
+    Looks up cards via Scryfall's collection endpoint in batches of up to 75 identifiers.
+    
+    Identifiers are Scryfall card identifiers such as {"id": ...}, {"set": ..., "collector_number": ...}
+    or {"name": ...}. Identifiers that Scryfall does not know and batches that fail are skipped.
+    
+    :param identifiers: An iterable of identifier dictionaries.
+    :param transport: Callable (url, payload) -> response JSON; defaults to a POST via requests.
+    :return: A generator over the found card objects.
+    """
+    transport = transport or _post_json
+    identifiers = list(identifiers)
+
+    for start in range(0, len(identifiers), SCRYFALL_COLLECTION_BATCH_SIZE):
+        batch = identifiers[start:start + SCRYFALL_COLLECTION_BATCH_SIZE]
+        try:
+            response_json = transport(SCRYFALL_COLLECTION_ENDPOINT, {"identifiers": batch})
+        except http_client.RequestException as e:
+            print(f"Error fetching {len(batch)} cards from Scryfall: {e}")
+            continue
+
+        yield from response_json.get("data", [])
+
+        not_found = response_json.get("not_found", [])
+        if not_found:
+            print(f"Scryfall could not find {len(not_found)} identifiers: {not_found}")
+
+
+@metrics.timed("stage", stage="fetch_oracle_ids")
+def fetch_oracle_ids(scryfall_ids, transport=None) -> Dict[str, str]:
+    """
+    Retrieves the Oracle IDs for many cards at once via Scryfall's collection endpoint.
+    
+    The IDs are sent in batches of up to 75 identifiers per request. Identifiers that
+    Scryfall does not know and batches that fail are skipped, so the result may be partial.
+    
+    :param scryfall_ids: An iterable of Scryfall IDs.
+    :param transport: Callable (url, payload) -> response JSON; defaults to a POST via requests.
+    :return: A dictionary mapping each resolved Scryfall ID to its Oracle ID.
+    """
+    identifiers = [{"id": scryfall_id} for scryfall_id in dict.fromkeys(scryfall_ids)]
+    oracle_ids = {}
+
+    for card in fetch_collection_cards(identifiers, transport=transport):
+        oracle_id = _card_oracle_id(card)
+        if card.get("id") and oracle_id:
+            oracle_ids[card["id"]] = oracle_id
+
+    return oracle_ids
+
+
+def parse_deck_id(deck_id_or_url: str) -> str:
+    """
+    Normalises a Moxfield deck ID or URL to the bare deck ID.
+    
+    Surrounding whitespace, trailing slashes, query strings and fragments are ignored.
+    
+    :param deck_id_or_url: The deck ID or full URL of the deck.
+    :return: The deck ID.
+    :raises: ValueError if no valid deck ID can be found.
+    """
+    value = deck_id_or_url.strip()
+    if "moxfield.com" in value:
+        match = re.search(r"decks/([a-zA-Z0-9_-]+)", value)
+        if match:
+            return match.group(1)
+        raise ValueError("The URL does not contain a valid deck ID.")
+
+    match = re.fullmatch(r"/*([a-zA-Z0-9_-]+)/*(?:[?#].*)?", value)
+    if match:
+        return match.group(1)
+    raise ValueError(f"'{deck_id_or_url}' is not a valid deck ID.")
+
+
+@metrics.timed("stage", stage="get_decklist")
 def get_decklist(deck_id_or_url: str) -> dict:
     """
     Fetches the decklist from the Moxfield API.
@@ -70,22 +301,15 @@ def get_decklist(deck_id_or_url: str) -> dict:
     :return: The decklist as a JSON object.
     :raises: Exception if the request fails or the response is invalid.
     """
-    if "moxfield.com" in deck_id_or_url:
-        match = re.search(r"decks/([a-zA-Z0-9_-]+)", deck_id_or_url)
-        if match:
-            deck_id = match.group(1)
-        else:
-            raise ValueError("The URL does not contain a valid deck ID.")
-    else:
-        deck_id = deck_id_or_url
+    deck_id = parse_deck_id(deck_id_or_url)
 
     mx_api_endpoint = 'https://api2.moxfield.com/v3/decks/all/'
 
     try:
-        response = requests.get(mx_api_endpoint + deck_id, headers=header)
+        response = http_client.get(mx_api_endpoint + deck_id, headers=header)
         response.raise_for_status()  # Check if request was successful
         return response.json()  # Return deck data as JSON
-    except requests.RequestException as e:
+    except http_client.RequestException as e:
         print(f"Error with Moxfield API request: {e}")
         raise
 
@@ -146,52 +370,186 @@ def extract_card_data(flat_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
     return card_entries
 
 
-def add_oracle_ids(deck_data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+# Felder, die pro Karte aus der Moxfield Antwort übernommen werden
+CARD_FIELDS = ("name", "set", "cn", "scryfall_id")
+# Markierungen der Ausführung hinter der Sammlernummer, z.B. "1 Sol Ring (C21) 263 *F*"
+FINISH_MARKERS = {"foil": "F", "etched": "E"}
+DEFAULT_BOARDS = ("mainboard",)
+
+
+def extract_deck_cards(deck_data: Dict[str, Any], boards=DEFAULT_BOARDS) -> Dict[str, Dict[str, Any]]:
     """
-    Adds Oracle IDs to each card entry in the deck data based on their Scryfall ID.
+    Extracts the card entries of the given boards directly from the Moxfield deck JSON.
     
-    :param deck_data: The deck dictionary containing card data.
-    :return: The updated deck dictionary with Oracle ID added for each card.
+    Only boards.<board>.cards is visited and only the needed fields are copied, all
+    other card metadata is left untouched.
+    
+    :param deck_data: The deck as returned by get_decklist.
+    :param boards: The boards to extract, e.g. ("commanders", "mainboard", "sideboard", "maybeboard").
+    :return: A dictionary where card keys are at the top level, each containing 'quantity',
+             'name', 'set', 'cn', 'scryfall_id' and the 'board' it belongs to.
     """
-    for card_key, card_data in tqdm(deck_data.items(), desc="Adding Oracle IDs", unit="card"):
-        if "scryfall_id" in card_data:
-            oracle_id = fetch_oracle_id(card_data["scryfall_id"])
-            if oracle_id:
-                card_data["oracle_id"] = oracle_id
+    card_entries = {}
+    all_boards = deck_data.get("boards", {})
+
+    for board in boards:
+        cards = (all_boards.get(board) or {}).get("cards") or {}
+        for card_key, entry in cards.items():
+            card = entry.get("card") or {}
+            card_data = {}
+            if "quantity" in entry:
+                card_data["quantity"] = entry["quantity"]
+            for field in CARD_FIELDS:
+                if field in card:
+                    card_data[field] = card[field]
+            card_data["board"] = board
+
+            # Gleiche Kartenschlüssel in verschiedenen Boards nicht überschreiben
+            if card_key in card_entries:
+                card_key = f"{board}:{card_key}"
+            card_entries[card_key] = card_data
 
-    return deck_data
+    return card_entries
 
 
-def _load_card_tags(file_path: str) -> dict:
+@metrics.timed("stage", stage="add_oracle_ids")
+def add_oracle_ids(deck_data: Dict[str, Dict[str, Any]], transport=None, progress: bool = True
+                   ) -> Dict[str, Dict[str, Any]]:
     """
-    Loads the card tags from a pickle file.
+    Adds Oracle IDs to each card entry in the deck data based on their Scryfall ID.
+    
+    Printings are looked up in the shared card cache first, then in the local
+    index; only the rest is requested from Scryfall. Newly resolved printings
+    are added to the card cache.
     
-    :param file_path: The path to the pickle file.
-    :return: The loaded card tags dictionary.
+    :param deck_data: The deck dictionary containing card data.
+    :param transport: Optional transport passed on to fetch_oracle_ids.
+    :param progress: Whether a progress bar is shown.
+    :return: The updated deck dictionary with Oracle ID added for each card.
     """
-    with open(file_path, 'rb') as f:
-        return pickle.load(f)
+    card_cache = get_card_cache()
+    scryfall_ids = list(dict.fromkeys(
+        card_data["scryfall_id"] for card_data in deck_data.values() if "scryfall_id" in card_data
+    ))
+    oracle_ids = card_cache.get_oracle_ids(scryfall_ids)
+
+    resolved_ids = {}
+    missing_ids = []
+    for scryfall_id in scryfall_ids:
+        if scryfall_id in oracle_ids:
+            continue
+        oracle_id = lookup_oracle_id(scryfall_id)
+        if oracle_id:
+            resolved_ids[scryfall_id] = oracle_id
+        else:
+            missing_ids.append(scryfall_id)
+
+    metrics.inc("oracle_id_lookups", len(oracle_ids), source="card_cache")
+    metrics.inc("oracle_id_lookups", len(resolved_ids), source="local_index")
+    metrics.inc("oracle_id_lookups", len(missing_ids), source="scryfall")
+
+    if missing_ids:
+        resolved_ids.update(fetch_oracle_ids(missing_ids, transport=transport))
+    card_cache.put_oracle_ids(resolved_ids)
+    oracle_ids.update(resolved_ids)
+
+    from tqdm import tqdm  # nur für den Fortschrittsbalken, nicht beim Import laden
+
+    for card_key, card_data in tqdm(deck_data.items(), desc="Adding Oracle IDs", unit="card", disable=not progress):
+        oracle_id = oracle_ids.get(card_data.get("scryfall_id"))
+        if oracle_id:
+            card_data["oracle_id"] = oracle_id
+
+    return deck_data
 
 
+@metrics.timed("stage", stage="add_tags_to_deck")
 def add_tags_to_deck(deck_data: dict) -> dict:
     """
-    Adds tags to each card in the deck from the card tags dictionary.
+    Adds tags to each card in the deck from the shared card cache or the card tag store.
     
     :param deck_data: The deck dictionary with card data.
     :return: The updated deck dictionary with tags for each card.
     """
-    card_tags_dict_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ressources', 'card_tags_dict.pkl')
-    card_tags_dict = _load_card_tags(card_tags_dict_path)
+    tag_store = get_tag_store()
+    card_cache = get_card_cache()
 
     for card_key, card_data in deck_data.items():
         oracle_id = card_data.get("oracle_id")
-        if oracle_id:
-            tags = card_tags_dict.get(oracle_id, [])
-            card_data["tags"] = tags
+        if not oracle_id:
+            continue
+        scryfall_id = card_data.get("scryfall_id")
+        tag_ids = card_cache.get_tag_ids(scryfall_id, tag_store.version) if scryfall_id else None
+        if tag_ids is None:
+            tag_ids = tag_store.get_tag_ids(oracle_id)
+            if scryfall_id:
+                card_cache.put_tag_ids(scryfall_id, tag_ids, tag_store.version)
+                # Für die Übernahme der Tag IDs bei einer Aktualisierung der Tags (tag_refresh)
+                card_cache.put_oracle_ids({scryfall_id: oracle_id})
+        card_data["tags"] = tag_store.labels(tag_ids)
 
     return deck_data
 
 
+def prepare_deck_cards(deck_data: Dict[str, Any], previous: Dict[str, Dict[str, Any]] = None, boards=DEFAULT_BOARDS,
+                       reuse_tags: bool = True):
+    """
+    Extracts the cards of a Moxfield deck and copies Oracle IDs and tags from a previous version.
+
+    :param deck_data: The deck as returned by get_decklist.
+    :param previous: The previously processed deck, if any.
+    :param boards: The boards to extract.
+    :param reuse_tags: Whether the tags of the previous version are still current.
+    :return: (deck_dict, changed): the deck dictionary and the subset of its cards that still
+             need Oracle IDs (if missing) and tags.
+    """
+    deck_dict = extract_deck_cards(deck_data, boards)
+    previous = previous or {}
+    previous_by_printing = {
+        card_data["scryfall_id"]: card_data for card_data in previous.values() if "scryfall_id" in card_data
+    }
+
+    changed = {}
+    for card_key, card_data in deck_dict.items():
+        previous_card = previous.get(card_key)
+        if previous_card is None or previous_card.get("scryfall_id") != card_data.get("scryfall_id"):
+            previous_card = previous_by_printing.get(card_data.get("scryfall_id"))
+
+        if previous_card is not None and "oracle_id" in previous_card:
+            card_data["oracle_id"] = previous_card["oracle_id"]
+            if reuse_tags and "tags" in previous_card:
+                card_data["tags"] = previous_card["tags"]
+                continue
+        changed[card_key] = card_data
+    return deck_dict, changed
+
+
+@metrics.timed("stage", stage="process_deck")
+def process_deck(deck_data: Dict[str, Any], previous: Dict[str, Dict[str, Any]] = None, boards=DEFAULT_BOARDS,
+                 reuse_tags: bool = True, transport=None) -> Dict[str, Dict[str, Any]]:
+    """
+    Turns a Moxfield deck into the processed deck dictionary with Oracle IDs and tags.
+    
+    If a previously processed version of the deck is given, only cards whose printing
+    is new or changed are resolved; everything else is copied from the previous version.
+    Pure quantity changes therefore need no lookups at all.
+    
+    :param deck_data: The deck as returned by get_decklist.
+    :param previous: The previously processed deck, if any.
+    :param boards: The boards to extract.
+    :param reuse_tags: Whether the tags of the previous version are still current. If not,
+                       only Oracle IDs are reused and all cards are tagged again.
+    :param transport: Optional transport passed on to add_oracle_ids.
+    :return: The processed deck dictionary.
+    """
+    deck_dict, changed = prepare_deck_cards(deck_data, previous, boards, reuse_tags)
+    if changed:
+        add_oracle_ids({key: card for key, card in changed.items() if "oracle_id" not in card}, transport=transport)
+        add_tags_to_deck(changed)
+
+    return deck_dict
+
+
 def extract_unique_tags(deck_data: dict) -> list:
     """
     Extracts a list of unique tags from the deck data.
@@ -227,6 +585,7 @@ def add_selected_tags(deck_data: dict, selected_tags: list) -> dict:
 
 
 
+@metrics.timed("stage", stage="build_deck_string")
 def build_deck_string(deck_data: dict) -> str:
     """
     Builds a multiline string representing the deck from the deck data.
@@ -251,6 +610,43 @@ def build_deck_string(deck_data: dict) -> str:
     return "\n".join(lines)
 
 
+def format_deck_line(card_data: dict, tags: list) -> str:
+    """
+    Formats one card as a decklist line with the given tags appended as hashtags.
+    
+    :param card_data: The card dictionary.
+    :param tags: The tags to append.
+    :return: The line without trailing newline.
+    """
+    quantity = card_data.get("quantity", 0)
+    name = card_data.get("name", "")
+    card_set = card_data.get("set", "").upper()  # Set in Großbuchstaben
+    # Ohne bekanntes Set entfällt "(SET) cn", ein leeres "()" lehnen Importe ab
+    printing = f"({card_set}) {card_data.get('cn', '')}" if card_set else ""
+    finish = FINISH_MARKERS.get(card_data.get("finish"))
+    if finish:
+        printing = f"{printing} *{finish}*".lstrip()
+    tag_string = " ".join([f"#{tag}" for tag in tags])
+    if printing:
+        return f"{quantity} {name} {printing} {tag_string}"
+    return f"{quantity} {name} {tag_string}"
+
+
+@metrics.timed("stage", stage="tag_deck_cards")
+def tag_deck_cards(deck_data: dict, selected_tags: list, tag_tree: dict) -> list:
+    """
+    Applies a tag selection to a processed deck.
+    
+    :param deck_data: The processed deck dictionary with tags for each card.
+    :param selected_tags: The selected tags.
+    :param tag_tree: The nested tag tree used to match descendants of the selected tags.
+    :return: A list of (card_data, matching_tags) tuples, sorted by card name.
+    """
+    index = get_tag_tree_index(tag_tree)
+    sorted_cards = sorted(deck_data.values(), key=lambda card_data: card_data.get('name', '').lower())
+    return [(card_data, index.matching_tags(selected_tags, card_data.get('tags', []))) for card_data in sorted_cards]
+
+
 def convert_to_tree_select_format(tag_tree):
     """
     Converts the tag hierarchy into a format suitable for a tree select component.
@@ -269,70 +665,38 @@ def convert_to_tree_select_format(tag_tree):
 
 
 def get_matching_tags(selected_tags, tag_tree, card_tags):
-    def get_all_descendants(tag, tree):
-        """Recursively get all descendants of a tag in the hierarchy."""
-        descendants = set()
-        if tag in tree:
-            for child in tree[tag]:
-                descendants.add(child)
-                descendants.update(get_all_descendants(child, tree))
-        return descendants
-
-    matching_tags = set()
-
-    for tag in selected_tags:
-        # Collect all descendants of the tag
-        all_related_tags = {tag}  # Include the tag itself
-        all_related_tags.update(get_all_descendants(tag, tag_tree))
-
-        # Check if any related tag is in card_tags
-        if any(related_tag in card_tags for related_tag in all_related_tags):
-            matching_tags.add(tag)
-
-    return list(matching_tags)
+    """
+    Returns the selected tags that apply to a card, either directly or through one of their descendants.
+    
+    :param selected_tags: The tags selected by the user.
+    :param tag_tree: The nested tag tree.
+    :param card_tags: The tags of the card.
+    :return: A list of the matching selected tags.
+    """
+    return get_tag_tree_index(tag_tree).matching_tags(selected_tags, card_tags)
 
 
+@metrics.timed("stage", stage="filter_tag_tree")
 def filter_tag_tree(tag_tree, all_tags):
-    def filter_hierarchy(tag):
-        """Recursively filter the hierarchy to include only tags in all_tags."""
-        if tag not in tag_tree:
-            return {}
-        
-        # Get filtered children that are in all_tags
-        filtered_children = {
-            child: filter_hierarchy(child)
-            for child in tag_tree[tag]
-            if child in all_tags or any(desc in all_tags for desc in get_all_descendants(child, tag_tree))
-        }
-        
-        # Only return this tag if it has filtered children or is itself in all_tags
-        if tag in all_tags or filtered_children:
-            return filtered_children
-        return {}
-
-    def get_all_descendants(tag, tree):
-        """Recursively get all descendants of a tag in the hierarchy."""
-        descendants = set()
-        if tag in tree:
-            for child in tree[tag]:
-                descendants.add(child)
-                descendants.update(get_all_descendants(child, tree))
-        return descendants
-    
-    def get_all_keys(nested_dict):
-        """Recursively extract all keys from a nested dictionary."""
-        keys = set()
-        for key, value in nested_dict.items():
-            keys.add(key)
-            if isinstance(value, dict):  # Check if the value is a nested dictionary
-                keys.update(get_all_keys(value))
-        return keys
-
-    # Step 1: Filter the existing hierarchy
-    filtered_tree = {
-        tag: filter_hierarchy(tag)
-        for tag in tag_tree
-        if tag in all_tags or any(desc in all_tags for desc in get_all_descendants(tag, tag_tree))
-    }
-
-    return filtered_tree
\ No newline at end of file
+    """
+    Reduces the tag tree to the branches that lead to at least one of the given tags.
+    
+    The tree is pruned in a single post-order pass: every node reports whether it
+    or any of its descendants is a deck tag, so each node is visited exactly once.
+    
+    :param tag_tree: The nested tag tree.
+    :param all_tags: The tags present in the deck.
+    :return: The filtered nested tag tree.
+    """
+    all_tags = set(all_tags)
+
+    def filter_hierarchy(subtree):
+        """Returns the pruned subtree; an empty result means no deck tag below."""
+        filtered = {}
+        for tag, sub_tags in subtree.items():
+            filtered_children = filter_hierarchy(sub_tags) if sub_tags else {}
+            if filtered_children or tag in all_tags:
+                filtered[tag] = filtered_children
+        return filtered
+
+    return filter_hierarchy(tag_tree)
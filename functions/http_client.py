@@ -0,0 +1,212 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from functions import metrics
+
+# requests wird erst bei der ersten Abfrage importiert, das spart Zeit beim Start der App
+if TYPE_CHECKING:
+    import requests
+
+
+# Rate-Limits pro Dienst (Abfragen pro Sekunde), alle Hosts eines Dienstes teilen sich ein Budget
+SCRYFALL_RATE_LIMIT = 10  # Maximal 10 Abfragen pro Sekunde
+RATE_LIMITS = {
+    "scryfall.com": SCRYFALL_RATE_LIMIT,
+    "moxfield.com": 10,
+}
+DEFAULT_RATE_LIMIT = 10
+
+# Wiederholungen bei 429 und 5xx Antworten
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # Sekunden, verdoppelt sich pro Versuch
+BACKOFF_MAX = 30
+DEFAULT_TIMEOUT = 30
+POOL_SIZE = 16
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out at most `rate` tokens per second.
+
+    :param rate: Tokens added per second, also the burst capacity.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Während einer Pause sammeln sich keine Tokens an, danach startet der Dienst nicht mit vollem Burst
+                refill_from = max(self.updated, self.blocked_until)
+                if now > refill_from:
+                    self.tokens = min(self.capacity, self.tokens + (now - refill_from) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Stops handing out tokens for the given time, e.g. after a 429; afterwards the bucket restarts with one token."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            # Am Ende der Pause ist genau eine Abfrage frei, danach gilt wieder die Rate
+            self.tokens = min(self.tokens, 1)
+
+
+_lock = threading.Lock()
+_sessions = {}
+_buckets = {}
+
+
+def _service(host: str) -> str:
+    """Maps a host name onto the service whose rate limit it shares (e.g. api.scryfall.com -> scryfall.com)."""
+    for service in RATE_LIMITS:
+        if host == service or host.endswith("." + service):
+            return service
+    return host
+
+
+def __getattr__(name):
+    # http_client.RequestException, ohne requests beim Import dieses Moduls zu laden
+    if name == "RequestException":
+        import requests
+        return requests.RequestException
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_session(host: str) -> "requests.Session":
+    """
+    Returns the keep-alive session for a host, creating it on first use.
+
+    :param host: The host name.
+    :return: A requests session with a pooled adapter.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def get_bucket(host: str) -> TokenBucket:
+    """
+    Returns the process-wide token bucket of the service a host belongs to.
+
+    :param host: The host name.
+    :return: The shared token bucket.
+    """
+    service = _service(host)
+    with _lock:
+        bucket = _buckets.get(service)
+        if bucket is None:
+            bucket = TokenBucket(RATE_LIMITS.get(service, DEFAULT_RATE_LIMIT))
+            _buckets[service] = bucket
+        return bucket
+
+
+def _retry_after(response: "requests.Response") -> float:
+    """
+    Parses the Retry-After header, given either in seconds or as an HTTP date.
+
+    :param response: The response to inspect.
+    :return: The delay in seconds or None if the header is missing or invalid.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+
+
+def request(method: str, url: str, **kwargs) -> "requests.Response":
+    """
+    Sends a request through the pooled session of the target host under its rate limit.
+
+    429 and 5xx responses as well as connection errors are retried with exponential
+    backoff; a Retry-After header takes precedence over the computed delay and, for
+    429, pauses the whole service bucket.
+
+    :param method: The HTTP method.
+    :param url: The URL to request.
+    :param kwargs: Passed on to requests.Session.request.
+    :return: The final response. Its status is not checked.
+    :raises: requests.RequestException if the request still fails after all retries.
+    """
+    import requests
+
+    host = urlsplit(url).hostname or ""
+    service = _service(host)
+    session = get_session(host)
+    bucket = get_bucket(host)
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            metrics.inc("http_retries", service=service)
+        wait_start = time.perf_counter()
+        bucket.acquire()
+        metrics.inc("rate_limit_wait_seconds", time.perf_counter() - wait_start, service=service)
+        metrics.inc("http_requests", service=service, method=method)
+        try:
+            with metrics.timer("http_request", service=service):
+                response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            metrics.inc("http_errors", service=service, status="connection")
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+
+        if response.status_code != 429 and response.status_code < 500:
+            return response
+        metrics.inc("http_errors", service=service, status=str(response.status_code))
+        if attempt == MAX_RETRIES:
+            return response
+
+        delay = _retry_after(response)
+        if delay is None:
+            delay = _backoff(attempt)
+        if response.status_code == 429:
+            bucket.pause(delay)
+        response.close()
+        time.sleep(delay)
+
+
+def get(url: str, **kwargs) -> "requests.Response":
+    """Sends a GET request, see request()."""
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> "requests.Response":
+    """Sends a POST request, see request()."""
+    return request("POST", url, **kwargs)
@@ -0,0 +1,168 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from itertools import groupby
+from typing import Callable, Dict, List, Tuple
+
+
+# Messungen sind standardmäßig aus, z.B. MTG_TAGGER_METRICS=1 streamlit run mtg_deck_tagger_app.py
+METRICS_ENV_VAR = "MTG_TAGGER_METRICS"
+METRICS_PREFIX = "mtg_tagger_"
+
+_enabled = os.environ.get(METRICS_ENV_VAR, "") not in ("", "0")
+_null_timer = nullcontext()
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process registry of counters and timers.
+
+    Metrics are identified by a name plus optional labels. Counters only add up;
+    timers keep count, sum and maximum of the observed durations in seconds.
+    Listeners receive every timer observation as (name, labels, seconds).
+    """
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.timers: Dict[Tuple[str, tuple], List[float]] = {}  # [Anzahl, Summe, Maximum]
+        self.listeners: List[Callable[[str, dict, float], None]] = []
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+        for listener in self.listeners:
+            listener(name, labels, seconds)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def snapshot(self) -> dict:
+        """
+        :return: {"counters": [...], "timers": [...]}, each entry with name, labels and values.
+        """
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            timers = [{"name": name, "labels": dict(labels), "count": count, "sum": total, "max": maximum,
+                       "mean": total / count}
+                      for (name, labels), (count, total, maximum) in sorted(self.timers.items())]
+        return {"counters": counters, "timers": timers}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=1)
+
+    def to_prometheus(self) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+
+        Counters get the _total suffix. Every timer becomes a summary family (_count and
+        _sum) plus a separate gauge family for its maximum, e.g. ..._seconds_max.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, counters in groupby(snapshot["counters"], key=lambda counter: counter["name"]):
+            name = METRICS_PREFIX + name + "_total"
+            lines.append(f"# TYPE {name} counter")
+            for counter in counters:
+                lines.append(f"{name}{_labels(counter['labels'])} {counter['value']:g}")
+        for name, timers in groupby(snapshot["timers"], key=lambda timer: timer["name"]):
+            name = METRICS_PREFIX + name + "_seconds"
+            timers = list(timers)
+            lines.append(f"# TYPE {name} summary")
+            for timer in timers:
+                labels = _labels(timer["labels"])
+                lines.append(f"{name}_count{labels} {timer['count']}")
+                lines.append(f"{name}_sum{labels} {timer['sum']:.6f}")
+            lines.append(f"# TYPE {name}_max gauge")
+            for timer in timers:
+                lines.append(f"{name}_max{_labels(timer['labels'])} {timer['max']:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = MetricsRegistry()
+
+
+def enable(enabled: bool = True):
+    """Switches the collection of metrics on or off for the whole process."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increases a counter; does nothing while metrics are disabled."""
+    if _enabled:
+        registry.inc(name, value, **labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def timer(name: str, **labels):
+    """
+    Context manager measuring the duration of a block, e.g. `with metrics.timer("get_decklist"):`.
+
+    While metrics are disabled a shared no-op context manager is returned.
+    """
+    if not _enabled:
+        return _null_timer
+    return _Timer(name, labels)
+
+
+def timed(name: str, **labels):
+    """Decorator measuring every call of a function, see timer()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_listener(listener: Callable[[str, dict, float], None]):
+    """Registers a callable receiving every timer observation as (name, labels, seconds)."""
+    registry.listeners.append(listener)
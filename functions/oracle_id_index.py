@@ -0,0 +1,66 @@
+"""
+Baut den lokalen Index Scryfall ID -> Oracle ID (ressources/oracle_id_index.bin) aus den
+"Default Cards" Bulk-Daten von Scryfall, siehe general_funs.build_oracle_id_index.
+Ohne Index werden alle unbekannten Drucke über Scryfalls /cards/collection aufgelöst.
+
+Beispiel:
+    python -m functions.oracle_id_index
+    python -m functions.oracle_id_index --input default-cards.json  # bereits heruntergeladene Bulk-Datei
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from functions import general_funs, http_client
+from functions.general_funs import build_oracle_id_index, header
+
+
+SCRYFALL_BULK_DATA_URL = "https://api.scryfall.com/bulk-data/default-cards"
+
+
+def download_default_cards(folder: str) -> str:
+    """
+    Downloads the current "Default Cards" bulk file into a temporary file.
+
+    :param folder: The folder the file is created in.
+    :return: The path of the downloaded file; the caller removes it.
+    """
+    response = http_client.get(SCRYFALL_BULK_DATA_URL, headers=header)
+    response.raise_for_status()
+    download_uri = response.json()["download_uri"]
+
+    fd, path = tempfile.mkstemp(dir=folder, prefix=".default_cards.", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as f, http_client.get(download_uri, headers=header, stream=True) as response:
+            response.raise_for_status()
+            # iter_content entpackt eine gzip-komprimierte Übertragung, response.raw nicht
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baut den lokalen Index Scryfall ID -> Oracle ID aus Scryfalls Bulk-Daten.")
+    parser.add_argument("--input", help="Bereits heruntergeladene Default Cards Bulk-Datei statt des Downloads")
+    parser.add_argument("--output", help="Pfad des Index, Standard: ressources/oracle_id_index.bin")
+    args = parser.parse_args(argv)
+
+    output_path = args.output or general_funs.ORACLE_ID_INDEX_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    bulk_path = args.input or download_default_cards(os.path.dirname(os.path.abspath(output_path)))
+    try:
+        printings = build_oracle_id_index(bulk_path, output_path)
+    finally:
+        if not args.input:
+            os.remove(bulk_path)
+    print(json.dumps({"printings": printings, "path": output_path}), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
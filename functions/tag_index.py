@@ -0,0 +1,339 @@
+import os
+import pickle
+import re
+import tempfile
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from functions.tag_tree_index import get_tag_tree_index
+
+
+QUERY_TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+
+
+class DeckTagIndex:
+    """
+    Inverted index from tags to the (deck, card) pairs carrying them.
+
+    Every card of every indexed deck gets a posting ID; per tag the posting IDs are
+    kept as a sorted uint32 array. IDs are handed out in increasing order, so new decks
+    are appended without re-sorting. Re-indexing a deck marks its old postings dead
+    instead of rewriting the lists; compact() drops them once they dominate.
+
+    Queries work on numpy copies of the lists, and the union over a tag's subtree is
+    memoised; both caches are dropped whenever the index changes.
+
+    Per deck an optional stamp of its source (e.g. the cache file) is kept, so a stored
+    index can be checked against the cache after loading.
+    """
+
+    def __init__(self):
+        self.deck_ids: List[str] = []  # Deck-Nummer -> Deck-ID
+        self.deck_numbers: Dict[str, int] = {}
+        self.deck_postings: Dict[str, Tuple[int, int]] = {}  # Deck-ID -> [start, end) der Posting-IDs
+        self.deck_stamps: Dict[str, tuple] = {}  # Deck-ID -> Stempel der Quelle beim Indexieren
+        self.posting_decks = array("I")  # Posting-ID -> Deck-Nummer
+        self.posting_cards: List[str] = []  # Posting-ID -> Kartenschlüssel
+        self.live = bytearray()  # Posting-ID -> 1 solange das Deck aktuell ist
+        self.tags: List[str] = []
+        self.tag_ids: Dict[str, int] = {}
+        self.postings: List[array] = []  # Tag-ID -> sortierte Posting-IDs
+        self.dead = 0
+        self._reset_caches()
+
+    def _reset_caches(self):
+        self._arrays = {}  # Tag-ID -> numpy Kopie der Postings
+        self._expanded = {}  # (Tag, Level, Baum) -> Ergebnis-IDs
+        self._live = None
+        self._posting_decks = None
+        self._universes = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_arrays", "_expanded", "_live", "_posting_decks", "_universes"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("deck_stamps", {})  # Gespeicherte Indizes ohne Stempel
+        self.__dict__.update(state)
+        self._reset_caches()
+
+    def __len__(self) -> int:
+        return len(self.deck_postings)
+
+    def _tag_id(self, tag: str) -> int:
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tags)
+            self.tag_ids[tag] = tag_id
+            self.tags.append(tag)
+            self.postings.append(array("I"))
+        return tag_id
+
+    def remove_deck(self, deck_id: str):
+        """Marks all postings of a deck as dead."""
+        self.deck_stamps.pop(deck_id, None)
+        posting_range = self.deck_postings.pop(deck_id, None)
+        if posting_range is None:
+            return
+        start, end = posting_range
+        self.live[start:end] = bytes(end - start)
+        self.dead += end - start
+        self._reset_caches()
+
+    def update_deck(self, deck_id: str, deck_data: Dict[str, dict], stamp: tuple = None):
+        """
+        Indexes a processed deck, replacing an earlier version of it.
+
+        :param deck_id: The deck ID.
+        :param deck_data: The processed deck dictionary with tags for each card.
+        :param stamp: Optional stamp of the source the deck was read from.
+        """
+        self.remove_deck(deck_id)
+        if stamp is not None:
+            self.deck_stamps[deck_id] = stamp
+        deck_number = self.deck_numbers.get(deck_id)
+        if deck_number is None:
+            deck_number = len(self.deck_ids)
+            self.deck_numbers[deck_id] = deck_number
+            self.deck_ids.append(deck_id)
+
+        start = len(self.posting_cards)
+        for card_key, card_data in deck_data.items():
+            posting_id = len(self.posting_cards)
+            self.posting_cards.append(card_key)
+            self.posting_decks.append(deck_number)
+            self.live.append(1)
+            for tag in set(card_data.get("tags", [])):
+                self.postings[self._tag_id(tag)].append(posting_id)
+        self.deck_postings[deck_id] = (start, len(self.posting_cards))
+        self._reset_caches()
+
+        if self.dead > len(self.posting_cards) // 2:
+            self.compact()
+
+    def compact(self):
+        """Rebuilds the posting lists without the postings of replaced or removed decks."""
+        live = np.frombuffer(bytes(self.live), dtype=bool)
+        # Neue Posting-ID = Anzahl lebender Postings davor
+        live_before = np.concatenate(([0], np.cumsum(live, dtype=np.int64)))
+        posting_decks = np.frombuffer(self.posting_decks, dtype=np.uint32)
+
+        self.postings = [
+            array("I", live_before[ids[live[ids]]].astype(np.uint32).tobytes())
+            for ids in (np.frombuffer(postings, dtype=np.uint32) for postings in self.postings)
+        ]
+        self.posting_decks = array("I", posting_decks[live].tobytes())
+        self.posting_cards = [card_key for card_key, is_live in zip(self.posting_cards, live) if is_live]
+        self.deck_postings = {deck_id: (int(live_before[start]), int(live_before[end]))
+                              for deck_id, (start, end) in self.deck_postings.items()}
+        self.live = bytearray(b"\x01" * len(self.posting_cards))
+        self.dead = 0
+        self._reset_caches()
+
+    def _live_mask(self) -> np.ndarray:
+        if self._live is None:
+            self._live = np.frombuffer(bytes(self.live), dtype=bool)
+            self._posting_decks = np.array(self.posting_decks, dtype=np.uint32)
+        return self._live
+
+    def _tag_array(self, tag_id: int) -> np.ndarray:
+        ids = self._arrays.get(tag_id)
+        if ids is None:
+            ids = np.array(self.postings[tag_id], dtype=np.uint32)
+            if self.dead:
+                ids = ids[self._live_mask()[ids]]
+            self._arrays[tag_id] = ids
+        return ids
+
+    def _term(self, tag: str, level: str, tree_index) -> np.ndarray:
+        """Sorted posting IDs (or deck numbers) of a tag and, with a tree index, its descendants."""
+        key = (tag, level, id(tree_index))
+        ids = self._expanded.get(key)
+        if ids is None:
+            tags = [tag] if tree_index is None else [tag] + tree_index.descendants(tag)
+            arrays = [self._tag_array(self.tag_ids[t]) for t in tags if t in self.tag_ids]
+            if not arrays:
+                ids = np.empty(0, dtype=np.uint32)
+            elif len(arrays) == 1:
+                ids = arrays[0]
+            else:
+                ids = _union(arrays, len(self.posting_cards))
+            if level == "deck":
+                self._live_mask()
+                ids = _union([self._posting_decks[ids]], len(self.deck_ids))
+            self._expanded[key] = ids
+        return ids
+
+    def _universe(self, level: str) -> np.ndarray:
+        universe = self._universes.get(level)
+        if universe is None:
+            if level == "card":
+                universe = np.flatnonzero(self._live_mask()).astype(np.uint32)
+            else:
+                universe = np.array(sorted(self.deck_numbers[deck_id] for deck_id in self.deck_postings),
+                                    dtype=np.uint32)
+            self._universes[level] = universe
+        return universe
+
+    def query_ids(self, expression: str, tag_tree: dict = None, level: str = "card") -> np.ndarray:
+        """
+        Evaluates a boolean tag query and returns the raw sorted IDs, see query().
+
+        :return: Posting IDs for level "card", deck numbers for level "deck".
+        """
+        if level not in ("card", "deck"):
+            raise ValueError(f"Unknown query level '{level}'.")
+        tree_index = get_tag_tree_index(tag_tree) if tag_tree is not None else None
+        size = len(self.posting_cards) if level == "card" else len(self.deck_ids)
+        return _evaluate(QUERY_TOKEN_PATTERN.findall(expression),
+                         lambda tag: self._term(tag, level, tree_index),
+                         lambda: self._universe(level), size)
+
+    def query(self, expression: str, tag_tree: dict = None, level: str = "card"):
+        """
+        Evaluates a boolean tag query such as "board-wipe AND NOT (ramp OR card-draw)".
+
+        Operators are AND, OR, NOT and parentheses; adjacent terms are combined with AND.
+        With a tag tree, every tag also matches all of its descendants.
+
+        :param expression: The query.
+        :param tag_tree: Optional nested tag tree for hierarchical expansion.
+        :param level: "card" combines the tags per card, "deck" per deck (a deck matches
+                      "a AND b" if any card has a and any card has b).
+        :return: For "card" a list of (deck_id, card_key), for "deck" a list of deck IDs.
+        :raises: ValueError for malformed queries.
+        """
+        result = self.query_ids(expression, tag_tree, level)
+        if level == "deck":
+            return [self.deck_ids[deck_number] for deck_number in result.tolist()]
+        posting_decks = self.posting_decks
+        return [(self.deck_ids[posting_decks[posting_id]], self.posting_cards[posting_id])
+                for posting_id in result.tolist()]
+
+
+def _union(arrays: List[np.ndarray], size: int) -> np.ndarray:
+    """Sorted union of ID arrays below `size`, via a boolean mask instead of sorting."""
+    mask = np.zeros(size, dtype=bool)
+    for ids in arrays:
+        mask[ids] = True
+    return np.flatnonzero(mask).astype(np.uint32)
+
+
+def _intersect(a: np.ndarray, b: np.ndarray, size: int) -> np.ndarray:
+    if len(a) > len(b):
+        a, b = b, a
+    mask = np.zeros(size, dtype=bool)
+    mask[b] = True
+    return a[mask[a]]
+
+
+def _difference(a: np.ndarray, b: np.ndarray, size: int) -> np.ndarray:
+    mask = np.zeros(size, dtype=bool)
+    mask[b] = True
+    return a[~mask[a]]
+
+
+def _evaluate(tokens: List[str], term, universe, size: int) -> np.ndarray:
+    """
+    Recursive-descent evaluation of a tokenised boolean query over sorted ID arrays.
+
+    `term` maps a tag to its IDs, `universe` lazily returns all IDs (only needed for a
+    leading NOT; "a AND NOT b" is evaluated as a difference) and `size` bounds the IDs.
+    """
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        result = parse_and()
+        while peek() == "OR":
+            take()
+            result = _union([result, parse_and()], size)
+        return result
+
+    def parse_and():
+        result = parse_not()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            if peek() == "NOT":
+                take()
+                result = _difference(result, parse_not(), size)
+            else:
+                result = _intersect(result, parse_not(), size)
+        return result
+
+    def parse_not():
+        if peek() == "NOT":
+            take()
+            return _difference(universe(), parse_not(), size)
+        return parse_atom()
+
+    def parse_atom():
+        token = peek()
+        if token is None or token in ("AND", "OR", ")"):
+            raise ValueError(f"Unexpected {'end of query' if token is None else repr(token)}.")
+        take()
+        if token == "(":
+            result = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing closing parenthesis.")
+            take()
+            return result
+        return term(token)
+
+    result = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected {peek()!r}.")
+    return result
+
+
+def load_tag_index(path: str) -> DeckTagIndex:
+    """
+    :param path: The pickle file of the index.
+    :return: The stored index or None if it does not exist or cannot be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    return index if isinstance(index, DeckTagIndex) else None
+
+
+def save_tag_index(index: DeckTagIndex, path: str):
+    """Writes the index atomically."""
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tag_index_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def build_tag_index(decks: Iterable[Tuple[str, Dict[str, dict]]]) -> DeckTagIndex:
+    """
+    :param decks: (deck_id, processed deck) pairs.
+    :return: A new index over all given decks.
+    """
+    index = DeckTagIndex()
+    for deck_id, deck_data in decks:
+        index.update_deck(deck_id, deck_data)
+    return index
@@ -0,0 +1,138 @@
+"""
+Aktualisiert die Karten-Tags (card_tags_dict.pkl und den Tag-Store) inkrementell.
+
+Beispiel:
+    python -m functions.tag_refresh
+    python -m functions.tag_refresh --input oracle_tags.json  # bereits heruntergeladene Antwort
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List
+
+from functions import http_client, tag_store as tag_store_module
+from functions.card_cache import get_card_cache
+from functions.general_funs import _iter_json_array, header
+from functions.tag_store import CardTagStore, _source_stamp, build_tag_store, get_tag_store, reset_tag_store
+from functions.webapp_funs import apply_card_tag_changes
+
+
+SCRYFALL_ORACLE_TAGS_URL = "https://api.scryfall.com/private/tags/oracle"
+
+
+def read_card_tags(fp) -> Dict[str, List[str]]:
+    """
+    Reads the Scryfall oracle tag payload entry by entry and flips it into Oracle ID -> labels.
+
+    :param fp: A text file object with the JSON payload ({"data": [{"label": ..., "oracle_ids": [...]}, ...]}).
+    :return: Mapping Oracle ID -> list of tag labels, in payload order.
+    """
+    flipped_mapping = defaultdict(list)
+    for entry in _iter_json_array(fp, key="data"):
+        label = entry["label"]
+        for oracle_id in entry["oracle_ids"]:
+            flipped_mapping[oracle_id].append(label)
+    return dict(flipped_mapping)
+
+
+def download_card_tags(url: str = SCRYFALL_ORACLE_TAGS_URL) -> Dict[str, List[str]]:
+    """Streams the oracle tag payload from Scryfall, see read_card_tags."""
+    response = http_client.get(url, headers=header, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    with io.TextIOWrapper(response.raw, encoding="utf-8") as fp:
+        return read_card_tags(fp)
+
+
+def diff_card_tags(tag_store: CardTagStore, card_tags: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Compares new card tags with a tag store.
+
+    The order of a card's labels is not significant.
+
+    :param tag_store: The current store.
+    :param card_tags: The new mapping Oracle ID -> labels.
+    :return: The Oracle IDs that were added, removed and changed, each sorted.
+    """
+    added, changed = [], []
+    for oracle_id, labels in card_tags.items():
+        if oracle_id not in tag_store:
+            added.append(oracle_id)
+        elif set(tag_store.get_tags(oracle_id)) != set(labels):
+            changed.append(oracle_id)
+    removed = [oracle_id for oracle_id, _ in tag_store.items() if oracle_id not in card_tags]
+    return {"added": sorted(added), "removed": sorted(removed), "changed": sorted(changed)}
+
+
+def _write_pickle(content: bytes, path: str):
+    folder = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".card_tags_", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def refresh_card_tags(card_tags: Dict[str, List[str]] = None) -> dict:
+    """
+    Replaces the card tags with a new payload, touching only what changed.
+
+    card_tags_dict.pkl and a new store version are written atomically (the version is
+    the hash of the pickle, as for build_tag_store_from_pickle). Cached tag IDs of the
+    card cache are translated to the new version, and in the processed-deck cache only
+    cards with added, removed or changed Oracle IDs are re-tagged; all other cached
+    decks stay valid.
+
+    :param card_tags: The new mapping Oracle ID -> labels; downloaded from Scryfall if omitted.
+    :return: A summary with the old and new version, the diff sizes and the deck cache counts.
+    """
+    if card_tags is None:
+        card_tags = download_card_tags()
+    old_store = get_tag_store()
+    diff = diff_card_tags(old_store, card_tags)
+    summary = {"old_version": old_store.version, "cards": len(card_tags),
+               **{kind: len(oracle_ids) for kind, oracle_ids in diff.items()}}
+
+    content = pickle.dumps(card_tags)
+    version = hashlib.sha1(content).hexdigest()[:16]
+    summary["new_version"] = version
+    if version == old_store.version:
+        return summary
+
+    card_tags_path = tag_store_module.CARD_TAGS_DICT_PATH
+    _write_pickle(content, card_tags_path)
+    build_tag_store(card_tags, version, source=_source_stamp(card_tags_path))
+    reset_tag_store()
+    new_store = get_tag_store()
+
+    changed_oracle_ids = set(diff["added"]) | set(diff["removed"]) | set(diff["changed"])
+    id_map = {tag_id: new_store.label_ids[label]
+              for tag_id, label in enumerate(old_store.vocab) if label in new_store.label_ids}
+    card_cache = get_card_cache()
+    card_cache.migrate_tag_ids(old_store.version, new_store.version, id_map, changed_oracle_ids)
+    card_cache.save()
+
+    summary.update(apply_card_tag_changes(old_store.version, new_store, changed_oracle_ids))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aktualisiert die Karten-Tags und passt nur betroffene Decks im Cache an.")
+    parser.add_argument("--input", help="JSON-Antwort von /private/tags/oracle aus einer Datei statt von Scryfall")
+    args = parser.parse_args(argv)
+
+    card_tags = None
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            card_tags = read_card_tags(f)
+    print(json.dumps(refresh_card_tags(card_tags)), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from functions import metrics
+
+
+# Speicherort des Tag-Stores, jede Version liegt in einem eigenen Unterordner
+RESSOURCES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ressources')
+CARD_TAGS_DICT_PATH = os.path.join(RESSOURCES_FOLDER, 'card_tags_dict.pkl')
+TAG_STORE_FOLDER = os.path.join(RESSOURCES_FOLDER, 'card_tag_store')
+CURRENT_FILE = "CURRENT"
+STORE_FILES = ("oracle_keys.npy", "offsets.npy", "tag_ids.npy", "vocab.json", "meta.json")
+
+
+def _oracle_key(oracle_id: str) -> bytes:
+    """
+    Converts an Oracle ID into its 16 byte key.
+
+    IDs that are not hex map onto an empty key; callers treat every key that is not 16 bytes long as invalid.
+    """
+    try:
+        return bytes.fromhex(oracle_id.replace("-", ""))
+    except (ValueError, AttributeError):
+        return b""
+
+
+class CardTagStore:
+    """
+    Read-only, memory-compact mapping Oracle ID -> tag labels.
+
+    Labels are interned into an integer vocabulary. The tags of all cards are stored
+    in CSR form: `tag_ids[offsets[i]:offsets[i + 1]]` are the tags of the card with
+    key `oracle_keys[i]`, where the keys are the sorted 16 byte Oracle UUIDs. The
+    arrays are memory-mapped, so several processes share the same pages.
+
+    :param store_path: The folder of one store version.
+    """
+
+    def __init__(self, store_path: str):
+        self.path = store_path
+        with open(os.path.join(store_path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(store_path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab: List[str] = json.load(f)
+        self.label_ids: Dict[str, int] = {label: i for i, label in enumerate(self.vocab)}
+        # Plain ndarray Sichten auf die Memory-Maps, np.memmap selbst ist pro Zugriff deutlich langsamer
+        self.oracle_keys = np.asarray(np.load(os.path.join(store_path, "oracle_keys.npy"), mmap_mode="r"))
+        self.offsets = np.asarray(np.load(os.path.join(store_path, "offsets.npy"), mmap_mode="r"))
+        self.tag_ids = np.asarray(np.load(os.path.join(store_path, "tag_ids.npy"), mmap_mode="r"))
+
+    @property
+    def version(self) -> str:
+        return self.meta["version"]
+
+    def __len__(self) -> int:
+        return len(self.oracle_keys)
+
+    def _position(self, oracle_id: str) -> int:
+        key = _oracle_key(oracle_id)
+        if len(key) != 16:
+            return -1
+        position = int(self.oracle_keys.searchsorted(key))
+        # numpy kürzt abschließende Null-Bytes bei S16 Werten
+        if position < len(self.oracle_keys) and self.oracle_keys[position] == key.rstrip(b"\0"):
+            return position
+        return -1
+
+    def __contains__(self, oracle_id: str) -> bool:
+        return self._position(oracle_id) >= 0
+
+    def get_tag_ids(self, oracle_id: str) -> List[int]:
+        """
+        :param oracle_id: The Oracle ID of the card.
+        :return: The interned tag IDs of the card, empty if the card is unknown.
+        """
+        position = self._position(oracle_id)
+        if position < 0:
+            return []
+        return self.tag_ids[self.offsets[position]:self.offsets[position + 1]].tolist()
+
+    def get_tags(self, oracle_id: str) -> List[str]:
+        """
+        :param oracle_id: The Oracle ID of the card.
+        :return: The tag labels of the card, empty if the card is unknown.
+        """
+        vocab = self.vocab
+        return [vocab[tag_id] for tag_id in self.get_tag_ids(oracle_id)]
+
+    def labels(self, tag_ids: Iterable[int]) -> List[str]:
+        """Translates interned tag IDs back into labels."""
+        vocab = self.vocab
+        return [vocab[tag_id] for tag_id in tag_ids]
+
+    def items(self):
+        """Yields (oracle_id, tag labels) for every card of the store."""
+        for position, key in enumerate(self.oracle_keys):
+            hex_key = bytes(key).ljust(16, b"\0").hex()
+            oracle_id = f"{hex_key[:8]}-{hex_key[8:12]}-{hex_key[12:16]}-{hex_key[16:20]}-{hex_key[20:]}"
+            tag_ids = self.tag_ids[self.offsets[position]:self.offsets[position + 1]]
+            yield oracle_id, [self.vocab[tag_id] for tag_id in tag_ids]
+
+
+def _is_complete_store(store_path: str) -> bool:
+    return all(os.path.isfile(os.path.join(store_path, filename)) for filename in STORE_FILES)
+
+
+def _write_json_atomic(path: str, content):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def build_tag_store(card_tags: Dict[str, List[str]], version: str, store_folder: str = None,
+                    source: dict = None) -> str:
+    """
+    Writes a new store version and makes it the current one.
+
+    The version folder is written under a unique temporary name and renamed once it is
+    complete, and the CURRENT pointer is replaced only afterwards, so readers never see a
+    half written store. If the version already exists completely (e.g. built by another
+    process), only its source information is updated. All other versions are deleted
+    once the new one is current.
+
+    :param card_tags: Mapping Oracle ID -> list of tag labels.
+    :param version: Name of the new version.
+    :param store_folder: The folder holding all store versions, TAG_STORE_FOLDER by default.
+    :param source: Optional information about the input, stored in meta.json.
+    :return: The path of the new version folder.
+    """
+    store_folder = TAG_STORE_FOLDER if store_folder is None else store_folder
+    os.makedirs(store_folder, exist_ok=True)
+    store_path = os.path.join(store_folder, version)
+
+    if _is_complete_store(store_path):
+        meta_path = os.path.join(store_path, "meta.json")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("source") != (source or {}):
+            _write_json_atomic(meta_path, dict(meta, source=source or {}))
+    else:
+        vocab = sorted({label for labels in card_tags.values() for label in labels})
+        label_ids = {label: i for i, label in enumerate(vocab)}
+
+        entries = sorted(
+            (key, labels) for key, labels in ((_oracle_key(oracle_id), labels) for oracle_id, labels in card_tags.items())
+            if len(key) == 16
+        )
+        oracle_keys = np.array([key for key, _ in entries], dtype="S16")
+        offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+        np.cumsum([len(labels) for _, labels in entries], out=offsets[1:])
+        tag_dtype = np.uint16 if len(vocab) <= np.iinfo(np.uint16).max else np.uint32
+        tag_ids = np.fromiter((label_ids[label] for _, labels in entries for label in labels),
+                              dtype=tag_dtype, count=int(offsets[-1]))
+
+        # Eindeutiger temporärer Ordner, damit parallel bauende Prozesse sich nicht gegenseitig die Dateien löschen
+        tmp_path = tempfile.mkdtemp(dir=store_folder, prefix=f".{version}.", suffix=".tmp")
+        try:
+            np.save(os.path.join(tmp_path, "oracle_keys.npy"), oracle_keys)
+            np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+            np.save(os.path.join(tmp_path, "tag_ids.npy"), tag_ids)
+            with open(os.path.join(tmp_path, "vocab.json"), "w", encoding="utf-8") as f:
+                json.dump(vocab, f)
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": version, "cards": len(entries), "tags": len(vocab), "source": source or {}}, f)
+            if os.path.isdir(store_path) and not _is_complete_store(store_path):
+                # Unvollständiger Ordner, z.B. von Hand angelegt, wird nie gelesen
+                shutil.rmtree(store_path, ignore_errors=True)
+            try:
+                os.replace(tmp_path, store_path)
+            except OSError:
+                # Ein anderer Prozess hat dieselbe Version inzwischen fertig geschrieben
+                if not _is_complete_store(store_path):
+                    raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    fd, current_tmp = tempfile.mkstemp(dir=store_folder, prefix=f".{CURRENT_FILE}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(current_tmp, os.path.join(store_folder, CURRENT_FILE))
+    except BaseException:
+        os.remove(current_tmp)
+        raise
+
+    _remove_superseded_versions(store_folder, version)
+    return store_path
+
+
+def _remove_superseded_versions(store_folder: str, version: str):
+    """Deletes all store versions except the current one; temporary folders of running builds are left alone."""
+    # Hat ein anderer Prozess CURRENT inzwischen auf seine Version gesetzt, räumt dieser auf
+    if _current_store_path(store_folder) != os.path.join(store_folder, version):
+        return
+    for name in os.listdir(store_folder):
+        path = os.path.join(store_folder, name)
+        if name != version and not name.startswith(".") and os.path.isdir(path):
+            # Bereits geöffnete Stores lesen über ihre Memory-Maps weiter, unter Windows bleibt der Ordner ggf. liegen
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _source_stamp(pickle_path: str) -> dict:
+    stat = os.stat(pickle_path)
+    return {"path": os.path.basename(pickle_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+@metrics.timed("stage", stage="build_tag_store")
+def build_tag_store_from_pickle(pickle_path: str = None, store_folder: str = None) -> str:
+    """
+    Converts card_tags_dict.pkl into a tag store. The version is the hash of the pickle.
+
+    :param pickle_path: Path to the card tags pickle, CARD_TAGS_DICT_PATH by default.
+    :param store_folder: The folder holding all store versions, TAG_STORE_FOLDER by default.
+    :return: The path of the new version folder.
+    """
+    pickle_path = CARD_TAGS_DICT_PATH if pickle_path is None else pickle_path
+    with open(pickle_path, "rb") as f:
+        content = f.read()
+    version = hashlib.sha1(content).hexdigest()[:16]
+    return build_tag_store(pickle.loads(content), version, store_folder, source=_source_stamp(pickle_path))
+
+
+def _current_store_path(store_folder: str) -> str:
+    try:
+        with open(os.path.join(store_folder, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return os.path.join(store_folder, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_tag_store() -> CardTagStore:
+    """
+    Returns the process-wide tag store, loading it on first use.
+
+    If no store exists yet, or card_tags_dict.pkl changed since the current store
+    was built from it, the store is (re)built from the pickle first.
+
+    :return: The shared CardTagStore.
+    """
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock, metrics.timer("stage", stage="open_tag_store"):
+        if _store is None:
+            store_path = _current_store_path(TAG_STORE_FOLDER)
+            if store_path is None or not os.path.isdir(store_path):
+                store_path = build_tag_store_from_pickle()
+            store = CardTagStore(store_path)
+            source = store.meta.get("source", {})
+            if (source.get("path") == os.path.basename(CARD_TAGS_DICT_PATH) and os.path.exists(CARD_TAGS_DICT_PATH)
+                    and source != _source_stamp(CARD_TAGS_DICT_PATH)):
+                store = CardTagStore(build_tag_store_from_pickle())
+            _store = store
+    return _store
+
+
+def reset_tag_store():
+    """Drops the loaded store so that the next get_tag_store() call reads the current version."""
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,181 @@
+from typing import Dict, Iterable, List
+
+
+class TagTreeIndex:
+    """
+    Interned view of the nested tag tree with precomputed closures.
+
+    Every tag gets an integer ID. For each tag the set of its descendants and the set
+    of its ancestors are stored as bitsets (Python ints, bit i = tag with ID i), so
+    hierarchy questions become a handful of bitwise operations. A tag that occurs at
+    several places in the tree gets one ID and the union of its parents and children.
+
+    :param tag_tree: The nested tag tree, e.g. loaded from cleaned_tag_tree.pkl.
+    """
+
+    def __init__(self, tag_tree: Dict[str, dict]):
+        self.tags: List[str] = []
+        self.tag_ids: Dict[str, int] = {}
+        self.children: List[set] = []
+        self.parents: List[set] = []
+        self.roots: List[int] = []
+
+        self._intern_subtree(tag_tree, None)
+
+        count = len(self.tags)
+        self.descendant_masks = [None] * count
+        self.ancestor_masks = [None] * count
+        for tag_id in range(count):
+            self._closure(tag_id, self.children, self.descendant_masks)
+            self._closure(tag_id, self.parents, self.ancestor_masks)
+
+    def _intern(self, tag: str) -> int:
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tags)
+            self.tag_ids[tag] = tag_id
+            self.tags.append(tag)
+            self.children.append(set())
+            self.parents.append(set())
+        return tag_id
+
+    def _intern_subtree(self, subtree: dict, parent_id):
+        # Iterativ, damit auch tiefe Bäume kein Rekursionslimit erreichen
+        stack = [(subtree, parent_id)]
+        while stack:
+            node, node_parent = stack.pop()
+            for tag, sub_tags in node.items():
+                tag_id = self._intern(tag)
+                if node_parent is None:
+                    if tag_id not in self.roots:
+                        self.roots.append(tag_id)
+                else:
+                    self.children[node_parent].add(tag_id)
+                    self.parents[tag_id].add(node_parent)
+                if sub_tags:
+                    stack.append((sub_tags, tag_id))
+
+    @staticmethod
+    def _closure(start: int, edges: List[set], masks: list) -> int:
+        """Computes the transitive closure of `start` along `edges`, memoised in `masks`."""
+        if masks[start] is not None:
+            return masks[start]
+        stack = [(start, iter(edges[start]))]
+        masks[start] = 0  # schützt vor Zyklen
+        while stack:
+            tag_id, neighbours = stack[-1]
+            for neighbour in neighbours:
+                if masks[neighbour] is None:
+                    masks[neighbour] = 0
+                    stack.append((neighbour, iter(edges[neighbour])))
+                    break
+            else:
+                stack.pop()
+                mask = 0
+                for neighbour in edges[tag_id]:
+                    mask |= (1 << neighbour) | masks[neighbour]
+                masks[tag_id] = mask
+        return masks[start]
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self.tag_ids
+
+    def mask(self, tags: Iterable[str]) -> int:
+        """
+        Builds the bitset of the given tags. Tags that are not in the tree are ignored.
+
+        :param tags: An iterable of tag labels.
+        :return: The bitset of the known tags.
+        """
+        mask = 0
+        tag_ids = self.tag_ids
+        for tag in tags:
+            tag_id = tag_ids.get(tag)
+            if tag_id is not None:
+                mask |= 1 << tag_id
+        return mask
+
+    def subtree_mask(self, tag: str) -> int:
+        """
+        :param tag: A tag label.
+        :return: The bitset of the tag and all its descendants, 0 for unknown tags.
+        """
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            return 0
+        return (1 << tag_id) | self.descendant_masks[tag_id]
+
+    def ancestor_closure(self, tags: Iterable[str]) -> int:
+        """
+        :param tags: An iterable of tag labels.
+        :return: The bitset of the given tags together with all their ancestors.
+        """
+        closure = 0
+        tag_ids = self.tag_ids
+        ancestor_masks = self.ancestor_masks
+        for tag in tags:
+            tag_id = tag_ids.get(tag)
+            if tag_id is not None:
+                closure |= (1 << tag_id) | ancestor_masks[tag_id]
+        return closure
+
+    def tags_of(self, mask: int) -> List[str]:
+        """
+        :param mask: A bitset of tag IDs.
+        :return: The tag labels contained in the bitset, ordered by ID.
+        """
+        tags = []
+        while mask:
+            low_bit = mask & -mask
+            tags.append(self.tags[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return tags
+
+    def descendants(self, tag: str) -> List[str]:
+        """Returns all descendants of a tag (without the tag itself)."""
+        tag_id = self.tag_ids.get(tag)
+        return [] if tag_id is None else self.tags_of(self.descendant_masks[tag_id])
+
+    def ancestors(self, tag: str) -> List[str]:
+        """Returns all ancestors of a tag (without the tag itself)."""
+        tag_id = self.tag_ids.get(tag)
+        return [] if tag_id is None else self.tags_of(self.ancestor_masks[tag_id])
+
+    def matching_tags(self, selected_tags: Iterable[str], card_tags: Iterable[str]) -> List[str]:
+        """
+        Returns the selected tags that the card has itself or through one of their descendants.
+
+        :param selected_tags: The tags selected by the user.
+        :param card_tags: The tags of the card.
+        :return: The matching selected tags in selection order, each tag only once.
+        """
+        card_tags = set(card_tags)
+        card_mask = self.mask(card_tags)
+        return [tag for tag in dict.fromkeys(selected_tags) if tag in card_tags or self.subtree_mask(tag) & card_mask]
+
+
+_index_cache = {}
+
+
+def get_tag_tree_index(tag_tree: Dict[str, dict]) -> TagTreeIndex:
+    """
+    Returns the index of a tag tree, building it on first use.
+
+    The index is memoised per tree object, the tree must therefore not be modified
+    after it has been indexed.
+
+    :param tag_tree: The nested tag tree.
+    :return: The TagTreeIndex of the tree.
+    """
+    cached = _index_cache.get(id(tag_tree))
+    if cached is not None and cached[0] is tag_tree:
+        return cached[1]
+    index = TagTreeIndex(tag_tree)
+    if len(_index_cache) >= 8:
+        _index_cache.clear()
+    # Die Referenz auf den Baum verhindert, dass seine id() wiederverwendet wird
+    _index_cache[id(tag_tree)] = (tag_tree, index)
+    return index
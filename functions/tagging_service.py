@@ -0,0 +1,290 @@
+"""
+Lokaler HTTP-Dienst, der Moxfield-Decks mit ausgewählten Tags als JSON oder Text liefert.
+
+Aufruf aus dem Projektordner: python -m functions.tagging_service [--port 8765] [--workers 4]
+
+    POST /tag        {"deck": "<Deck-ID oder URL>", "tags": ["ramp", ...], "format": "json" | "text",
+                      "refresh": false, "boards": ["mainboard"]}
+    GET  /tag?deck=<Deck-ID>&tags=ramp,removal&format=text
+    GET  /health
+    GET  /metrics    (Prometheus-Format, nur mit --metrics gefüllt)
+"""
+import argparse
+import json
+import os
+import pickle
+import signal
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+from urllib.parse import parse_qs, urlsplit
+
+from functions import http_client, metrics
+from functions.card_cache import get_card_cache
+from functions.general_funs import DEFAULT_BOARDS, format_deck_line, parse_deck_id, tag_deck_cards
+from functions.tag_store import get_tag_store
+from functions.tag_tree_index import get_tag_tree_index
+from functions.webapp_funs import load_processed_deck
+
+
+TAG_TREE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tag_trees',
+                             'cleaned_tag_tree.pkl')
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+REQUEST_TIMEOUT = 120  # Sekunden, die eine Anfrage höchstens auf Laden und Taggen wartet
+MAX_BODY_BYTES = 1 << 20
+CARD_CACHE_SAVE_INTERVAL = 60  # Sekunden zwischen zwei Speicherungen des Karten-Caches im Hintergrund
+CARD_OUTPUT_FIELDS = ("name", "quantity", "set", "cn", "board")
+
+
+class ServiceError(Exception):
+    """An error that is reported to the client with the given HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time on an executor.
+
+    Callers that ask for a key while a call for it is still running get the future
+    of that call instead of starting a second one. Once the call has finished the
+    key is released, so later callers start a fresh call.
+
+    :param executor: The executor the calls run on.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.inflight: Dict[Any, Future] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, func: Callable, *args) -> Future:
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                metrics.inc("singleflight_shared")
+                return future
+            future = self.executor.submit(func, *args)
+            self.inflight[key] = future
+        # Außerhalb der Sperre, der Callback läuft sofort, falls der Aufruf schon fertig ist
+        future.add_done_callback(lambda done: self._release(key, done))
+        return future
+
+    def _release(self, key, future: Future):
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+
+class TaggingService:
+    """
+    Tags decks on request, sharing the tag tree, tag store and all deck and card caches.
+
+    Loading a deck (Moxfield/Scryfall requests and processing) and tagging it both run
+    on a bounded worker pool; concurrent requests for the same deck share one load.
+    The card cache is not written in the request path but by a background thread every
+    `save_interval` seconds and once more on close().
+
+    :param tag_tree: The nested tag tree.
+    :param workers: Number of worker threads.
+    :param save_interval: Seconds between two saves of the card cache.
+    """
+
+    def __init__(self, tag_tree: dict, workers: int = DEFAULT_WORKERS, save_interval: float = CARD_CACHE_SAVE_INTERVAL):
+        self.tag_tree = tag_tree
+        self.tag_index = get_tag_tree_index(tag_tree)
+        get_tag_store()  # Store schon beim Start öffnen, nicht bei der ersten Anfrage
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tagging")
+        self.decks = SingleFlight(self.executor)
+        self.closed = threading.Event()
+        self.saver = threading.Thread(target=self._save_card_cache, args=(save_interval,),
+                                      name="card-cache-saver", daemon=True)
+        self.saver.start()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.closed.set()
+        self.saver.join()
+
+    def _save_card_cache(self, interval: float):
+        # save() schreibt nur, wenn sich der Cache geändert hat; nach close() ein letztes Mal
+        while not self.closed.wait(interval):
+            get_card_cache().save()
+        get_card_cache().save()
+
+    @staticmethod
+    def _load_deck(deck_id: str, boards: tuple, refresh: bool) -> Dict[str, dict]:
+        return load_processed_deck(deck_id, refresh=refresh, boards=boards, persist=False)
+
+    def _tag_deck(self, deck_id: str, deck_data: Dict[str, dict], selected_tags: list, output_format: str):
+        tagged_cards = tag_deck_cards(deck_data, selected_tags, self.tag_tree)
+        if output_format == "text":
+            return "".join(format_deck_line(card_data, tags) + "\n" for card_data, tags in tagged_cards)
+        tag_store = get_tag_store()
+        return {
+            "deck_id": deck_id,
+            "tags_version": tag_store.version,
+            "selected_tags": selected_tags,
+            "unknown_tags": [tag for tag in selected_tags
+                             if tag not in tag_store.label_ids and tag not in self.tag_index],
+            "lines": [format_deck_line(card_data, tags) for card_data, tags in tagged_cards],
+            "cards": [dict({field: card_data[field] for field in CARD_OUTPUT_FIELDS if field in card_data}, tags=tags)
+                      for card_data, tags in tagged_cards],
+        }
+
+    def tag(self, params: Dict[str, Any]):
+        """
+        Tags one deck.
+
+        :param params: "deck" (ID or URL), optional "tags" (list or comma-separated string),
+                       "format" ("json" or "text"), "refresh" and "boards".
+        :return: The structured result for format "json", the decklist string for "text".
+        :raises ServiceError: For invalid parameters or if the deck cannot be loaded.
+        """
+        try:
+            deck_id = parse_deck_id(str(params.get("deck") or ""))
+        except ValueError as e:
+            raise ServiceError(400, str(e))
+        selected_tags = params.get("tags") or []
+        if isinstance(selected_tags, str):
+            selected_tags = [tag for tag in selected_tags.split(",") if tag]
+        selected_tags = list(dict.fromkeys(str(tag).strip() for tag in selected_tags))
+        output_format = params.get("format", "json")
+        if output_format not in ("json", "text"):
+            raise ServiceError(400, f"Unknown format '{output_format}', expected 'json' or 'text'.")
+        boards = params.get("boards") or DEFAULT_BOARDS
+        if isinstance(boards, str):
+            boards = boards.split(",")
+        if not isinstance(boards, (list, tuple)) or not all(isinstance(board, str) for board in boards):
+            raise ServiceError(400, "boards must be a list of board names or a comma-separated string.")
+        boards = tuple(board.strip() for board in boards if board.strip()) or DEFAULT_BOARDS
+        refresh = params.get("refresh") in (True, "1", "true")
+
+        deck_future = self.decks.submit((deck_id, boards, refresh), self._load_deck, deck_id, boards, refresh)
+        try:
+            deck_data = deck_future.result(REQUEST_TIMEOUT)
+        except http_client.RequestException as e:
+            raise ServiceError(502, f"Loading deck {deck_id} failed: {e}")
+        return self.executor.submit(self._tag_deck, deck_id, deck_data, selected_tags,
+                                    output_format).result(REQUEST_TIMEOUT)
+
+
+class TaggingRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a TaggingService, set as class attribute `service`."""
+
+    service: TaggingService = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Zugriffe nicht einzeln ausgeben
+
+    def _send(self, status: int, body, content_type: str = "application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, params: Dict[str, Any]):
+        with metrics.timer("service_request"):
+            try:
+                result = self.service.tag(params)
+            except ServiceError as e:
+                metrics.inc("service_errors", status=e.status)
+                self._send(e.status, {"error": str(e)})
+                return
+            except Exception as e:
+                metrics.inc("service_errors", status=500)
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            if isinstance(result, str):
+                self._send(200, result, "text/plain")
+            else:
+                self._send(200, result)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._send(200, {"status": "ok", "tags_version": get_tag_store().version})
+        elif url.path == "/metrics":
+            self._send(200, metrics.registry.to_prometheus(), "text/plain")
+        elif url.path == "/tag":
+            self._handle({key: values[-1] for key, values in parse_qs(url.query).items()})
+        else:
+            self._send(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/tag":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "Request body too large"})
+            return
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "The request body is not valid JSON"})
+            return
+        if not isinstance(params, dict):
+            self._send(400, {"error": "The request body must be a JSON object"})
+            return
+        self._handle(params)
+
+
+class TaggingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Standard ist 5, bei vielen parallelen Clients gehen sonst Verbindungen verloren
+
+
+def make_server(service: TaggingService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> TaggingHTTPServer:
+    """
+    :return: A threading HTTP server answering with the given service; call serve_forever() to run it.
+    """
+    handler = type("BoundTaggingRequestHandler", (TaggingRequestHandler,), {"service": service})
+    return TaggingHTTPServer((host, port), handler)
+
+
+def load_tag_tree(path: str = TAG_TREE_PATH) -> dict:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON-Dienst zum Taggen von Moxfield-Decks für andere Werkzeuge.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Anzahl Worker-Threads")
+    parser.add_argument("--tag-tree", default=TAG_TREE_PATH, help="Pfad zum Tag-Baum (Pickle)")
+    parser.add_argument("--metrics", action="store_true", help="Metriken sammeln und unter /metrics ausgeben")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+    service = TaggingService(load_tag_tree(args.tag_tree), workers=args.workers)
+    server = make_server(service, args.host, args.port)
+    print(f"Tagging-Dienst läuft auf http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    # Auch bei SIGTERM sauber beenden, damit close() den Karten-Cache noch speichert
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List
+
+from functions import metrics
+from functions.general_funs import filter_tag_tree
+from functions.tag_tree_index import get_tag_tree_index
+
+
+# Platzhalter-Kind für noch nicht geladene Teilbäume, damit der Knoten aufklappbar bleibt
+PLACEHOLDER_PREFIX = "__placeholder__:"
+PAYLOAD_CACHE_SIZE = 64  # Anzahl Deck-Bäume, die im Speicher gehalten werden
+LAZY_NODE_THRESHOLD = 300  # Ab dieser Knotenzahl wird der Baum standardmäßig schrittweise geladen
+LAZY_DEPTH = 1  # Anzahl Ebenen, die beim schrittweisen Laden sofort gesendet werden
+
+_payload_cache = OrderedDict()
+_payload_cache_lock = threading.Lock()
+
+
+def tag_set_fingerprint(deck_tags: Iterable[str], card_counts: Dict[str, int] = None) -> str:
+    """
+    :param deck_tags: The tags of the deck.
+    :param card_counts: Optional card counts per tag, see count_cards_per_tag.
+    :return: A short hash identifying the tag set (and counts) independent of their order.
+    """
+    digest = hashlib.sha1("\n".join(sorted(set(deck_tags))).encode("utf-8"))
+    if card_counts:
+        digest.update(b"\0")
+        digest.update("\n".join(f"{tag}\t{count}" for tag, count in sorted(card_counts.items())).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def count_cards_per_tag(deck_data: Dict[str, dict], tag_tree: dict) -> Dict[str, int]:
+    """
+    Counts for every tag the cards that have it, either directly or through one of its descendants.
+
+    :param deck_data: The processed deck dictionary with tags for each card.
+    :param tag_tree: The nested tag tree.
+    :return: Mapping tag -> number of cards.
+    """
+    index = get_tag_tree_index(tag_tree)
+    counts = Counter()
+    for card_data in deck_data.values():
+        card_tags = card_data.get("tags")
+        if card_tags:
+            counts.update(set(card_tags).union(index.tags_of(index.ancestor_closure(card_tags))))
+    return dict(counts)
+
+
+class TreeSelectPayload:
+    """
+    The tree_select nodes of one deck tag tree, built once and reused on every rerun.
+
+    The full node list is memoised. For large trees nodes() can instead return only
+    the first levels: collapsed nodes get a single placeholder child, so they stay
+    expandable, and the subtrees of the expanded nodes are added on demand. Labels
+    are annotated with the number of cards below the node.
+
+    :param tag_tree: The nested tag tree.
+    :param deck_tags: The tags present in the deck.
+    :param card_counts: Optional card counts per tag, see count_cards_per_tag.
+    """
+
+    def __init__(self, tag_tree: dict, deck_tags: Iterable[str], card_counts: Dict[str, int] = None):
+        deck_tags = list(deck_tags)
+        self.fingerprint = tag_set_fingerprint(deck_tags, card_counts)
+        self.deck_tree = filter_tag_tree(tag_tree, deck_tags)
+        self.card_counts = card_counts or {}
+        self.node_count = 0
+        stack = [self.deck_tree]
+        while stack:
+            subtree = stack.pop()
+            self.node_count += len(subtree)
+            stack.extend(sub_tags for sub_tags in subtree.values() if sub_tags)
+        self._full_nodes = None
+        self._lazy = (None, None)  # (Schlüssel, Knoten) der letzten schrittweisen Auswahl
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    def _label(self, tag: str) -> str:
+        count = self.card_counts.get(tag)
+        return f"{tag} ({count})" if count else tag
+
+    def _build(self, subtree: dict, depth, expanded) -> List[dict]:
+        nodes = []
+        for tag, sub_tags in subtree.items():
+            node = {"label": self._label(tag), "value": tag}
+            if sub_tags:
+                if depth is None or depth > 1 or tag in expanded:
+                    node["children"] = self._build(sub_tags, None if depth is None else depth - 1, expanded)
+                else:
+                    node["children"] = [{"label": "…", "value": PLACEHOLDER_PREFIX + tag,
+                                         "disabled": True, "showCheckbox": False}]
+            nodes.append(node)
+        return nodes
+
+    def nodes(self, expanded: Iterable[str] = None, depth: int = None) -> List[dict]:
+        """
+        :param expanded: Tags whose children are included in any case.
+        :param depth: Number of levels that are always included; None for the whole tree.
+        :return: The nodes for tree_select. The lists are shared and must not be modified.
+        """
+        if depth is None:
+            if self._full_nodes is None:
+                self._full_nodes = self._build(self.deck_tree, None, ())
+            return self._full_nodes
+        key = (depth, frozenset(expanded or ()))
+        cached_key, nodes = self._lazy
+        if key != cached_key:
+            nodes = self._build(self.deck_tree, depth, key[1])
+            # Als Tupel gesetzt, da die Payload zwischen Sitzungen geteilt wird
+            self._lazy = (key, nodes)
+        return nodes
+
+    @staticmethod
+    def checked_tags(checked: Iterable[str]) -> List[str]:
+        """Removes the placeholder values from the checked values returned by tree_select."""
+        return [value for value in checked if not value.startswith(PLACEHOLDER_PREFIX)]
+
+
+@metrics.timed("stage", stage="tree_select_payload")
+def _build_payload(tag_tree, deck_tags, card_counts) -> TreeSelectPayload:
+    return TreeSelectPayload(tag_tree, deck_tags, card_counts)
+
+
+def get_tree_select_payload(tag_tree: dict, deck_tags: Iterable[str], card_counts: Dict[str, int] = None
+                            ) -> TreeSelectPayload:
+    """
+    Returns the memoised payload for a deck, keyed by the fingerprint of its tag set.
+
+    Decks with the same tags (and card counts) share one payload, so reloading or
+    switching back to a deck does not rebuild the node list.
+
+    :param tag_tree: The nested tag tree, must not be modified after the first call.
+    :param deck_tags: The tags present in the deck.
+    :param card_counts: Optional card counts per tag, see count_cards_per_tag.
+    :return: The TreeSelectPayload of the deck.
+    """
+    deck_tags = list(deck_tags)
+    key = (id(tag_tree), tag_set_fingerprint(deck_tags, card_counts))
+    with _payload_cache_lock:
+        cached = _payload_cache.get(key)
+        if cached is not None and cached[0] is tag_tree:
+            _payload_cache.move_to_end(key)
+            metrics.inc("cache_hits", cache="tree_select_payload")
+            return cached[1]
+    metrics.inc("cache_misses", cache="tree_select_payload")
+    payload = _build_payload(tag_tree, deck_tags, card_counts)
+    with _payload_cache_lock:
+        _payload_cache[key] = (tag_tree, payload)
+        _payload_cache.move_to_end(key)
+        while len(_payload_cache) > PAYLOAD_CACHE_SIZE:
+            _payload_cache.popitem(last=False)
+    return payload
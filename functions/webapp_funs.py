@@ -1,27 +1,491 @@
+import atexit
 import os
 import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 
+from functions import metrics
+from functions.card_cache import get_card_cache
+from functions.general_funs import DEFAULT_BOARDS, get_decklist, parse_deck_id, process_deck
+from functions.tag_index import DeckTagIndex, load_tag_index, save_tag_index
+from functions.tag_store import get_tag_store
+
+
+# Der Cache-Ordner liegt unabhängig vom Arbeitsordner im Projektordner und wird erst beim ersten Schreiben angelegt;
+# MTG_TAGGER_CACHE_FOLDER legt ihn woanders hin, z.B. für den Lasttest
+CACHE_FOLDER_ENV_VAR = "MTG_TAGGER_CACHE_FOLDER"
+cache_folder = (os.environ.get(CACHE_FOLDER_ENV_VAR)
+                or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache"))
+
+# Version des Cache-Formats, bei Änderungen an der Struktur der verarbeiteten Decks erhöhen
+CACHE_SCHEMA_VERSION = 2
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # Einträge verfallen nach einer Woche
+# Abgelaufene Einträge bleiben als Grundlage für die inkrementelle Aktualisierung liegen und werden
+# erst gelöscht, wenn sie so lange nicht mehr benutzt wurden
+CACHE_MAX_UNUSED_SECONDS = 4 * CACHE_TTL_SECONDS
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Obergrenze für alle processed_deck_*.pkl Dateien
+HOT_CACHE_SIZE = 64  # Anzahl Decks, die zusätzlich im Speicher gehalten werden
+# Die Verdrängung listet den ganzen Cache-Ordner, sie läuft daher nicht bei jedem Speichern, sondern
+# höchstens alle EVICTION_INTERVAL Sekunden oder nach EVICTION_BYTES geschriebenen Bytes
+EVICTION_INTERVAL = 60
+EVICTION_BYTES = CACHE_MAX_BYTES // 16
+
+# Invertierter Index Tag -> (Deck, Karte) über alle zwischengespeicherten Decks
+TAG_INDEX_PATH = os.path.join(cache_folder, "tag_index.pkl")
+TAG_INDEX_SAVE_INTERVAL = 30  # Sekunden zwischen zwei Schreibvorgängen des Index
+
+_hot_cache = OrderedDict()
+_hot_cache_lock = threading.Lock()
+
+_tag_index = None
+_tag_index_lock = threading.RLock()
+_tag_index_saved = 0.0
+
+_eviction_lock = threading.Lock()
+_evicted_at = 0.0
+_bytes_since_eviction = 0
 
-# Erstelle den Cache-Ordner, falls er noch nicht existiert
-cache_folder = "cache"
-if not os.path.exists(cache_folder):
-    os.makedirs(cache_folder)
 
 def get_processed_deck_cache_filename(deck_id_or_url):
-    """Generiert den Cache-Dateinamen basierend auf der Deck-ID und speichert es im Cache-Ordner."""
-    deck_id = deck_id_or_url.split("/")[-1]  # Extrahiere die Deck-ID aus der URL (falls nötig)
+    """Generiert den Cache-Dateinamen basierend auf der normalisierten Deck-ID und speichert es im Cache-Ordner."""
+    deck_id = parse_deck_id(deck_id_or_url)
     return os.path.join(cache_folder, f"processed_deck_{deck_id}.pkl")
 
-def load_cached_processed_deck(deck_id_or_url):
-    """Lädt das zwischengespeicherte, verarbeitete Deck basierend auf der Deck-ID, wenn es existiert."""
-    cache_filename = get_processed_deck_cache_filename(deck_id_or_url)
-    if os.path.exists(cache_filename):
+
+def _hot_cache_get(deck_id, tags_version):
+    """Liefert einen noch gültigen Eintrag aus dem Speicher oder None."""
+    with _hot_cache_lock:
+        entry = _hot_cache.get(deck_id)
+        if entry is None:
+            return None
+        if not _is_valid_entry(entry, tags_version):
+            del _hot_cache[deck_id]
+            return None
+        _hot_cache.move_to_end(deck_id)
+        return entry
+
+
+def _hot_cache_put(deck_id, entry):
+    """Legt einen Eintrag im Speicher ab und verdrängt die am längsten ungenutzten."""
+    with _hot_cache_lock:
+        _hot_cache[deck_id] = entry
+        _hot_cache.move_to_end(deck_id)
+        while len(_hot_cache) > HOT_CACHE_SIZE:
+            _hot_cache.popitem(last=False)
+
+
+def _is_valid_entry(entry, tags_version):
+    """Prüft Format, Schema- und Tag-Version sowie das Alter eines Cache-Eintrags."""
+    return (isinstance(entry, dict)
+            and entry.get("schema") == CACHE_SCHEMA_VERSION
+            and entry.get("tags_version") == tags_version
+            and time.time() - entry.get("created", 0) < CACHE_TTL_SECONDS)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _deck_id_from_filename(path):
+    return os.path.basename(path)[len("processed_deck_"):-len(".pkl")]
+
+
+def _cache_file_stamp(path):
+    """
+    Stempel einer Cache-Datei, der sich bei jedem Schreiben (neue Datei durch os.replace)
+    ändert, oder None, wenn die Datei fehlt. Zugriffe ändern nur die atime und damit den
+    Stempel nicht.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _remove_cache_file(path):
+    """
+    Löscht eine Cache-Datei und nimmt das Deck aus dem Tag-Index, falls dieser geladen ist.
+
+    Ist der Index nicht geladen, wird das Deck beim nächsten Laden durch den Abgleich mit
+    dem Cache-Ordner entfernt, siehe _sync_tag_index.
+    """
+    _remove_file(path)
+    with _tag_index_lock:
+        if _tag_index is not None:
+            _tag_index.remove_deck(_deck_id_from_filename(path))
+
+
+def _sync_tag_index(index):
+    """
+    Gleicht den Tag-Index mit dem Cache-Ordner ab.
+
+    Decks ohne Cache-Datei werden entfernt, neue und seit dem Indexieren geänderte Dateien
+    neu eingelesen. So fallen auch Änderungen anderer Prozesse und nach einem Absturz nicht
+    mehr geschriebene Index-Änderungen auf.
+
+    :return: Ob sich der Index geändert hat.
+    """
+    stamps = {}
+    for filename in _cache_filenames():
+        path = os.path.join(cache_folder, filename)
+        stamp = _cache_file_stamp(path)
+        if stamp is not None:
+            stamps[_deck_id_from_filename(filename)] = (path, stamp)
+
+    changed = False
+    for deck_id in [deck_id for deck_id in index.deck_postings if deck_id not in stamps]:
+        index.remove_deck(deck_id)
+        changed = True
+    for deck_id, (path, stamp) in stamps.items():
+        if deck_id in index.deck_postings and index.deck_stamps.get(deck_id) == stamp:
+            continue
+        entry = _read_cache_entry(path)
+        if entry is not None:
+            index.update_deck(deck_id, entry["data"], stamp)
+            changed = True
+        elif deck_id in index.deck_postings:
+            index.remove_deck(deck_id)
+            changed = True
+    return changed
+
+
+def get_deck_tag_index():
+    """Liefert den Tag-Index über den Deck-Cache; beim ersten Aufruf wird der gespeicherte Index geladen (oder neu aufgebaut) und mit dem Cache abgeglichen."""
+    global _tag_index
+    with _tag_index_lock:
+        if _tag_index is None:
+            index = load_tag_index(TAG_INDEX_PATH)
+            if index is None:
+                index = DeckTagIndex()
+            if _sync_tag_index(index) or not os.path.exists(TAG_INDEX_PATH):
+                save_tag_index(index, TAG_INDEX_PATH)
+            _tag_index = index
+        return _tag_index
+
+
+def flush_deck_tag_index(force=True):
+    """Schreibt den Tag-Index, mit force=False höchstens alle TAG_INDEX_SAVE_INTERVAL Sekunden."""
+    global _tag_index_saved
+    with _tag_index_lock:
+        if _tag_index is None:
+            return
+        if force or time.time() - _tag_index_saved >= TAG_INDEX_SAVE_INTERVAL:
+            save_tag_index(_tag_index, TAG_INDEX_PATH)
+            _tag_index_saved = time.time()
+
+
+# Nicht geschriebene Index-Änderungen beim Beenden sichern
+atexit.register(flush_deck_tag_index)
+
+
+def query_cached_decks(expression, tag_tree=None, level="deck"):
+    """Beantwortet eine boolesche Tag-Abfrage (AND/OR/NOT) über alle zwischengespeicherten Decks, siehe DeckTagIndex.query."""
+    index = get_deck_tag_index()
+    with _tag_index_lock:
+        return index.query(expression, tag_tree, level)
+
+
+def _read_cache_entry(cache_filename, remove_unreadable=False):
+    """
+    Liest einen Cache-Eintrag ohne Prüfung von Alter und Tag-Version.
+
+    Dateien im alten Format (nur das verarbeitete Deck ohne Metadaten) werden in einen
+    Eintrag des aktuellen Schemas mit tags_version None überführt, damit Oracle IDs und
+    Tags weiterverwendet werden können. Mit remove_unreadable werden Dateien gelöscht,
+    die sich nicht entpickeln lassen.
+
+    :return: Der Eintrag oder None, wenn die Datei fehlt, beschädigt ist oder ein unbekanntes Schema hat.
+    """
+    try:
         with open(cache_filename, "rb") as f:
-            return pickle.load(f)
+            entry = pickle.load(f)
+    except OSError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ValueError, ImportError, IndexError, TypeError):
+        if remove_unreadable:
+            _remove_cache_file(cache_filename)
+        return None
+    if not isinstance(entry, dict):
+        return None
+    if entry.get("schema") == CACHE_SCHEMA_VERSION:
+        return entry
+    if "schema" not in entry:
+        try:
+            created = os.path.getmtime(cache_filename)
+        except OSError:
+            created = 0
+        return {
+            "schema": CACHE_SCHEMA_VERSION,
+            "tags_version": None,
+            "created": created,
+            "deck_id": _deck_id_from_filename(cache_filename),
+            "meta": {},
+            "data": entry,
+        }
     return None
 
-def save_processed_deck(deck_id_or_url, processed_data):
-    """Speichert das verarbeitete Deck (inklusive Tags) als Pickle-Datei basierend auf der Deck-ID im Cache-Ordner."""
-    cache_filename = get_processed_deck_cache_filename(deck_id_or_url)
-    with open(cache_filename, "wb") as f:
-        pickle.dump(processed_data, f)
+
+def load_cached_processed_deck_entry(deck_id_or_url):
+    """Lädt den vollständigen Cache-Eintrag (Daten und Metadaten) eines Decks, wenn er existiert und noch gültig ist."""
+    deck_id = parse_deck_id(deck_id_or_url)
+    tags_version = get_tag_store().version
+
+    entry = _hot_cache_get(deck_id, tags_version)
+    if entry is not None:
+        metrics.inc("cache_hits", cache="deck_memory")
+        return entry
+
+    cache_filename = get_processed_deck_cache_filename(deck_id)
+    if not os.path.exists(cache_filename):
+        metrics.inc("cache_misses", cache="deck_disk")
+        return None
+    with metrics.timer("stage", stage="read_cached_deck"):
+        # Nur beschädigte Dateien werden gelöscht
+        entry = _read_cache_entry(cache_filename, remove_unreadable=True)
+    if entry is None or not _is_valid_entry(entry, tags_version):
+        # Veraltete, abgelaufene oder alte Einträge bleiben liegen, load_processed_deck übernimmt daraus Oracle IDs und Tags
+        metrics.inc("cache_misses", cache="deck_disk")
+        return None
+
+    # Nur die Zugriffszeit für die LRU-Verdrängung aktualisieren, die mtime ändert sich nur beim Schreiben
+    # (darauf beruhen der Stempel im Tag-Index und der Fingerprint der Auswertungen)
+    try:
+        os.utime(cache_filename, ns=(time.time_ns(), os.stat(cache_filename).st_mtime_ns))
+    except FileNotFoundError:
+        # Seit dem Lesen verdrängt oder von einem anderen Prozess gelöscht
+        metrics.inc("cache_misses", cache="deck_disk")
+        return None
+    metrics.inc("cache_hits", cache="deck_disk")
+    _hot_cache_put(deck_id, entry)
+    return entry
+
+
+def load_cached_processed_deck(deck_id_or_url):
+    """Lädt das zwischengespeicherte, verarbeitete Deck basierend auf der Deck-ID, wenn es existiert und noch gültig ist."""
+    entry = load_cached_processed_deck_entry(deck_id_or_url)
+    return None if entry is None else entry["data"]
+
+
+def _write_cache_entry(cache_filename, entry):
+    """Schreibt einen Cache-Eintrag atomar."""
+    os.makedirs(cache_folder, exist_ok=True)
+    # Erst in eine temporäre Datei schreiben und dann umbenennen, damit parallele Sitzungen nie halbe Dateien lesen
+    fd, tmp_filename = tempfile.mkstemp(dir=cache_folder, prefix=".processed_deck_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, cache_filename)
+    except BaseException:
+        _remove_file(tmp_filename)
+        raise
+
+
+@metrics.timed("stage", stage="save_processed_deck")
+def save_processed_deck(deck_id_or_url, processed_data, meta=None):
+    """Speichert das verarbeitete Deck (inklusive Tags und optionaler Metadaten) atomar als Pickle-Datei im Cache-Ordner."""
+    deck_id = parse_deck_id(deck_id_or_url)
+    entry = {
+        "schema": CACHE_SCHEMA_VERSION,
+        "tags_version": get_tag_store().version,
+        "created": time.time(),
+        "deck_id": deck_id,
+        "meta": meta or {},
+        "data": processed_data,
+    }
+
+    cache_filename = get_processed_deck_cache_filename(deck_id)
+    _write_cache_entry(cache_filename, entry)
+    _hot_cache_put(deck_id, entry)
+
+    stamp = _cache_file_stamp(cache_filename)
+    index = get_deck_tag_index()
+    with _tag_index_lock:
+        index.update_deck(deck_id, processed_data, stamp)
+    flush_deck_tag_index(force=False)
+
+    _maybe_evict_processed_deck_cache(stamp[2] if stamp is not None else 0)
+
+
+def _cache_filenames(folder=None):
+    """Sortierte Dateinamen aller processed_deck_*.pkl Dateien, leer solange der Cache-Ordner fehlt."""
+    folder = cache_folder if folder is None else folder
+    if not os.path.isdir(folder):
+        return []
+    return sorted(filename for filename in os.listdir(folder)
+                  if filename.startswith("processed_deck_") and filename.endswith(".pkl"))
+
+
+def _maybe_evict_processed_deck_cache(bytes_written):
+    """Startet die Verdrängung, wenn seit dem letzten Lauf EVICTION_INTERVAL Sekunden vergangen oder EVICTION_BYTES geschrieben sind."""
+    global _evicted_at, _bytes_since_eviction
+    with _eviction_lock:
+        _bytes_since_eviction += bytes_written
+        if time.time() - _evicted_at < EVICTION_INTERVAL and _bytes_since_eviction < EVICTION_BYTES:
+            return
+        _evicted_at = time.time()
+        _bytes_since_eviction = 0
+    evict_processed_deck_cache()
+
+
+def evict_processed_deck_cache(max_bytes=CACHE_MAX_BYTES, max_unused_seconds=CACHE_MAX_UNUSED_SECONDS):
+    """
+    Löscht Cache-Dateien, die länger als max_unused_seconds nicht benutzt wurden, und danach
+    die am längsten ungenutzten, bis der Cache unter max_bytes liegt. Die letzte Benutzung ist
+    die atime, die beim Schreiben und bei jedem Treffer gesetzt wird.
+
+    Nur abgelaufene Einträge (älter als CACHE_TTL_SECONDS) werden hier nicht gelöscht, da
+    load_processed_deck sie noch als Grundlage für die Aktualisierung verwendet.
+    """
+    now = time.time()
+    files = []
+    for filename in _cache_filenames():
+        path = os.path.join(cache_folder, filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if now - stat.st_atime >= max_unused_seconds:
+            _remove_cache_file(path)
+        else:
+            files.append((stat.st_atime, stat.st_size, path))
+
+    total_bytes = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total_bytes <= max_bytes:
+            break
+        _remove_cache_file(path)
+        total_bytes -= size
+
+
+def iter_cached_processed_decks(folder=None):
+    """
+    Liefert (Deck-ID, verarbeitetes Deck) für alle lesbaren Cache-Dateien, auch im alten Format ohne Metadaten.
+
+    :param folder: Ein anderer Cache-Ordner als cache_folder, z.B. für die Auswertungen.
+    """
+    folder = cache_folder if folder is None else folder
+    for filename in _cache_filenames(folder):
+        entry = _read_cache_entry(os.path.join(folder, filename))
+        if entry is not None:
+            yield _deck_id_from_filename(filename), entry["data"]
+
+
+def apply_card_tag_changes(old_version, tag_store, changed_oracle_ids):
+    """
+    Überführt den Deck-Cache nach einer Aktualisierung der Karten-Tags auf die neue Store-Version.
+
+    Nur Karten mit geänderten Oracle IDs bekommen neue Tags aus tag_store, alle übrigen
+    Einträge werden lediglich auf die neue Version umgestellt; Alter und Metadaten bleiben
+    erhalten. Einträge im alten Format ohne Tag-Version werden vollständig neu getaggt,
+    Einträge einer anderen Version sind ohnehin ungültig und werden nicht angefasst.
+
+    :return: Ein Dictionary mit der Anzahl umgestellter (migrated) und neu getaggter (patched) Decks.
+    """
+    changed_oracle_ids = set(changed_oracle_ids)
+    counts = {"migrated": 0, "patched": 0, "skipped": 0}
+    for filename in _cache_filenames():
+        cache_filename = os.path.join(cache_folder, filename)
+        # Vor dem Lesen, das Lesen selbst kann die atime bereits ändern
+        try:
+            stat = os.stat(cache_filename)
+        except FileNotFoundError:
+            continue
+        entry = _read_cache_entry(cache_filename)
+        if entry is None or entry.get("tags_version") not in (old_version, None):
+            counts["skipped"] += 1
+            continue
+
+        retag_all = entry.get("tags_version") is None
+        patched = False
+        for card_data in entry["data"].values():
+            if "oracle_id" in card_data and (retag_all or card_data["oracle_id"] in changed_oracle_ids):
+                card_data["tags"] = tag_store.get_tags(card_data["oracle_id"])
+                patched = True
+        entry["tags_version"] = tag_store.version
+        # Zugriffszeit für die LRU-Verdrängung beibehalten, die neue mtime zeigt die Änderung an
+        _write_cache_entry(cache_filename, entry)
+        stamp = _cache_file_stamp(cache_filename)
+        os.utime(cache_filename, ns=(stat.st_atime_ns, stamp[1]))
+
+        deck_id = entry.get("deck_id") or _deck_id_from_filename(cache_filename)
+        with _hot_cache_lock:
+            if deck_id in _hot_cache:
+                _hot_cache[deck_id] = entry
+        index = get_deck_tag_index()
+        with _tag_index_lock:
+            if patched:
+                index.update_deck(deck_id, entry["data"], stamp)
+            elif deck_id in index.deck_postings:
+                index.deck_stamps[deck_id] = stamp
+        counts["patched" if patched else "migrated"] += 1
+
+    flush_deck_tag_index()
+    return counts
+
+
+def get_deck_meta(deck_data, boards):
+    """Metadaten, an denen eine Änderung des Decks auf Moxfield erkannt wird."""
+    return {"last_updated": deck_data.get("lastUpdatedAtUtc"), "boards": list(boards)}
+
+
+def get_cached_processed_deck(deck_id_or_url, boards=DEFAULT_BOARDS):
+    """Das gültige zwischengespeicherte Deck, sofern es mit denselben Boards verarbeitet wurde, sonst None."""
+    entry = load_cached_processed_deck_entry(deck_id_or_url)
+    if entry is not None and entry.get("meta", {}).get("boards", list(DEFAULT_BOARDS)) == list(boards):
+        return entry["data"]
+    return None
+
+
+def compare_with_cached_deck(deck_id_or_url, deck_data, boards=DEFAULT_BOARDS):
+    """
+    Vergleicht ein frisch von Moxfield geladenes Deck mit seinem Cache-Eintrag (auch einem abgelaufenen).
+
+    :return: (meta, previous, unchanged, reuse_tags): die Metadaten des Decks, das bisher verarbeitete
+             Deck oder None, ob dieses unverändert übernommen werden kann und ob seine Tags noch aktuell sind.
+    """
+    previous = _read_cache_entry(get_processed_deck_cache_filename(deck_id_or_url))
+    meta = get_deck_meta(deck_data, boards)
+    if previous is None:
+        return meta, None, False, False
+    reuse_tags = previous.get("tags_version") == get_tag_store().version
+    return meta, previous["data"], reuse_tags and previous.get("meta") == meta, reuse_tags
+
+
+@metrics.timed("stage", stage="load_processed_deck")
+def load_processed_deck(deck_id_or_url, refresh=False, boards=DEFAULT_BOARDS, persist=True):
+    """
+    Liefert das verarbeitete Deck aus dem Cache oder lädt und verarbeitet es über die APIs.
+
+    Mit refresh=True wird das Deck immer neu von Moxfield geladen. Hat es sich seit dem
+    Cache-Eintrag geändert, werden nur neue oder geänderte Drucke aufgelöst, der Rest
+    wird aus dem vorhandenen Eintrag übernommen. Das gilt auch für abgelaufene Einträge
+    und solche einer älteren Tag-Version (dann nur die Oracle IDs), da der Cache diese
+    erst bei der Verdrängung löscht, siehe evict_processed_deck_cache.
+
+    Mit persist=False wird der Karten-Cache nicht nach jedem Deck geschrieben; der Aufrufer
+    speichert ihn dann selbst mit get_card_cache().save(), z.B. einmal am Ende eines Batches.
+    """
+    deck_id = parse_deck_id(deck_id_or_url)
+    if not refresh:
+        cached = get_cached_processed_deck(deck_id, boards)
+        if cached is not None:
+            return cached
+
+    deck_data = get_decklist(deck_id)
+    meta, previous, unchanged, reuse_tags = compare_with_cached_deck(deck_id, deck_data, boards)
+    if unchanged:
+        # Unverändert: nur den Eintrag erneuern
+        processed_data = previous
+    else:
+        processed_data = process_deck(deck_data, previous=previous, boards=boards, reuse_tags=reuse_tags)
+
+    save_processed_deck(deck_id, processed_data, meta=meta)
+    if persist:
+        get_card_cache().save()
+    return processed_data
@@ -2,82 +2,122 @@ import streamlit as st
 from streamlit_tree_select import tree_select
 import pickle
 import os
-from functions.general_funs import *
-from functions.webapp_funs import *
+from functions.general_funs import extract_unique_tags, parse_deck_id
+from functions.webapp_funs import load_cached_processed_deck_entry, load_processed_deck
+from functions.deck_render import DeckRenderModel
+from functions.tag_store import get_tag_store
+from functions.tag_tree_index import get_tag_tree_index
+from functions.tree_select_payload import (LAZY_DEPTH, LAZY_NODE_THRESHOLD, count_cards_per_tag,
+                                           get_tree_select_payload)
+from functions import metrics
 
 
+TAG_TREE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tag_trees', 'cleaned_tag_tree.pkl')
 
 
-# Lade Tag Tree
-with open('./tag_trees/cleaned_tag_tree.pkl', "rb") as f:
-    tag_tree = pickle.load(f)
+# Streamlit führt das Skript bei jeder Interaktion neu aus, die Ressourcen werden nur einmal pro Prozess geladen
+@st.cache_resource
+def load_tag_tree():
+    """Lädt den Tag Tree und baut seinen Index."""
+    with open(TAG_TREE_PATH, "rb") as f:
+        tag_tree = pickle.load(f)
+    get_tag_tree_index(tag_tree)
+    return tag_tree
+
+
+@st.cache_resource
+def load_tag_store():
+    """Öffnet den Tag-Store (und baut ihn, falls card_tags_dict.pkl neuer ist)."""
+    return get_tag_store()
 
 
 def main():
     # Titel der App
     st.title("MTG Deck Tagger")
 
+    tag_tree = load_tag_tree()
+    load_tag_store()
+
     # Eingabe der Moxfield Deck-ID oder URL
     deck_id_or_url = st.text_input("Gib die Moxfield Deck-ID oder den vollständigen Link ein:", "")
 
     if deck_id_or_url:
+        try:
+            deck_id = parse_deck_id(deck_id_or_url)
+        except ValueError as e:
+            st.error(f"Ungültige Deck-ID oder URL: {e}")
+            return
+
+        # Deck neu von Moxfield laden, nur geänderte Karten werden neu aufgelöst
+        refresh = st.button("Deck aktualisieren")
+
         # Versuche, das zwischengespeicherte, verarbeitete Deck zu laden
-        processed_deck_data = load_cached_processed_deck(deck_id_or_url)
+        entry = None if refresh else load_cached_processed_deck_entry(deck_id)
 
-        if processed_deck_data is None:
+        if entry is None:
             # Wenn das verarbeitete Deck nicht gefunden wurde, lade es über die API und verarbeite es
             try:
                 with st.spinner("Lade und verarbeite Deck... bitte warten."):
-                    # Deck von Moxfield laden
-                    deck_data = get_decklist(deck_id_or_url)
-                
-                    # Verarbeite das Deck
-                    flat_deck = flatten_dict(deck_data)
-                    deck_dict = extract_card_data(flat_deck)
-                    deck_dict_with_oracle_ids = add_oracle_ids(deck_dict)
-                    deck_dict_with_tags = add_tags_to_deck(deck_dict_with_oracle_ids)
-                
-                    # Speichern des verarbeiteten Decks nach der ersten Verarbeitung
-                    save_processed_deck(deck_id_or_url, deck_dict_with_tags)
+                    load_processed_deck(deck_id, refresh=True)
+                    # Der gerade gespeicherte Eintrag kommt aus dem Speicher-Cache
+                    entry = load_cached_processed_deck_entry(deck_id)
+                    if entry is None:
+                        raise RuntimeError("Das Deck konnte nicht zwischengespeichert werden.")
                     st.toast("Deck erfolgreich geladen, verarbeitet und zwischengespeichert.")
             except Exception as e:
                 st.error(f"Fehler beim Laden und Verarbeiten des Decks: {e}")
                 return
         else:
             st.toast("Verarbeitete Deckdaten aus dem Cache geladen.")
-            deck_dict_with_tags = processed_deck_data
-
-        # 2. Extrahiere einzigartige Tags aus dem Deck
-        all_tags = sorted(extract_unique_tags(deck_dict_with_tags))
-        deck_tag_tree = filter_tag_tree(tag_tree, all_tags)
+        deck_dict_with_tags = entry["data"]
+
+        # 2. Baum der Deck-Tags, pro Deck nur einmal berechnet und über den Tag-Fingerabdruck geteilt;
+        # Tag-Version und Zeitstempel des Eintrags ändern sich bei jedem Neuladen und jeder Tag-Aktualisierung
+        render_key = (deck_id, entry["tags_version"], entry["created"])
+        if st.session_state.get("tree_payload_key") != render_key:
+            all_tags = sorted(extract_unique_tags(deck_dict_with_tags))
+            card_counts = count_cards_per_tag(deck_dict_with_tags, tag_tree)
+            st.session_state["tree_payload"] = get_tree_select_payload(tag_tree, all_tags, card_counts)
+            st.session_state["tree_payload_key"] = render_key
+        payload = st.session_state["tree_payload"]
+
+        # Große Bäume zunächst nur mit den obersten Ebenen senden, Teilbäume erst beim Aufklappen
+        lazy = st.sidebar.checkbox("Tag-Baum schrittweise laden", value=len(payload) > LAZY_NODE_THRESHOLD,
+                                   key=f"lazy_tree_{payload.fingerprint}")
 
         # --- Scrollbarer Container für die Checkboxen ---
         with st.container(height=500):
             # Nutze den gesamten verfügbaren Platz für den Container
             selected_tags = []
-            with st.form('Select Tags'):
-                sub_commit = st.form_submit_button('Deckstring generieren')
-                nodes = convert_to_tree_select_format(deck_tag_tree)
-                selected_tags = tree_select(nodes, no_cascade=True)["checked"]
-                
+            if lazy:
+                # Ohne Formular, damit das Aufklappen sofort einen Lauf auslöst
+                tree_key = f"tag_tree_{payload.fingerprint}"
+                loaded = st.session_state.setdefault(f"{tree_key}_loaded", set())
+                loaded.update((st.session_state.get(tree_key) or {}).get("expanded", []))
+                result = tree_select(payload.nodes(loaded, depth=LAZY_DEPTH), no_cascade=True, key=tree_key)
+                if not loaded.issuperset(result["expanded"]):
+                    # Aufgeklappter Teilbaum ist noch nicht geladen
+                    loaded.update(result["expanded"])
+                    st.rerun()
+                selected_tags = payload.checked_tags(result["checked"])
+                # Jede Interaktion löst einen Lauf aus, der Deckstring bleibt nach dem ersten Klick sichtbar
+                if st.button('Deckstring generieren'):
+                    st.session_state[f"{tree_key}_render"] = True
+                sub_commit = st.session_state.get(f"{tree_key}_render", False)
+            else:
+                with st.form('Select Tags'):
+                    sub_commit = st.form_submit_button('Deckstring generieren')
+                    selected_tags = tree_select(payload.nodes(), no_cascade=True)["checked"]
+
         # 3. Button zum Generieren des Deckstrings
         if sub_commit:
-            # Generiere den Deckstring
-            deck_string = ""
-
-            # Sortiere deck_dict nach Kartennamen
-            sorted_deck_data = sorted(deck_dict_with_tags.items(), key=lambda item: item[1].get('name', '').lower())
-
-            for idx, (card_key, card) in enumerate(sorted_deck_data):
-                # Hole relevante Informationen
-                quantity = card.get("quantity", 0)
-                name = card.get("name", "")
-                card_set = card.get("set", "").upper()  # Set in Großbuchstaben
-                cn = card.get("cn", "")
-                tags = " ".join([f"#{tag}" for tag in get_matching_tags(selected_tags, tag_tree, card.get('tags', []))])
+            # Render-Modell pro Deck in der Sitzung halten, bei geänderter Auswahl werden nur betroffene Zeilen neu gebaut
+            if st.session_state.get("render_model_key") != render_key:
+                st.session_state["render_model"] = DeckRenderModel(deck_dict_with_tags, tag_tree)
+                st.session_state["render_model_key"] = render_key
 
-                # Baue den Deckstring
-                deck_string += f"{quantity} {name} ({card_set}) {cn} {tags}\n"
+            # Generiere den Deckstring
+            deck_string = st.session_state["render_model"].render(selected_tags)
 
             # Zeige den generierten Deckstring an
             with st.container(height=300):
@@ -87,5 +127,20 @@ def main():
     else:
         st.warning("Bitte gib eine Deck-ID oder URL ein!")
 
+def show_metrics():
+    """Debug-Panel mit allen Messwerten, nur bei aktivierten Metriken (MTG_TAGGER_METRICS=1)."""
+    if not metrics.is_enabled():
+        return
+    with st.sidebar.expander("Metriken", expanded=True):
+        snapshot = metrics.registry.snapshot()
+        st.caption("Zeiten (Sekunden)")
+        st.dataframe(snapshot["timers"], hide_index=True)
+        st.caption("Zähler")
+        st.dataframe(snapshot["counters"], hide_index=True)
+        st.download_button("Prometheus", metrics.registry.to_prometheus(), file_name="metrics.prom")
+        st.download_button("JSON", metrics.registry.to_json(), file_name="metrics.json")
+
+
 if __name__ == "__main__":
     main()
+    show_metrics()
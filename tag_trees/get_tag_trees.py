@@ -1,9 +1,32 @@
+"""
+Lädt die Tagger-Seiten (Tag-Bäume) aller Tags aus card_tags_dict.pkl nach tag_trees/tmp/.
+
+Der Fortschritt wird in tag_trees/tmp/manifest.json festgehalten (Status, ETag,
+Last-Modified und Fehler pro Tag), ein abgebrochener Lauf setzt also dort fort, wo er
+aufgehört hat. Die Seiten werden parallel geladen, alle Worker teilen sich das
+Rate-Limit des http_client. Mit --refresh werden auch bereits geladene Seiten
+geprüft, per If-None-Match/If-Modified-Since, unveränderte Seiten antworten mit 304.
+
+Beispiel:
+    python tag_trees/get_tag_trees.py --workers 8
+    python tag_trees/get_tag_trees.py --refresh
+    python tag_trees/get_tag_trees.py --base-url http://127.0.0.1:8000 --tags-file tags.txt
+"""
+import argparse
+import json
+import os
 import pickle
-from bs4 import BeautifulSoup
-import requests
+import sys
+import tempfile
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
+
+from bs4 import BeautifulSoup
 from tqdm import tqdm
-import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions import http_client
 
 # Header für alle API requests
 header = {
@@ -11,31 +34,193 @@ header = {
     "Accept": '*/*'
 }
 
-# Globale Variable für das Rate-Limit
-SCRYFALL_RATE_LIMIT = 10  # Maximal 10 Abfragen pro Sekunde
-SLEEP_TIME = 1 / SCRYFALL_RATE_LIMIT  # Berechnet die Zeit, die wir zwischen den Anfragen warten müssen
+TAG_TREE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+HTML_FOLDER = os.path.join(TAG_TREE_FOLDER, "tmp")
+MANIFEST_FILENAME = "manifest.json"
+CARD_TAGS_PATH = os.path.join(os.path.dirname(TAG_TREE_FOLDER), "ressources", "card_tags_dict.pkl")
+TAGGER_BASE_URL = "https://tagger.scryfall.com"
+MANIFEST_SAVE_INTERVAL = 50  # Einträge zwischen zwei Zwischenspeicherungen
+
+# Status pro Tag im Manifest
+SAVED = "saved"  # Seite mit Baum gespeichert
+NO_TREE = "no_tree"  # Seite geladen, aber ohne Baum (nicht gespeichert)
+FAILED = "failed"  # Fehler, wird beim nächsten Lauf erneut versucht
+DONE = (SAVED, NO_TREE)
+
+
+def load_all_tags(card_tags_path=CARD_TAGS_PATH):
+    """Alle Tags, die in card_tags_dict.pkl vorkommen, sortiert."""
+    with open(card_tags_path, "rb") as f:
+        card_tags = pickle.load(f)
+    all_tags = set()
+    for tags in card_tags.values():
+        all_tags.update(tags)
+    return sorted(all_tags)
+
+
+def load_manifest(path):
+    """Das Manifest eines früheren Laufs oder ein leeres Manifest."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest, path):
+    """Schreibt das Manifest atomar."""
+    folder = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".manifest_", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _write_html(path, content):
+    folder = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tag_", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
 
-with open('../ressources/card_tags_dict.pkl', "rb") as f:
-    deck = pickle.load(f)
+def fetch_tag_tree(tag, entry, html_folder=HTML_FOLDER, base_url=TAGGER_BASE_URL):
+    """
+    Lädt die Tagger-Seite eines Tags und speichert sie, wenn sie einen Baum enthält.
 
-all_tags = set()
-for card_key, card_data in deck.items():
-    [all_tags.add(tag) for tag in card_data]
+    :param tag: Der Tag.
+    :param entry: Der bisherige Manifest-Eintrag des Tags (für ETag/Last-Modified).
+    :param html_folder: Zielordner der HTML-Dateien.
+    :param base_url: Basis-URL des Taggers, z.B. für einen lokalen Testserver.
+    :return: Der neue Manifest-Eintrag.
+    """
+    html_path = os.path.join(html_folder, f"{tag}.html")
+    request_headers = dict(header)
+    # Bedingte Abfrage nur, wenn der gespeicherte Stand noch vorhanden ist
+    if entry.get("status") == NO_TREE or (entry.get("status") == SAVED and os.path.exists(html_path)):
+        if entry.get("etag"):
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            request_headers["If-Modified-Since"] = entry["last_modified"]
 
-all_tags = sorted(all_tags)
+    response = http_client.get(f"{base_url}/tags/card/{quote(tag)}/tree", headers=request_headers)
+    checked = time.time()
+    if response.status_code == 304:
+        return dict(entry, checked=checked, unchanged=True)
+    response.raise_for_status()
 
-for tag in tqdm(all_tags):
-    if os.path.exists(f'./tag_trees/tmp/{tag}.html'):
-        next
+    new_entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "checked": checked,
+        "unchanged": False,
+    }
+    soup = BeautifulSoup(response.text, 'html.parser')
+    site_body = soup.find('div', 'site-body')
+    if site_body is not None and len(soup.find_all('div', class_='tags-list__row')) > 2:
+        _write_html(html_path, site_body.prettify())
+        new_entry["status"] = SAVED
     else:
-        tagger_link = f'https://tagger.scryfall.com/tags/card/{tag}/tree'
+        if os.path.exists(html_path):
+            os.remove(html_path)
+        new_entry["status"] = NO_TREE
+    return new_entry
+
+
+def crawl_tag_trees(tags, html_folder=HTML_FOLDER, base_url=TAGGER_BASE_URL, workers=4,
+                    refresh=False, progress=True):
+    """
+    Lädt die Tag-Bäume aller Tags, die laut Manifest noch fehlen oder fehlgeschlagen sind.
+
+    :param tags: Die Tags.
+    :param html_folder: Zielordner der HTML-Dateien und des Manifests.
+    :param base_url: Basis-URL des Taggers.
+    :param workers: Anzahl paralleler Abfragen (das Rate-Limit gilt für alle gemeinsam).
+    :param refresh: Auch bereits geladene Tags bedingt neu abfragen.
+    :param progress: Fortschrittsbalken auf stderr anzeigen.
+    :return: Zähler pro Ergebnis (saved, no_tree, unchanged, failed, skipped) und die Laufzeit.
+    """
+    os.makedirs(html_folder, exist_ok=True)
+    manifest_path = os.path.join(html_folder, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+
+    todo = [tag for tag in tags if refresh or manifest.get(tag, {}).get("status") not in DONE]
+    counts = {SAVED: 0, NO_TREE: 0, "unchanged": 0, FAILED: 0, "skipped": len(tags) - len(todo)}
+    start = time.perf_counter()
+    since_save = 0
+
+    bar = tqdm(total=len(todo), disable=not progress, unit="tag")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        todo_iter = iter(todo)
+
+        def submit_next():
+            tag = next(todo_iter, None)
+            if tag is not None:
+                pending[pool.submit(fetch_tag_tree, tag, manifest.get(tag, {}), html_folder, base_url)] = tag
+
+        for _ in range(workers * 2):
+            submit_next()
+
         try:
-            response = requests.get(tagger_link, headers=header)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            if len(soup.find_all('div', class_='tags-list__row')) > 2:
-                with open(f'./tag_trees/tmp/{tag}.html', 'w', encoding='utf-8') as file:
-                    file.write(soup.find('div', 'site-body').prettify())
-        except:
-            next
-        time.sleep(SLEEP_TIME)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tag = pending.pop(future)
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        entry = dict(manifest.get(tag, {}), status=FAILED, error=f"{type(e).__name__}: {e}",
+                                     attempts=manifest.get(tag, {}).get("attempts", 0) + 1, checked=time.time())
+                    if entry.get("unchanged"):
+                        counts["unchanged"] += 1
+                    else:
+                        counts[entry["status"]] += 1
+                    manifest[tag] = entry
+                    submit_next()
+
+                    since_save += 1
+                    if since_save >= MANIFEST_SAVE_INTERVAL:
+                        save_manifest(manifest, manifest_path)
+                        since_save = 0
+                    bar.update(1)
+                    elapsed = time.perf_counter() - start
+                    bar.set_postfix(failed=counts[FAILED], unchanged=counts["unchanged"],
+                                    rate=f"{bar.n / elapsed:.1f}/s" if elapsed else "-")
+        finally:
+            # Auch bei Abbruch (Strg+C) den bisherigen Stand festhalten
+            for future in pending:
+                future.cancel()
+            save_manifest(manifest, manifest_path)
+            bar.close()
+
+    counts["seconds"] = round(time.perf_counter() - start, 3)
+    counts["tags_per_second"] = round(len(todo) / counts["seconds"], 2) if counts["seconds"] else 0.0
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lädt die Tagger-Seiten aller Tags für den Tag-Baum.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallele Abfragen")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Auch geladene Tags bedingt neu abfragen (unveränderte Seiten werden übersprungen)")
+    parser.add_argument("--tags-file", help="Datei mit einem Tag pro Zeile statt aller Tags aus card_tags_dict.pkl")
+    parser.add_argument("--output-folder", default=HTML_FOLDER, help="Zielordner der HTML-Dateien und des Manifests")
+    parser.add_argument("--base-url", default=TAGGER_BASE_URL, help="Basis-URL des Taggers, z.B. ein lokaler Testserver")
+    parser.add_argument("--no-progress", action="store_true", help="Keinen Fortschrittsbalken anzeigen")
+    args = parser.parse_args(argv)
+
+    if args.tags_file:
+        with open(args.tags_file, "r", encoding="utf-8") as f:
+            tags = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        tags = load_all_tags()
+
+    counts = crawl_tag_trees(tags, html_folder=args.output_folder, base_url=args.base_url.rstrip("/"),
+                             workers=args.workers, refresh=args.refresh, progress=not args.no_progress)
+    print(json.dumps(counts), file=sys.stderr)
+    return 0 if counts[FAILED] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,120 +1,224 @@
+"""
+Baut cleaned_tag_tree.pkl aus den mit get_tag_trees.py geladenen HTML-Dateien in tag_trees/tmp/.
+
+Die Dateien werden in einem Prozess-Pool von einem Streaming-Parser gelesen, der nur die
+tags-list__row Zeilen auswertet. Die Hierarchien werden in place in einen einzigen Baum
+eingefügt und doppelte Tags anschließend in einem Durchlauf entfernt, jeder Tag bleibt
+an seinem ersten Vorkommen.
+
+Beispiel:
+    python tag_trees/parse_tag_tree_htmls.py
+    python tag_trees/parse_tag_tree_htmls.py --check  # mit vorhandener cleaned_tag_tree.pkl vergleichen
+"""
+import argparse
 import os
 import pickle
-from bs4 import BeautifulSoup
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+TAG_TREE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+HTML_FOLDER = os.path.join(TAG_TREE_FOLDER, "tmp")
+TAG_TREE_PATH = os.path.join(TAG_TREE_FOLDER, "cleaned_tag_tree.pkl")
+MAX_DEPTH = 4  # Zeilen ab depth-4 werden ignoriert
 
-def extract_tag_hierarchy_from_html(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    tag_hierarchy = {}
-    parent_stack = []
 
-    for div in soup.find_all('div', class_='tags-list__row'):
-        depth_class = div.get('class', [])
-        depth = next((x for x in depth_class if x.startswith('depth-')), None)
+class _TagRowParser(HTMLParser):
+    """
+    Streaming-Parser, der nur die tags-list__row Zeilen einer Tagger-Seite ausliest.
+
+    Liefert dasselbe wie BeautifulSoup mit find_all('div', class_='tags-list__row') und
+    dem Text des ersten <a> Tags jeder Zeile, ohne einen Dokumentbaum aufzubauen.
+    """
 
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []  # [depth-Klasse, Textteile des ersten <a> oder None]
+        self._div_level = 0
+        self._row_level = None
+        self._a_level = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'div':
+            self._div_level += 1
+            if self._row_level is None:
+                classes = (dict(attrs).get('class') or '').split()
+                if 'tags-list__row' in classes:
+                    self._row_level = self._div_level
+                    self.rows.append([next((x for x in classes if x.startswith('depth-')), None), None])
+        elif tag == 'a' and self._row_level is not None:
+            row = self.rows[-1]
+            if row[1] is None:
+                row[1] = []
+                self._a_level = 1
+            elif self._a_level:
+                self._a_level += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'div':
+            if self._row_level == self._div_level:
+                self._row_level = None
+                self._a_level = 0
+            self._div_level -= 1
+        elif tag == 'a' and self._a_level:
+            self._a_level -= 1
+
+    def handle_data(self, data):
+        if self._a_level:
+            self.rows[-1][1].append(data.strip())
+
+
+def extract_tag_rows(html):
+    """
+    Extrahiert die Zeilen des Tag-Baums einer Tagger-Seite.
+
+    :param html: Der HTML-Inhalt.
+    :return: Liste von (Tiefe, Tag) in Dokumentreihenfolge.
+    """
+    parser = _TagRowParser()
+    parser.feed(html)
+    parser.close()
+
+    rows = []
+    for depth, text_parts in parser.rows:
         if depth:
             depth_number = int(depth.split('-')[1])
-            if depth_number < 4:
-                a_tag = div.find('a')
-            
-                # Überprüfen, ob ein <a> Tag existiert
-                if a_tag:
-                    tag_text = a_tag.get_text(strip=True).replace(' ', '-')
-                else:
-                    continue  # Wenn kein <a> Tag gefunden wird, überspringe dieses Element
+            # Zeilen ohne <a> Tag werden übersprungen
+            if depth_number < MAX_DEPTH and text_parts is not None:
+                rows.append((depth_number, ''.join(text_parts).replace(' ', '-')))
+    return rows
 
-                # Stelle sicher, dass wir die parent_stack korrekt handhaben
-                while len(parent_stack) + 1 > depth_number:
-                    parent_stack.pop()  # Poppe, bis wir die richtige Tiefe haben
 
-                if len(parent_stack) == 0:  # Falls wir bei der obersten Ebene sind
-                    tag_hierarchy[tag_text] = {}
-                    parent_stack.append(tag_hierarchy[tag_text])
-                else:  # Wenn wir tiefer sind
-                    parent_stack[-1][tag_text] = {}
-                    parent_stack.append(parent_stack[-1][tag_text])
+def build_hierarchy(rows):
+    """
+    Baut die verschachtelte Hierarchie einer Seite aus ihren Zeilen.
 
+    :param rows: Liste von (Tiefe, Tag), siehe extract_tag_rows.
+    :return: Verschachteltes Dictionary Tag -> Kinder.
+    """
+    tag_hierarchy = {}
+    parent_stack = []
+    for depth_number, tag_text in rows:
+        # Poppe, bis wir die richtige Tiefe haben
+        while len(parent_stack) + 1 > depth_number:
+            parent_stack.pop()
+        node = tag_hierarchy if not parent_stack else parent_stack[-1]
+        node[tag_text] = {}
+        parent_stack.append(node[tag_text])
     return tag_hierarchy
 
 
-def remove_duplicates_at_lowest_level(hierarchy):
-    tmp_hier = hierarchy.copy()
-    def traverse(node, depth, key_depths):
-        # Traverse the node recursively and record depths of keys
-        for key, child in node.items():
-            # Append the current depth for the key
-            if key not in key_depths:
-                key_depths[key] = []
-            key_depths[key].append(depth)
-            
-            if child:  # If there are nested children, recurse
-                traverse(child, depth + 1, key_depths)
+def extract_tag_hierarchy_from_html(html):
+    return build_hierarchy(extract_tag_rows(html))
+
 
-    def clean(node, depth, key_depths):
-        # Clean duplicates at the current level
-        for key in list(node.keys()):
-            # Remove the key if it appears deeper in the hierarchy
-            if (len(key_depths[key]) > 1) and (max(key_depths[key]) == depth):
-                del node[key]
-            elif node[key]:  # If the key has children, recurse
-                clean(node[key], depth + 1, key_depths)
+def merge_into(target, source):
+    """
+    Fügt source rekursiv in target ein (in place, ohne Kopien).
 
-    # Step 1: Traverse the hierarchy and collect key depths
-    key_depths = {}
-    traverse(tmp_hier, 0, key_depths)
+    Teilbäume, die es in target noch nicht gibt, werden übernommen statt kopiert;
+    source darf danach nicht mehr verwendet werden.
+    """
+    stack = [(target, source)]
+    while stack:
+        target, source = stack.pop()
+        for key, child in source.items():
+            existing = target.get(key)
+            if existing is None:
+                target[key] = child
+            else:
+                stack.append((existing, child))
+    return target
 
-    # Step 2: Clean the hierarchy based on key depths
-    clean(tmp_hier, 0, key_depths)
 
-    return tmp_hier
+def remove_duplicate_tags(hierarchy):
+    """
+    Entfernt mehrfach vorkommende Tags in einem einzigen Durchlauf über den Baum.
 
+    Der Baum wird Ebene für Ebene durchlaufen, innerhalb einer Ebene in der Reihenfolge
+    der zusammengeführten Seiten. Jeder Tag bleibt an seinem ersten Vorkommen, also auf
+    der höchsten Ebene, auf der er vorkommt; spätere Vorkommen werden samt Teilbaum
+    entfernt. Der Baum wird in place verändert.
 
-def merge_dicts(d1, d2):
+    :param hierarchy: Der zusammengeführte Baum.
+    :return: Der bereinigte Baum.
     """
-    Recursively merges two dictionaries without losing information.
+    seen = set()
+    level = [hierarchy]
+    while level:
+        next_level = []
+        for node in level:
+            for key in list(node):
+                if key in seen:
+                    del node[key]
+                else:
+                    seen.add(key)
+                    if node[key]:
+                        next_level.append(node[key])
+        level = next_level
+    return hierarchy
+
+
+def _parse_file(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return extract_tag_rows(file.read())
+
+
+def build_tag_tree(folder_path=HTML_FOLDER, processes=None):
     """
-    merged = {}
-    keys = set(d1.keys()).union(d2.keys())
-    
-    for key in keys:
-        if key in d1 and key in d2:
-            if isinstance(d1[key], dict) and isinstance(d2[key], dict):
-                # Recursively merge if both values are dictionaries
-                merged[key] = merge_dicts(d1[key], d2[key])
-            else:
-                # If values conflict, store them in a list
-                merged[key] = [d1[key], d2[key]] if d1[key] != d2[key] else d1[key]
-        elif key in d1:
-            merged[key] = d1[key]
-        else:
-            merged[key] = d2[key]
-    
-    return merged
-
-
-def import_multiple_html_files_from_folder(folder_path):
-    combined_hierarchy = {}
-
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".html"):
-            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
-                html_content = file.read()
-                file_hierarchy = extract_tag_hierarchy_from_html(html_content)
-                combined_hierarchy = merge_dicts(combined_hierarchy, file_hierarchy)
-
-    return combined_hierarchy
-
-# Pfad zum Ordner
-cwd_path = os.getcwd()
-folder_path = os.path.join(cwd_path, "tmp")
-combined_tags = import_multiple_html_files_from_folder(folder_path)
-cleaned_tags = remove_duplicates_at_lowest_level(combined_tags)
-# for some reason needs to be applied twice to get all
-cleaned_tags = remove_duplicates_at_lowest_level(cleaned_tags)
-cleaned_tags = {k:v for k,v in sorted(cleaned_tags.items())}
-
-# Ausgabe der bereinigten kombinierten Hierarchie
-print(cleaned_tags)
-
-# Speichere die bereinigte Hierarchie in einer Datei
-with open('cleaned_tag_tree.pkl', 'wb') as file:
-    pickle.dump(cleaned_tags, file)
\ No newline at end of file
+    Parst alle HTML-Dateien eines Ordners parallel und baut den bereinigten Tag-Baum.
+
+    :param folder_path: Ordner mit den Tagger-Seiten.
+    :param processes: Anzahl Prozesse (Standard: CPU-Kerne), 1 parst im aktuellen Prozess.
+    :return: Der Tag-Baum mit alphabetisch sortierter oberster Ebene.
+    """
+    paths = [os.path.join(folder_path, filename)
+             for filename in sorted(os.listdir(folder_path)) if filename.endswith(".html")]
+
+    if processes == 1:
+        all_rows = map(_parse_file, paths)
+    else:
+        pool = ProcessPoolExecutor(max_workers=processes)
+        all_rows = pool.map(_parse_file, paths, chunksize=max(1, len(paths) // ((processes or os.cpu_count() or 1) * 4)))
+
+    combined_tags = {}
+    try:
+        for rows in all_rows:
+            merge_into(combined_tags, build_hierarchy(rows))
+    finally:
+        if processes != 1:
+            pool.shutdown()
+
+    cleaned_tags = remove_duplicate_tags(combined_tags)
+    return {k: v for k, v in sorted(cleaned_tags.items())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baut den Tag-Baum aus den geladenen Tagger-Seiten.")
+    parser.add_argument("--input-folder", default=HTML_FOLDER, help="Ordner mit den HTML-Dateien")
+    parser.add_argument("-o", "--output", default=TAG_TREE_PATH, help="Zieldatei des Tag-Baums")
+    parser.add_argument("--processes", type=int, default=None, help="Prozesse zum Parsen (Standard: CPU-Kerne)")
+    parser.add_argument("--check", action="store_true", help="Nur mit der vorhandenen Zieldatei vergleichen, nicht schreiben")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cleaned_tags = build_tag_tree(args.input_folder, processes=args.processes)
+    print(f"{len(cleaned_tags)} top-level tags in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    data = pickle.dumps(cleaned_tags)
+
+    if args.check:
+        with open(args.output, "rb") as file:
+            existing = file.read()
+        same_tree = pickle.loads(existing) == cleaned_tags
+        print(f"same tree: {same_tree}, byte-identical: {existing == data}", file=sys.stderr)
+        return 0 if same_tree else 1
+
+    # Speichere die bereinigte Hierarchie in einer Datei
+    with open(args.output, 'wb') as file:
+        file.write(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
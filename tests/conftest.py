@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def collection_response():
+    """Antwort von /cards/collection mit gefundenen Karten und zwei unbekannten Identifiern."""
+    with open(os.path.join(FIXTURES_FOLDER, "scryfall_collection_response.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def card_cache(tmp_path, monkeypatch):
+    """Ersetzt den prozessweiten Karten-Cache durch einen leeren in tmp_path."""
+    from functions import card_cache as card_cache_module
+
+    cache = card_cache_module.CardCache(str(tmp_path / "card_cache.pkl"))
+    monkeypatch.setattr(card_cache_module, "_card_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def deck_cache(tmp_path, monkeypatch):
+    """Leitet den Cache der verarbeiteten Decks und den Tag-Index nach tmp_path/cache um."""
+    from collections import OrderedDict
+
+    from functions import webapp_funs
+
+    folder = tmp_path / "cache"
+    folder.mkdir()
+    monkeypatch.setattr(webapp_funs, "cache_folder", str(folder))
+    monkeypatch.setattr(webapp_funs, "TAG_INDEX_PATH", str(folder / "tag_index.pkl"))
+    monkeypatch.setattr(webapp_funs, "_hot_cache", OrderedDict())
+    monkeypatch.setattr(webapp_funs, "_tag_index", None)
+    return folder
+
+
+@pytest.fixture
+def tag_store(tmp_path, monkeypatch):
+    """
+    Leitet card_tags_dict.pkl und den Tag-Store nach tmp_path/ressources um.
+
+    :return: Eine Funktion, die aus einem Dictionary Oracle ID -> Tags den aktuellen Store baut und liefert.
+    """
+    import pickle
+
+    from functions import tag_store as tag_store_module
+
+    folder = tmp_path / "ressources"
+    folder.mkdir()
+    monkeypatch.setattr(tag_store_module, "CARD_TAGS_DICT_PATH", str(folder / "card_tags_dict.pkl"))
+    monkeypatch.setattr(tag_store_module, "TAG_STORE_FOLDER", str(folder / "card_tag_store"))
+    monkeypatch.setattr(tag_store_module, "_store", None)
+
+    def build(card_tags):
+        with open(tag_store_module.CARD_TAGS_DICT_PATH, "wb") as f:
+            pickle.dump(card_tags, f)
+        tag_store_module.build_tag_store_from_pickle()
+        tag_store_module.reset_tag_store()
+        return tag_store_module.get_tag_store()
+
+    return build
@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+
+from functions import analytics, webapp_funs
+
+
+def _deck(*cards):
+    return {str(i): {"name": name, "quantity": 1, "oracle_id": f"oracle-{name}", "tags": tags}
+            for i, (name, tags) in enumerate(cards)}
+
+
+@pytest.fixture
+def analytics_folder(tmp_path):
+    return str(tmp_path / "analytics")
+
+
+def test_card_tag_frame_is_built_from_the_given_folder(deck_cache, analytics_folder):
+    webapp_funs.save_processed_deck("deckA", _deck(("Sol Ring", ["ramp", "mana-rock"]), ("Bolt", ["burn"])))
+
+    frame = analytics.load_card_tag_frame(str(deck_cache), analytics_folder)
+
+    assert sorted(frame["tag"].astype(str)) == ["burn", "mana-rock", "ramp"]
+    assert set(frame["deck_id"].astype(str)) == {"deckA"}
+
+
+def test_cache_hits_do_not_invalidate_the_frame(deck_cache, analytics_folder, monkeypatch):
+    webapp_funs.save_processed_deck("deckA", _deck(("Sol Ring", ["ramp"])))
+    analytics.load_card_tag_frame(str(deck_cache), analytics_folder)
+    path = webapp_funs.get_processed_deck_cache_filename("deckA")
+    mtime_ns = os.stat(path).st_mtime_ns
+    time.sleep(0.01)
+
+    webapp_funs._hot_cache.clear()
+    assert webapp_funs.load_cached_processed_deck("deckA") is not None
+
+    assert os.stat(path).st_mtime_ns == mtime_ns
+    assert os.stat(path).st_atime_ns > mtime_ns
+    monkeypatch.setattr(analytics, "build_card_tag_frame", lambda decks: pytest.fail("frame was rebuilt"))
+    assert list(analytics.load_card_tag_frame(str(deck_cache), analytics_folder)["tag"].astype(str)) == ["ramp"]
+
+
+def test_written_decks_rebuild_the_frame(deck_cache, analytics_folder):
+    webapp_funs.save_processed_deck("deckA", _deck(("Sol Ring", ["ramp"])))
+    analytics.load_card_tag_frame(str(deck_cache), analytics_folder)
+
+    webapp_funs.save_processed_deck("deckB", _deck(("Bolt", ["burn"])))
+
+    assert set(analytics.load_card_tag_frame(str(deck_cache), analytics_folder)["deck_id"].astype(str)) == {"deckA", "deckB"}
+
+
+def test_default_folders():
+    assert os.path.isabs(analytics.ANALYTICS_FOLDER)
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from functions import async_pipeline, general_funs, webapp_funs
+from functions.async_pipeline import ingest_deck, ingest_decks_sync
+from functions.general_funs import prepare_deck_cards
+
+SOL_RING = "6ad8011d-3471-4369-9d68-b264cc027487"
+CULTIVATE = "b4a3ce2d-6c42-4bab-8a63-9b5a8a9b0f3e"
+CARD_TAGS = {SOL_RING: ["ramp", "mana-rock"], CULTIVATE: ["ramp", "land-ramp"]}
+
+
+def _moxfield_deck(*cards, updated="2026-10-01T12:00:00Z"):
+    return {"lastUpdatedAtUtc": updated, "boards": {"mainboard": {"cards": {
+        key: {"quantity": quantity, "card": {"name": name, "set": "c21", "cn": "1", "scryfall_id": scryfall_id}}
+        for key, quantity, name, scryfall_id in cards
+    }}}}
+
+
+SOL_RING_CARD = ("k1", 1, "Sol Ring", "sol-ring-c21")
+CULTIVATE_CARD = ("k2", 1, "Cultivate", "cultivate-c21")
+
+
+@pytest.fixture
+def moxfield(deck_cache, card_cache, tag_store, monkeypatch):
+    """Moxfield-Antworten aus einem Dictionary, Oracle IDs aus dem Karten-Cache statt von Scryfall."""
+    tag_store(CARD_TAGS)
+    card_cache.put_oracle_ids({"sol-ring-c21": SOL_RING, "cultivate-c21": CULTIVATE})
+    decks = {}
+    resolved = []
+
+    def get_decklist(deck_id):
+        if deck_id not in decks:
+            raise LookupError(f"deck {deck_id} not found")
+        return decks[deck_id]
+
+    def add_oracle_ids(deck):
+        resolved.extend(deck)
+        return general_funs.add_oracle_ids(deck, progress=False)
+
+    monkeypatch.setattr(async_pipeline, "get_decklist", get_decklist)
+    monkeypatch.setattr(async_pipeline, "add_oracle_ids", add_oracle_ids)
+    return decks, resolved
+
+
+def test_prepare_deck_cards_reuses_unchanged_printings():
+    previous = {"k1": {"scryfall_id": "sol-ring-c21", "oracle_id": SOL_RING, "tags": ["ramp"]},
+                "old": {"scryfall_id": "cultivate-c21", "oracle_id": CULTIVATE, "tags": ["land-ramp"]}}
+    # Cultivate steht jetzt unter einem neuen Schlüssel, Arcane Signet ist neu
+    deck = _moxfield_deck(SOL_RING_CARD, ("k2", 1, "Cultivate", "cultivate-c21"), ("k3", 1, "Arcane Signet", "signet"))
+
+    deck_dict, changed = prepare_deck_cards(deck, previous)
+
+    assert deck_dict["k1"]["tags"] == ["ramp"] and deck_dict["k2"]["tags"] == ["land-ramp"]
+    assert list(changed) == ["k3"]
+    deck_dict, changed = prepare_deck_cards(deck, previous, reuse_tags=False)
+    assert list(changed) == ["k1", "k2", "k3"] and changed["k2"]["oracle_id"] == CULTIVATE
+    assert "tags" not in changed["k1"]
+
+
+def test_pipeline_processes_decks_and_reports_errors(moxfield):
+    decks, resolved = moxfield
+    decks["deckA"] = _moxfield_deck(SOL_RING_CARD, CULTIVATE_CARD)
+
+    results = {result.deck_id: result for result in ingest_decks_sync(["deckA", "missing", "not a deck!"])}
+
+    assert set(results) == {"deckA", "missing", "not a deck!"}
+    assert isinstance(results["missing"].error, LookupError)
+    assert isinstance(results["not a deck!"].error, ValueError)
+    deck = results["deckA"].data
+    assert results["deckA"].error is None and deck["k1"]["tags"] == ["ramp", "mana-rock"]
+    assert webapp_funs.load_cached_processed_deck("deckA") == deck
+    assert sorted(resolved) == ["k1", "k2"]
+
+
+def test_refresh_resolves_only_changed_cards(moxfield):
+    decks, resolved = moxfield
+    decks["deckA"] = _moxfield_deck(SOL_RING_CARD)
+    asyncio.run(ingest_deck("deckA"))
+    # Aus dem Cache: kein Abruf bei Moxfield
+    decks.clear()
+    assert asyncio.run(ingest_deck("deckA"))["k1"]["oracle_id"] == SOL_RING
+
+    # Gleicher Zeitstempel auf Moxfield: der Eintrag wird ohne Auflösen übernommen
+    decks["deckA"] = _moxfield_deck(("k1", 2, "Sol Ring", "sol-ring-c21"), CULTIVATE_CARD)
+    resolved.clear()
+    assert list(asyncio.run(ingest_deck("deckA", use_cache=False))) == ["k1"] and resolved == []
+
+    decks["deckA"] = _moxfield_deck(("k1", 2, "Sol Ring", "sol-ring-c21"), CULTIVATE_CARD,
+                                    updated="2026-10-02T12:00:00Z")
+    deck = asyncio.run(ingest_deck("https://moxfield.com/decks/deckA", use_cache=False))
+
+    assert resolved == ["k2"]
+    assert deck["k1"]["quantity"] == 2 and deck["k2"]["tags"] == ["ramp", "land-ramp"]
+    with pytest.raises(LookupError):
+        asyncio.run(ingest_deck("missing"))
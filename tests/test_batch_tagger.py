@@ -0,0 +1,42 @@
+import io
+import json
+import pickle
+
+import batch_tagger
+from functions import webapp_funs
+from functions.general_funs import DEFAULT_BOARDS
+
+TAG_TREE = {"ramp": {"mana-rock": {}}, "removal": {}}
+DECK = {
+    "0": {"name": "Sol Ring", "quantity": 1, "set": "c21", "cn": "263", "board": "mainboard", "tags": ["mana-rock"]},
+    "1": {"name": "Beast Within", "quantity": 1, "set": "c21", "cn": "151", "board": "mainboard", "tags": ["removal"]},
+}
+
+
+def test_batch_writes_cached_decks_and_errors(deck_cache, card_cache, tmp_path):
+    tag_tree_path = tmp_path / "tag_tree.pkl"
+    with open(tag_tree_path, "wb") as f:
+        pickle.dump(TAG_TREE, f)
+    webapp_funs.save_processed_deck("deckA", DECK, meta={"last_updated": None, "boards": list(DEFAULT_BOARDS)})
+    output = io.StringIO()
+
+    counts = batch_tagger.run_batch(["deckA", "https://moxfield.com/decks/deckA", "not a deck"], output,
+                                    ["ramp", "removal"], workers=2, processes=1, skip={"deckB"},
+                                    tag_tree_path=str(tag_tree_path))
+
+    assert (counts["ok"], counts["error"], counts["skipped"]) == (1, 1, 1)
+    records = {record["deck_id"]: record for record in map(json.loads, output.getvalue().splitlines())}
+    assert records["not a deck"]["status"] == "error"
+    record = records["deckA"]
+    assert [(card["name"], card["tags"]) for card in record["cards"]] == [("Beast Within", ["removal"]),
+                                                                          ("Sol Ring", ["ramp"])]
+    assert record["deck_string"] == "1 Beast Within (C21) 151 #removal\n1 Sol Ring (C21) 263 #ramp\n"
+
+
+def test_finished_decks_are_read_from_the_output(tmp_path):
+    path = tmp_path / "tagged.ndjson"
+    path.write_text('{"deck_id": "a", "status": "ok"}\n{"deck_id": "b", "status": "error"}\n{"deck_id": "c", "st',
+                    encoding="utf-8")
+
+    assert batch_tagger.read_finished_deck_ids(str(path)) == {"a"}
+    assert batch_tagger.read_finished_deck_ids(str(tmp_path / "missing.ndjson")) == set()
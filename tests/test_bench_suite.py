@@ -0,0 +1,47 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from conftest import ROOT
+from functions import card_cache, metrics
+
+
+@pytest.fixture
+def bench_suite(monkeypatch):
+    spec = importlib.util.spec_from_file_location("bench_suite", os.path.join(ROOT, "benchmarks", "bench_suite.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # main() schaltet die Metriken ab und setzt den Karten-Cache zurück, das soll nicht in andere Tests durchschlagen
+    monkeypatch.setattr(metrics, "_enabled", metrics.is_enabled())
+    monkeypatch.setattr(card_cache, "_card_cache", card_cache._card_cache)
+    return module
+
+
+def test_suite_runs_every_benchmark_offline(bench_suite, tmp_path, capsys):
+    output = tmp_path / "results.json"
+
+    assert bench_suite.main(["--sizes", "60", "--repeat", "1", "--max-time", "0", "--output", str(output)]) == 0
+
+    with open(output, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    names = {entry["benchmark"] for entry in report["results"]}
+    assert {"extract_deck_cards", "oracle_ids_scryfall_stub", "add_tags_to_deck_cold", "filter_tag_tree",
+            "render_selection_change", "tree_select_payload_lazy"} <= names
+    assert all(entry["cards"] == 60 and entry["runs"] == 1 for entry in report["results"])
+    assert report["decks"][0]["cards"] == 60
+    # Scryfall wird nur über den Stub angefragt, ohne Fortschrittsbalken in der Ausgabe
+    assert "Adding Oracle IDs" not in capsys.readouterr().err
+
+
+def test_compare_counts_regressions(bench_suite, tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"meta": {"commit": "abc"}, "results": [
+        {"benchmark": "a", "cards": 60, "min_s": 1.0},
+        {"benchmark": "b", "cards": 60, "min_s": 1.0},
+    ]}), encoding="utf-8")
+    results = [{"benchmark": "a", "cards": 60, "min_s": 1.5}, {"benchmark": "b", "cards": 60, "min_s": 0.5},
+               {"benchmark": "c", "cards": 60, "min_s": 9.0}]
+
+    assert bench_suite.compare(results, str(baseline), threshold=1.1) == 1
@@ -0,0 +1,83 @@
+import pytest
+
+from functions.card_cache import CardCache
+from functions.general_funs import add_tags_to_deck
+
+SOL_RING = "6ad8011d-3471-4369-9d68-b264cc027487"
+
+
+def test_lookups_count_hits_and_misses(tmp_path):
+    cache = CardCache(str(tmp_path / "card_cache.pkl"))
+    cache.put_oracle_ids({"p1": "o1"})
+    cache.put_tag_ids("p1", [3, 1], "v1")
+
+    assert cache.get_oracle_ids(["p1", "p2"]) == {"p1": "o1"}
+    assert cache.get_tag_ids("p1", "v1") == (3, 1)
+    assert cache.get_tag_ids("p2", "v1") is None
+    stats = cache.hit_rates()
+    assert (stats["oracle_hits"], stats["oracle_misses"], stats["tag_hits"], stats["tag_misses"]) == (1, 1, 1, 1)
+    assert stats["oracle_hit_rate"] == stats["tag_hit_rate"] == 0.5 and stats["printings"] == 1
+
+
+def test_tag_ids_of_another_store_version_are_dropped(tmp_path):
+    cache = CardCache(str(tmp_path / "card_cache.pkl"))
+    cache.put_oracle_ids({"p1": "o1"})
+    cache.put_tag_ids("p1", [1], "v1")
+
+    assert cache.get_tag_ids("p1", "v2") is None
+    assert cache.get_oracle_ids(["p1"]) == {"p1": "o1"}  # Oracle IDs bleiben gültig
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "cache" / "card_cache.pkl")
+    cache = CardCache(path)
+    cache.save()  # Unverändert: nichts zu schreiben
+    assert not (tmp_path / "cache").exists()
+
+    cache.put_oracle_ids({"p1": "o1"})
+    cache.put_tag_ids("p1", [1, 2], "v1")
+    cache.save()
+    assert not cache.dirty
+
+    loaded = CardCache(path)
+    loaded.load()
+    assert loaded.oracle_ids == {"p1": "o1"} and loaded.tag_ids == {"p1": (1, 2)} and loaded.tags_version == "v1"
+    CardCache(str(tmp_path / "missing.pkl")).load()
+
+
+def test_failed_save_stays_dirty(tmp_path, monkeypatch):
+    from functions import card_cache as card_cache_module
+
+    cache = CardCache(str(tmp_path / "card_cache.pkl"))
+    cache.put_oracle_ids({"p1": "o1"})
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(card_cache_module.pickle, "dump", fail)
+    with pytest.raises(OSError):
+        cache.save()
+    assert cache.dirty and [path.name for path in tmp_path.iterdir()] == []
+
+
+def test_migrate_tag_ids_keeps_unchanged_cards(tmp_path):
+    cache = CardCache(str(tmp_path / "card_cache.pkl"))
+    cache.put_oracle_ids({"p1": "o1", "p2": "o2", "p3": "o3"})
+    for scryfall_id, tag_ids in (("p1", [0, 1]), ("p2", [1]), ("p3", [2])):
+        cache.put_tag_ids(scryfall_id, tag_ids, "v1")
+
+    # Tag 2 gibt es nicht mehr, o2 hat neue Tags bekommen
+    cache.migrate_tag_ids("v1", "v2", {0: 5, 1: 4}, changed_oracle_ids={"o2"})
+
+    assert cache.tags_version == "v2" and cache.tag_ids == {"p1": (5, 4)}
+
+
+def test_tags_are_read_from_the_store_once_per_printing(card_cache, tag_store):
+    store = tag_store({SOL_RING: ["ramp", "mana-rock"]})
+    deck = {"a": {"scryfall_id": "p1", "oracle_id": SOL_RING}, "b": {"scryfall_id": "p1", "oracle_id": SOL_RING}}
+
+    add_tags_to_deck(deck)
+
+    assert deck["a"]["tags"] == deck["b"]["tags"] == ["ramp", "mana-rock"]
+    assert card_cache.hit_rates()["tag_hits"] == 1 and card_cache.hit_rates()["tag_misses"] == 1
+    assert card_cache.tags_version == store.version and card_cache.get_oracle_ids(["p1"]) == {"p1": SOL_RING}
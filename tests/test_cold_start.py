@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+from collections import OrderedDict
+
+import pytest
+
+from conftest import ROOT
+from functions import http_client, webapp_funs
+
+IMPORT_CHECK = r"""
+import json, sys
+import functions.general_funs, functions.webapp_funs
+print(json.dumps(sorted(name for name in ("requests", "tqdm", "pandas", "bs4") if name in sys.modules)))
+"""
+
+
+def test_app_modules_import_without_heavy_dependencies_or_side_effects(tmp_path):
+    cache_folder = tmp_path / "cache"
+    env = dict(os.environ, PYTHONPATH=ROOT, **{webapp_funs.CACHE_FOLDER_ENV_VAR: str(cache_folder)})
+
+    output = subprocess.run([sys.executable, "-c", IMPORT_CHECK], cwd=str(tmp_path), env=env, check=True,
+                            capture_output=True, text=True).stdout
+
+    assert json.loads(output) == []
+    assert not cache_folder.exists()
+
+
+def test_request_exception_resolves_lazily():
+    import requests
+
+    assert http_client.RequestException is requests.RequestException
+    with pytest.raises(AttributeError):
+        http_client.NoSuchName
+
+
+def test_missing_cache_folder_is_an_empty_cache(tmp_path, monkeypatch):
+    folder = tmp_path / "cache"
+    monkeypatch.setattr(webapp_funs, "cache_folder", str(folder))
+    monkeypatch.setattr(webapp_funs, "_hot_cache", OrderedDict())
+
+    assert webapp_funs.load_cached_processed_deck("deckA") is None
+    assert list(webapp_funs.iter_cached_processed_decks()) == []
+    assert not folder.exists()
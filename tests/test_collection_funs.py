@@ -0,0 +1,85 @@
+import io
+
+from functions.collection_funs import read_collection_rows, resolve_collection_batch, tag_collection
+from functions.general_funs import format_deck_line
+
+
+class CollectionTransport:
+    """Beantwortet /cards/collection Anfragen nach Name oder Set/Sammlernummer aus der aufgezeichneten Antwort."""
+
+    def __init__(self, response):
+        self.cards = response["data"]
+        self.requests = []
+
+    def _find(self, identifier):
+        for card in self.cards:
+            if "id" in identifier:
+                if card["id"] == identifier["id"]:
+                    return card
+            elif "collector_number" in identifier:
+                if (card["set"], card["collector_number"]) == (identifier["set"], identifier["collector_number"]):
+                    return card
+            elif card["name"].lower() == identifier["name"].lower() and identifier.get("set", card["set"]) == card["set"]:
+                return card
+        return None
+
+    def __call__(self, url, payload):
+        self.requests.append(payload)
+        data, not_found = [], []
+        for identifier in payload["identifiers"]:
+            card = self._find(identifier)
+            if card is None:
+                not_found.append(identifier)
+            else:
+                data.append(card)
+        return {"object": "list", "not_found": not_found, "data": data}
+
+
+def test_text_lines_with_finish_markers():
+    rows = list(read_collection_rows(io.StringIO(
+        "1 Sol Ring (C21) 263 *F*\n2x Lightning Bolt\n1 Sol Ring (CMM) 410 *E* *CMDR*\n// Kommentar\n")))
+
+    assert rows == [
+        {"quantity": 1, "name": "Sol Ring", "set": "C21", "cn": "263", "finish": "foil"},
+        {"quantity": 2, "name": "Lightning Bolt"},
+        {"quantity": 1, "name": "Sol Ring", "set": "CMM", "cn": "410", "finish": "etched"},
+    ]
+
+
+def test_format_deck_line_without_set():
+    assert format_deck_line({"quantity": 2, "name": "Sol Ring"}, ["ramp"]) == "2 Sol Ring #ramp"
+    assert format_deck_line({"quantity": 1, "name": "Sol Ring", "finish": "foil"}, []) == "1 Sol Ring *F* "
+    assert format_deck_line({"quantity": 1, "name": "Sol Ring", "set": "c21", "cn": "263", "finish": "foil"},
+                            ["ramp"]) == "1 Sol Ring (C21) 263 *F* #ramp"
+
+
+def test_name_only_lines_get_the_printing_of_the_resolved_card(collection_response, card_cache):
+    transport = CollectionTransport(collection_response)
+    batch = [{"quantity": 2, "name": "Sol Ring"}, {"quantity": 1, "name": "Command Tower", "set": "CMM"}]
+
+    resolve_collection_batch(batch, transport=transport)
+
+    assert [(card["set"], card["cn"]) for card in batch] == [("m3c", "305"), ("CMM", "659")]
+    assert batch[0]["oracle_id"] == "6ad8011d-3471-4369-9d68-b264cc027487"
+    assert format_deck_line(batch[0], []).startswith("2 Sol Ring (M3C) 305")
+
+
+def test_tag_collection_reuses_lookups_and_bounds_the_cache(collection_response, card_cache, monkeypatch, capsys):
+    from functions import collection_funs
+
+    monkeypatch.setattr(collection_funs, "LOOKUP_CACHE_SIZE", 1)
+    transport = CollectionTransport(collection_response)
+    rows = read_collection_rows(io.StringIO("2x Sol Ring\n1 Sol Ring\n1 Arcane Signet\n1 Command Tower\n1 Sol Ring\n"))
+    output = io.StringIO()
+
+    stats = tag_collection(rows, output, [], {}, batch_size=2, transport=transport)
+
+    assert stats["cards"] == stats["resolved"] == 5
+    assert "()" not in output.getvalue()
+    assert output.getvalue().splitlines()[0] == "2 Sol Ring (M3C) 305 "
+    # Sol Ring wird in Batch 1 aufgelöst, in Batch 2 verdrängt und in Batch 3 neu angefragt
+    name_lookups = [[identifier["name"] for identifier in payload["identifiers"] if "name" in identifier]
+                    for payload in transport.requests]
+    assert [names for names in name_lookups if names] == [["Sol Ring"], ["Arcane Signet", "Command Tower"], ["Sol Ring"]]
+    # Kein Fortschrittsbalken pro Batch
+    assert "Adding Oracle IDs" not in capsys.readouterr().err
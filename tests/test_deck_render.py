@@ -0,0 +1,47 @@
+import random
+
+from functions.deck_render import DeckRenderModel
+from functions.general_funs import format_deck_line, tag_deck_cards
+
+TAG_TREE = {"ramp": {"mana-rock": {}, "land-ramp": {}}, "removal": {"board-wipe": {}}, "card-draw": {}}
+DECK = {
+    "0": {"name": "Sol Ring", "quantity": 1, "set": "c21", "cn": "263", "tags": ["mana-rock"]},
+    "1": {"name": "Cultivate", "quantity": 1, "set": "m21", "cn": "177", "tags": ["land-ramp", "card-draw"]},
+    "2": {"name": "Blasphemous Act", "quantity": 1, "set": "isd", "cn": "130", "tags": ["board-wipe"]},
+    "3": {"name": "Forest", "quantity": 30, "tags": []},
+}
+TAGS = ["ramp", "mana-rock", "land-ramp", "removal", "board-wipe", "card-draw", "custom"]
+
+
+def _full_render(selected_tags):
+    return "".join(format_deck_line(card_data, tags) + "\n"
+                   for card_data, tags in tag_deck_cards(DECK, selected_tags, TAG_TREE))
+
+
+def test_render_matches_a_full_render():
+    model = DeckRenderModel(DECK, TAG_TREE)
+
+    assert len(model) == 4
+    assert model.render([]) == "1 Blasphemous Act (ISD) 130 \n1 Cultivate (M21) 177 \n30 Forest \n1 Sol Ring (C21) 263 \n"
+    assert model.render(["ramp", "card-draw"]) == \
+        "1 Blasphemous Act (ISD) 130 \n1 Cultivate (M21) 177 #ramp #card-draw\n30 Forest \n1 Sol Ring (C21) 263 #ramp\n"
+
+
+def test_changed_selections_only_rerender_affected_lines():
+    model = DeckRenderModel(DECK, TAG_TREE)
+    model.render(["ramp"])
+    forest_line = model.lines[2]
+
+    deck_string = model.render(["ramp", "removal"])
+    assert deck_string == _full_render(["ramp", "removal"])
+    assert model.lines[2] is forest_line
+    # Gleiche Auswahl: derselbe String ohne neues Rendern
+    assert model.render(["ramp", "removal", "ramp"]) is deck_string
+
+
+def test_random_selection_sequences_match_full_renders():
+    rng = random.Random(0)
+    model = DeckRenderModel(DECK, TAG_TREE)
+    for _ in range(200):
+        selected_tags = rng.sample(TAGS, rng.randint(0, len(TAGS)))
+        assert model.render(selected_tags) == _full_render(selected_tags)
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tag_trees.get_tag_trees import FAILED, MANIFEST_FILENAME, NO_TREE, SAVED, crawl_tag_trees, fetch_tag_tree
+
+
+def _page(*tags):
+    rows = "\n".join(f'<div class="tags-list__row depth-{depth}"><a href="/tags/card/{tag}">{tag}</a></div>'
+                     for depth, tag in tags)
+    return f'<html><body><div class="site-body"><div class="tags-list">\n{rows}\n</div></div></body></html>'
+
+
+class TaggerServer(ThreadingHTTPServer):
+    """Lokaler Ersatz für den Tagger: liefert /tags/card/<tag>/tree aus pages und merkt sich alle Anfragen."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), TaggerHandler)
+        self.pages = {
+            "ramp": _page((1, "ramp"), (2, "mana-rock"), (3, "signet"), (2, "land-ramp")),
+            "lonely": _page((1, "lonely")),
+        }
+        self.requests = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def etag(self, tag):
+        return f'"{zlib.crc32(self.pages[tag].encode("utf-8")):08x}"'
+
+
+class TaggerHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        tag = self.path.split("/")[3]
+        self.server.requests.append((tag, self.headers.get("If-None-Match")))
+        if tag not in self.server.pages:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = self.server.etag(tag)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = self.server.pages[tag].encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def tagger():
+    server = TaggerServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _crawl(tagger, html_folder, tags, **kwargs):
+    return crawl_tag_trees(tags, html_folder=str(html_folder), base_url=tagger.base_url, workers=2,
+                           progress=False, **kwargs)
+
+
+def _manifest(html_folder):
+    with open(os.path.join(html_folder, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_failed_pages_are_recorded_without_aborting(tagger, tmp_path):
+    counts = _crawl(tagger, tmp_path, ["ramp", "missing", "lonely"])
+
+    assert (counts[SAVED], counts[NO_TREE], counts[FAILED], counts["skipped"]) == (1, 1, 1, 0)
+    manifest = _manifest(tmp_path)
+    assert manifest["ramp"]["status"] == SAVED and manifest["ramp"]["etag"] == tagger.etag("ramp")
+    assert manifest["lonely"]["status"] == NO_TREE
+    assert manifest["missing"]["status"] == FAILED and "404" in manifest["missing"]["error"]
+    assert manifest["missing"]["attempts"] == 1
+    # Nur Seiten mit Baum werden gespeichert
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".html")) == ["ramp.html"]
+    with open(tmp_path / "ramp.html", "r", encoding="utf-8") as f:
+        assert "mana-rock" in f.read()
+
+
+def test_resume_only_requests_missing_and_failed_tags(tagger, tmp_path):
+    _crawl(tagger, tmp_path, ["ramp", "missing", "lonely"])
+    tagger.requests.clear()
+    tagger.pages["missing"] = _page((1, "missing"), (2, "a"), (2, "b"))
+
+    counts = _crawl(tagger, tmp_path, ["ramp", "missing", "lonely", "new"])
+
+    assert sorted(tag for tag, _ in tagger.requests) == ["missing", "new"]
+    assert (counts[SAVED], counts[FAILED], counts["skipped"]) == (1, 1, 2)
+    manifest = _manifest(tmp_path)
+    assert manifest["missing"]["status"] == SAVED
+    assert manifest["new"]["attempts"] == 1
+
+
+def test_refresh_sends_etag_and_keeps_unchanged_pages(tagger, tmp_path):
+    _crawl(tagger, tmp_path, ["ramp", "lonely"])
+    saved_page = (tmp_path / "ramp.html").read_text(encoding="utf-8")
+    tagger.requests.clear()
+
+    counts = _crawl(tagger, tmp_path, ["ramp", "lonely"], refresh=True)
+
+    assert sorted(tagger.requests) == [("lonely", tagger.etag("lonely")), ("ramp", tagger.etag("ramp"))]
+    assert (counts["unchanged"], counts[SAVED], counts[NO_TREE]) == (2, 0, 0)
+    manifest = _manifest(tmp_path)
+    assert manifest["ramp"]["status"] == SAVED and manifest["ramp"]["unchanged"] is True
+    assert (tmp_path / "ramp.html").read_text(encoding="utf-8") == saved_page
+
+
+def test_refresh_downloads_changed_pages(tagger, tmp_path):
+    _crawl(tagger, tmp_path, ["ramp"])
+    tagger.pages["ramp"] = _page((1, "ramp"), (2, "mana-rock"), (2, "land-ramp"), (2, "ritual"))
+
+    counts = _crawl(tagger, tmp_path, ["ramp"], refresh=True)
+
+    assert counts[SAVED] == 1
+    assert _manifest(tmp_path)["ramp"]["etag"] == tagger.etag("ramp")
+    assert "ritual" in (tmp_path / "ramp.html").read_text(encoding="utf-8")
+
+
+def test_missing_file_is_requested_without_etag(tagger, tmp_path):
+    entry = fetch_tag_tree("ramp", {}, html_folder=str(tmp_path), base_url=tagger.base_url)
+    os.remove(tmp_path / "ramp.html")
+
+    new_entry = fetch_tag_tree("ramp", entry, html_folder=str(tmp_path), base_url=tagger.base_url)
+
+    assert [etag for _, etag in tagger.requests] == [None, None]
+    assert new_entry["status"] == SAVED and os.path.exists(tmp_path / "ramp.html")
@@ -0,0 +1,165 @@
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+import pytest
+import requests
+
+from functions import http_client
+from functions.http_client import TokenBucket, _retry_after
+
+
+class FakeClock:
+    """Ersetzt das time Modul im http_client: sleep lässt die Zeit sofort vergehen."""
+
+    EPOCH = 1_700_000_000.0
+
+    def __init__(self):
+        # Kleine monotone Zeit, bei Epochen-Sekunden gingen Schlafzeiten unter 1e-7 s in der Rundung verloren
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def time(self):
+        return self.EPOCH + self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        # Wie eine echte Uhr schreitet die Zeit bei jedem sleep etwas voran
+        self.now += max(seconds, 1e-6)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class StubSession:
+    """Liefert der Reihe nach die vorgegebenen Antworten (oder wirft Exceptions) und merkt sich die Anfragen."""
+
+    def __init__(self, clock, responses):
+        self.clock = clock
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((self.clock.now, method, url))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_client, "time", clock)
+    monkeypatch.setattr(http_client, "_buckets", {})
+    return clock
+
+
+@pytest.fixture
+def stub_session(clock, monkeypatch):
+    def install(*responses):
+        session = StubSession(clock, responses)
+        monkeypatch.setattr(http_client, "get_session", lambda host: session)
+        return session
+    return install
+
+
+def test_token_bucket_allows_bursts_then_the_rate(clock):
+    bucket = TokenBucket(4)
+
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [0.25, 0.25]
+
+
+def test_token_bucket_pause(clock):
+    bucket = TokenBucket(10)
+    bucket.acquire()
+    bucket.pause(3)
+
+    bucket.acquire()
+    bucket.acquire()
+
+    # Nach der Pause kein voller Burst, sondern wieder die normale Rate
+    assert clock.sleeps == [3, 0.1]
+
+
+def test_retry_after_seconds_and_http_date(clock):
+    assert _retry_after(FakeResponse(429, {"Retry-After": "7"})) == 7.0
+    assert _retry_after(FakeResponse(429, {"Retry-After": "-3"})) == 0.0
+    date = format_datetime(datetime.fromtimestamp(clock.time() + 12, timezone.utc), usegmt=True)
+    assert _retry_after(FakeResponse(429, {"Retry-After": date})) == pytest.approx(12)
+    past = format_datetime(datetime.fromtimestamp(clock.time() - 60, timezone.utc), usegmt=True)
+    assert _retry_after(FakeResponse(429, {"Retry-After": past})) == 0.0
+    assert _retry_after(FakeResponse(429, {"Retry-After": "soon"})) is None
+    assert _retry_after(FakeResponse(429)) is None
+
+
+def test_429_waits_for_retry_after_and_pauses_the_service(clock, stub_session):
+    throttled = FakeResponse(429, {"Retry-After": "2"})
+    session = stub_session(throttled, FakeResponse(200))
+
+    response = http_client.get("https://api.scryfall.com/cards/x")
+
+    assert response.status_code == 200
+    assert throttled.closed
+    assert [when - session.requests[0][0] for when, _, _ in session.requests] == [0, 2]
+    # Die Pause gilt für alle Hosts des Dienstes
+    bucket = http_client.get_bucket("tagger.scryfall.com")
+    assert bucket is http_client.get_bucket("api.scryfall.com")
+    assert bucket.blocked_until == pytest.approx(session.requests[0][0] + 2)
+
+
+def test_429_with_http_date(clock, stub_session):
+    date = format_datetime(datetime.fromtimestamp(clock.time() + 5, timezone.utc), usegmt=True)
+    session = stub_session(FakeResponse(429, {"Retry-After": date}), FakeResponse(200))
+
+    assert http_client.get("https://api.moxfield.com/decks").status_code == 200
+    assert session.requests[1][0] - session.requests[0][0] == pytest.approx(5)
+
+
+def test_5xx_backoff_stops_at_the_retry_cap(clock, stub_session, monkeypatch):
+    monkeypatch.setattr(http_client, "BACKOFF_MAX", 4)
+    responses = [FakeResponse(503) for _ in range(http_client.MAX_RETRIES + 1)]
+    session = stub_session(*responses)
+
+    response = http_client.get("https://api.scryfall.com/cards/x")
+
+    assert response is responses[-1] and response.status_code == 503
+    assert len(session.requests) == http_client.MAX_RETRIES + 1
+    assert clock.sleeps == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+
+def test_connection_errors_are_retried_then_raised(clock, stub_session, monkeypatch):
+    monkeypatch.setattr(http_client, "MAX_RETRIES", 2)
+    session = stub_session(requests.ConnectionError("reset"), FakeResponse(200))
+
+    assert http_client.post("https://api.scryfall.com/cards/collection").status_code == 200
+
+    session = stub_session(*[requests.Timeout("slow")] * 3)
+    with pytest.raises(requests.Timeout):
+        http_client.get("https://api.scryfall.com/cards/x")
+    assert len(session.requests) == 3
+
+
+def test_client_errors_are_not_retried(clock, stub_session):
+    session = stub_session(FakeResponse(404))
+
+    assert http_client.get("https://api.scryfall.com/cards/missing").status_code == 404
+    assert len(session.requests) == 1
+    assert clock.sleeps == []
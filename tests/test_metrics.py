@@ -0,0 +1,51 @@
+import re
+
+from functions.metrics import MetricsRegistry
+
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"'
+                    r'(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? -?[0-9.e+]+$')
+
+
+def _families(text):
+    """Parst die Exposition in [(Name, Typ, [Sample-Namen])] und prüft dabei die Syntax jeder Zeile."""
+    families = []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            families.append((name, kind, []))
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            families[-1][2].append(match.group("name"))
+    return families
+
+
+def test_prometheus_exposition():
+    registry = MetricsRegistry()
+    registry.inc("cache_hits", cache="deck_disk")
+    registry.inc("cache_hits", 2, cache="deck_memory")
+    registry.inc("http_requests", service="scryfall.com", method="GET")
+    registry.observe("stage", 0.5, stage="get_decklist")
+    registry.observe("stage", 1.5, stage="get_decklist")
+    registry.observe("stage", 0.25, stage='say "hi"')
+
+    text = registry.to_prometheus()
+    families = _families(text)
+
+    assert [(name, kind) for name, kind, _ in families] == [
+        ("mtg_tagger_cache_hits_total", "counter"),
+        ("mtg_tagger_http_requests_total", "counter"),
+        ("mtg_tagger_stage_seconds", "summary"),
+        ("mtg_tagger_stage_seconds_max", "gauge"),
+    ]
+    # Jede Familie ist zusammenhängend und enthält nur ihre eigenen Samples
+    assert len({name for name, _, _ in families}) == len(families)
+    for name, kind, samples in families:
+        allowed = {name + "_count", name + "_sum"} if kind == "summary" else {name}
+        assert set(samples) <= allowed
+    assert 'mtg_tagger_cache_hits_total{cache="deck_memory"} 2' in text.splitlines()
+    assert 'mtg_tagger_stage_seconds_count{stage="get_decklist"} 2' in text.splitlines()
+    assert 'mtg_tagger_stage_seconds_sum{stage="get_decklist"} 2.000000' in text.splitlines()
+    assert 'mtg_tagger_stage_seconds_max{stage="get_decklist"} 1.500000' in text.splitlines()
+    assert 'mtg_tagger_stage_seconds_max{stage="say \\"hi\\""} 0.250000' in text.splitlines()
+    assert text.endswith("\n")
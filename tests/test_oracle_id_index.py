@@ -0,0 +1,76 @@
+import io
+import json
+
+import pytest
+
+from functions import general_funs, oracle_id_index
+from functions.general_funs import _iter_json_array, add_oracle_ids, build_oracle_id_index, lookup_oracle_id
+
+SOL_RING = {"id": "0afa0e33-4804-4b00-b625-c2d6b61090fc", "oracle_id": "6ad8011d-3471-4369-9d68-b264cc027487"}
+# Umkehrbare Karten tragen die Oracle ID nur auf den Seiten
+REVERSIBLE = {"id": "f1b2c3d4-0000-4000-8000-000000000001",
+              "card_faces": [{"oracle_id": "a1b2c3d4-0000-4000-8000-00000000000a"}, {}]}
+NO_ORACLE_ID = {"id": "f1b2c3d4-0000-4000-8000-000000000002"}
+BULK = [SOL_RING, REVERSIBLE, NO_ORACLE_ID]
+
+
+@pytest.fixture
+def index_path(tmp_path, monkeypatch):
+    path = tmp_path / "oracle_id_index.bin"
+    monkeypatch.setattr(general_funs, "ORACLE_ID_INDEX_PATH", str(path))
+    monkeypatch.setattr(general_funs, "_oracle_id_index", None)
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_iter_json_array_streams_elements_across_chunks(chunk_size):
+    text = json.dumps({"object": "list", "data": [{"a": "[1]"}, [2, {"b": "]"}], {}]})
+
+    assert list(_iter_json_array(io.StringIO(text), key="data", chunk_size=chunk_size)) == [{"a": "[1]"}, [2, {"b": "]"}], {}]
+    assert list(_iter_json_array(io.StringIO(" [ ] "), chunk_size=chunk_size)) == []
+    assert list(_iter_json_array(io.StringIO(""), chunk_size=chunk_size)) == []
+
+
+def test_iter_json_array_raises_on_truncated_input():
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_json_array(io.StringIO('[{"a": 1}, {"b": '), chunk_size=4))
+
+
+def test_build_and_look_up_index(tmp_path, index_path):
+    bulk_path = tmp_path / "default-cards.json"
+    bulk_path.write_text(json.dumps(BULK), encoding="utf-8")
+
+    assert lookup_oracle_id(SOL_RING["id"]) is None  # Noch kein Index
+    assert build_oracle_id_index(str(bulk_path), str(index_path)) == 2
+    assert index_path.stat().st_size == 2 * general_funs.ORACLE_ID_INDEX_RECORD_SIZE
+    assert lookup_oracle_id(SOL_RING["id"]) == SOL_RING["oracle_id"]
+    assert lookup_oracle_id(REVERSIBLE["id"]) == REVERSIBLE["card_faces"][0]["oracle_id"]
+    assert lookup_oracle_id(NO_ORACLE_ID["id"]) is None
+    assert lookup_oracle_id("not-a-uuid") is None
+
+
+def test_add_oracle_ids_asks_scryfall_only_for_printings_missing_from_the_index(tmp_path, index_path, card_cache):
+    bulk_path = tmp_path / "default-cards.json"
+    bulk_path.write_text(json.dumps([SOL_RING]), encoding="utf-8")
+    build_oracle_id_index(str(bulk_path), str(index_path))
+    requests = []
+
+    def transport(url, payload):
+        requests.append(payload)
+        return {"data": [REVERSIBLE], "not_found": []}
+
+    deck = {"a": {"scryfall_id": SOL_RING["id"]}, "b": {"scryfall_id": REVERSIBLE["id"]}}
+    add_oracle_ids(deck, transport=transport, progress=False)
+
+    assert requests == [{"identifiers": [{"id": REVERSIBLE["id"]}]}]
+    assert deck["a"]["oracle_id"] == SOL_RING["oracle_id"]
+    assert deck["b"]["oracle_id"] == REVERSIBLE["card_faces"][0]["oracle_id"]
+
+
+def test_cli_builds_the_index_from_a_bulk_file(tmp_path, index_path):
+    bulk_path = tmp_path / "default-cards.json"
+    bulk_path.write_text(json.dumps(BULK), encoding="utf-8")
+
+    assert oracle_id_index.main(["--input", str(bulk_path)]) == 0
+    assert bulk_path.exists()
+    assert lookup_oracle_id(SOL_RING["id"]) == SOL_RING["oracle_id"]
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from conftest import FIXTURES_FOLDER
+from tag_trees.parse_tag_tree_htmls import (build_hierarchy, build_tag_tree, extract_tag_hierarchy_from_html,
+                                            extract_tag_rows, remove_duplicate_tags)
+
+PAGES_FOLDER = os.path.join(FIXTURES_FOLDER, "tagger_pages")
+
+
+def _read_page(filename):
+    with open(os.path.join(PAGES_FOLDER, filename), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _reference_hierarchy(html):
+    """Die frühere Umsetzung mit BeautifulSoup, gegen die der Streaming-Parser geprüft wird."""
+    tag_hierarchy = {}
+    parent_stack = []
+    for div in BeautifulSoup(html, "html.parser").find_all("div", class_="tags-list__row"):
+        depth = next((x for x in div.get("class", []) if x.startswith("depth-")), None)
+        if not depth or int(depth.split("-")[1]) >= 4:
+            continue
+        a_tag = div.find("a")
+        if not a_tag:
+            continue
+        depth_number = int(depth.split("-")[1])
+        while len(parent_stack) + 1 > depth_number:
+            parent_stack.pop()
+        node = tag_hierarchy if not parent_stack else parent_stack[-1]
+        tag_text = a_tag.get_text(strip=True).replace(" ", "-")
+        node[tag_text] = {}
+        parent_stack.append(node[tag_text])
+    return tag_hierarchy
+
+
+def test_extract_tag_rows():
+    rows = extract_tag_rows(_read_page("tagger_ramp.html"))
+
+    # depth-4 und Zeilen ohne Link fallen weg, nur der erste Link einer Zeile zählt
+    assert rows == [(1, "ramp"), (2, "mana-rock"), (3, "signet"), (2, "land-ramp"), (1, "acceleration")]
+
+
+def test_build_hierarchy():
+    rows = [(1, "ramp"), (2, "mana-rock"), (3, "signet"), (2, "land-ramp"), (1, "acceleration")]
+
+    assert build_hierarchy(rows) == {
+        "ramp": {"mana-rock": {"signet": {}}, "land-ramp": {}},
+        "acceleration": {},
+    }
+
+
+@pytest.mark.parametrize("filename", sorted(os.listdir(PAGES_FOLDER)))
+def test_hierarchy_matches_beautifulsoup(filename):
+    html = _read_page(filename)
+
+    assert extract_tag_hierarchy_from_html(html) == _reference_hierarchy(html)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_build_tag_tree_merges_pages_and_removes_duplicates(processes):
+    tag_tree = build_tag_tree(PAGES_FOLDER, processes=processes)
+
+    # "signet" steht in beiden Seiten und bleibt nur auf der höchsten Ebene
+    assert tag_tree == {
+        "acceleration": {},
+        "ramp": {"mana-rock": {}, "land-ramp": {}},
+        "removal": {"creature-removal": {}},
+        "signet": {},
+    }
+    assert list(tag_tree) == sorted(tag_tree)
+
+
+def test_remove_duplicate_tags_keeps_the_first_occurrence():
+    hierarchy = {
+        "ramp": {"mana-rock": {"signet": {"talisman": {}}}, "ritual": {}},
+        "removal": {"ritual": {}, "board-wipe": {"talisman": {}}},
+        "signet": {"fellwar-stone": {}},
+    }
+
+    assert remove_duplicate_tags(hierarchy) == {
+        # signet steht oben, das tiefere Vorkommen fällt samt talisman weg; dieser bleibt unter board-wipe
+        "ramp": {"mana-rock": {}, "ritual": {}},
+        # ritual kommt zweimal auf derselben Ebene vor und bleibt beim ersten
+        "removal": {"board-wipe": {"talisman": {}}},
+        "signet": {"fellwar-stone": {}},
+    }
@@ -0,0 +1,107 @@
+import uuid
+
+from functions import general_funs, http_client
+from functions.general_funs import (SCRYFALL_COLLECTION_BATCH_SIZE, SCRYFALL_COLLECTION_ENDPOINT, _card_oracle_id,
+                                    add_oracle_ids, fetch_collection_cards, fetch_oracle_ids)
+
+
+class RecordedTransport:
+    """Beantwortet /cards/collection Anfragen aus der aufgezeichneten Antwort und merkt sich alle Anfragen."""
+
+    def __init__(self, response, failing_requests=()):
+        self.cards = {card["id"]: card for card in response["data"]}
+        self.failing_requests = set(failing_requests)
+        self.requests = []
+
+    def __call__(self, url, payload):
+        self.requests.append((url, payload))
+        if len(self.requests) in self.failing_requests:
+            raise http_client.RequestException("503 Service Unavailable")
+        data, not_found = [], []
+        for identifier in payload["identifiers"]:
+            card = self.cards.get(identifier.get("id"))
+            if card is None:
+                not_found.append(identifier)
+            else:
+                data.append(card)
+        return {"object": "list", "not_found": not_found, "data": data}
+
+
+def _unknown_ids(count):
+    return [str(uuid.UUID(int=i + 1)) for i in range(count)]
+
+
+def test_requests_are_batched_by_75_identifiers(collection_response):
+    transport = RecordedTransport(collection_response)
+    known = [card["id"] for card in collection_response["data"]]
+    scryfall_ids = known + _unknown_ids(2 * SCRYFALL_COLLECTION_BATCH_SIZE)
+
+    oracle_ids = fetch_oracle_ids(scryfall_ids, transport=transport)
+
+    assert SCRYFALL_COLLECTION_BATCH_SIZE == 75
+    assert [len(payload["identifiers"]) for _, payload in transport.requests] == [75, 75, len(known)]
+    assert {url for url, _ in transport.requests} == {SCRYFALL_COLLECTION_ENDPOINT}
+    assert oracle_ids == {card["id"]: card["oracle_id"] for card in collection_response["data"]}
+
+
+def test_duplicate_ids_are_requested_once(collection_response):
+    transport = RecordedTransport(collection_response)
+    scryfall_id = collection_response["data"][0]["id"]
+
+    assert fetch_oracle_ids([scryfall_id] * 3, transport=transport) == {
+        scryfall_id: collection_response["data"][0]["oracle_id"]}
+    assert transport.requests[0][1] == {"identifiers": [{"id": scryfall_id}]}
+
+
+def test_not_found_identifiers_are_skipped(collection_response, capsys):
+    identifiers = [{"id": card["id"]} for card in collection_response["data"]] + collection_response["not_found"]
+
+    cards = list(fetch_collection_cards(identifiers, transport=lambda url, payload: collection_response))
+
+    assert [card["name"] for card in cards] == [card["name"] for card in collection_response["data"]]
+    assert "could not find 2 identifiers" in capsys.readouterr().out
+
+
+def test_not_found_ids_are_missing_from_the_result(collection_response):
+    transport = RecordedTransport(collection_response)
+    unknown = _unknown_ids(3)
+
+    oracle_ids = fetch_oracle_ids(unknown + [collection_response["data"][0]["id"]], transport=transport)
+
+    assert set(oracle_ids) == {collection_response["data"][0]["id"]}
+
+
+def test_failed_batch_is_skipped(collection_response):
+    transport = RecordedTransport(collection_response, failing_requests={1})
+    known = [card["id"] for card in collection_response["data"]]
+
+    oracle_ids = fetch_oracle_ids(_unknown_ids(SCRYFALL_COLLECTION_BATCH_SIZE) + known, transport=transport)
+
+    assert len(transport.requests) == 2
+    assert set(oracle_ids) == set(known)
+
+
+def test_oracle_id_of_reversible_cards_comes_from_the_faces():
+    card = {"id": "x", "layout": "reversible_card",
+            "card_faces": [{"name": "Front"}, {"name": "Back", "oracle_id": "face-oracle-id"}]}
+
+    assert _card_oracle_id(card) == "face-oracle-id"
+    assert _card_oracle_id({"id": "y"}) is None
+
+
+def test_add_oracle_ids_resolves_a_deck_in_batches(collection_response, card_cache, tmp_path, monkeypatch):
+    # Ohne lokalen Index geht jeder unbekannte Druck an /cards/collection
+    monkeypatch.setattr(general_funs, "ORACLE_ID_INDEX_PATH", str(tmp_path / "missing.bin"))
+    monkeypatch.setattr(general_funs, "_oracle_id_index", None)
+    transport = RecordedTransport(collection_response)
+    known = {card["id"]: card["oracle_id"] for card in collection_response["data"]}
+    scryfall_ids = _unknown_ids(SCRYFALL_COLLECTION_BATCH_SIZE) + list(known)
+    deck = {str(i): {"scryfall_id": scryfall_id} for i, scryfall_id in enumerate(scryfall_ids + list(known))}
+
+    add_oracle_ids(deck, transport=transport, progress=False)
+
+    assert [len(payload["identifiers"]) for _, payload in transport.requests] == [75, len(known)]
+    assert {card["scryfall_id"]: card["oracle_id"] for card in deck.values() if "oracle_id" in card} == known
+    # Gelöste Drucke kommen beim nächsten Deck aus dem Karten-Cache
+    add_oracle_ids({"x": {"scryfall_id": next(iter(known))}}, transport=transport, progress=False)
+    assert len(transport.requests) == 2
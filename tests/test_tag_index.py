@@ -0,0 +1,157 @@
+import os
+import pickle
+
+import pytest
+
+from functions import tag_index as tag_index_module
+from functions import webapp_funs
+from functions.tag_index import DeckTagIndex, build_tag_index, load_tag_index, save_tag_index
+
+DECKS = {
+    "deckA": {"a1": {"tags": ["ramp", "mana-rock"]}, "a2": {"tags": ["removal"]}, "a3": {"tags": ["card-draw"]}},
+    "deckB": {"b1": {"tags": ["ramp", "land-ramp"]}, "b2": {"tags": ["board-wipe", "removal"]}},
+    "deckC": {"c1": {"tags": ["card-draw", "ramp"]}},
+}
+TAG_TREE = {"ramp": {"mana-rock": {}, "land-ramp": {}}, "removal": {"board-wipe": {}}, "card-draw": {}}
+
+
+@pytest.fixture
+def index():
+    return build_tag_index(DECKS.items())
+
+
+def _cards(index, expression, tag_tree=None):
+    return sorted(card_key for _, card_key in index.query(expression, tag_tree))
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("ramp", ["a1", "b1", "c1"]),
+    # AND bindet stärker als OR, benachbarte Begriffe werden mit AND verknüpft
+    ("removal OR ramp AND card-draw", ["a2", "b2", "c1"]),
+    ("ramp card-draw", ["c1"]),
+    ("(removal OR ramp) AND card-draw", ["c1"]),
+    ("ramp AND NOT (card-draw OR land-ramp)", ["a1"]),
+    ("NOT ramp", ["a2", "a3", "b2"]),
+    ("NOT NOT ramp", ["a1", "b1", "c1"]),
+    ("NOT ramp AND NOT removal", ["a3"]),
+    ("unknown-tag OR board-wipe", ["b2"]),
+])
+def test_query_precedence_and_parentheses(index, expression, expected):
+    assert _cards(index, expression) == expected
+
+
+def test_query_with_tag_tree_and_deck_level(index):
+    assert _cards(index, "removal AND NOT board-wipe", TAG_TREE) == ["a2"]
+    assert _cards(index, "ramp AND NOT mana-rock", TAG_TREE) == ["b1", "c1"]
+    # Auf Deck-Ebene reicht es, wenn verschiedene Karten die Tags tragen
+    assert index.query("mana-rock AND removal", level="deck") == ["deckA"]
+    assert index.query("NOT removal", level="deck") == ["deckC"]
+
+
+@pytest.mark.parametrize("expression", ["", "ramp AND", "OR ramp", "(ramp", "ramp)", "ramp AND (OR removal)",
+                                        "NOT", "()"])
+def test_malformed_queries_raise_value_error(index, expression):
+    with pytest.raises(ValueError):
+        index.query(expression)
+
+
+def test_unknown_level_raises_value_error(index):
+    with pytest.raises(ValueError):
+        index.query("ramp", level="board")
+
+
+def test_update_and_remove_deck(index):
+    index.update_deck("deckA", {"a9": {"tags": ["board-wipe"]}})
+    index.remove_deck("deckC")
+
+    assert _cards(index, "board-wipe") == ["a9", "b2"]
+    assert _cards(index, "ramp") == ["b1"]
+    assert index.query("card-draw", level="deck") == []
+    assert index.dead == 4
+
+
+def test_compact_keeps_the_query_results(index):
+    index.update_deck("deckA", {"a9": {"tags": ["board-wipe", "ramp"]}})
+    index.remove_deck("deckC")
+    expressions = ["ramp", "NOT ramp", "board-wipe OR card-draw", "removal AND NOT land-ramp"]
+    before = {expression: _cards(index, expression) for expression in expressions}
+
+    index.compact()
+
+    assert index.dead == 0
+    assert len(index.posting_cards) == 3
+    assert {expression: _cards(index, expression) for expression in expressions} == before
+    assert index.query("ramp", level="deck") == ["deckA", "deckB"]
+
+
+def test_dead_postings_are_compacted_automatically():
+    index = DeckTagIndex()
+    for version in range(3):
+        index.update_deck("deck", {f"card{version}": {"tags": ["ramp"]}})
+
+    assert index.dead <= len(index.posting_cards) // 2
+    assert _cards(index, "ramp") == ["card2"]
+
+
+def test_save_and_load(index, tmp_path):
+    path = str(tmp_path / "tag_index.pkl")
+    index.update_deck("deckA", DECKS["deckA"], stamp=(1, 2, 3))
+    index.query("ramp")
+
+    save_tag_index(index, path)
+    loaded = load_tag_index(path)
+
+    assert loaded.deck_stamps == {"deckA": (1, 2, 3)}
+    assert _cards(loaded, "ramp") == ["a1", "b1", "c1"]
+    assert os.listdir(tmp_path) == ["tag_index.pkl"]
+
+
+def test_failed_save_removes_the_temporary_file(index, tmp_path, monkeypatch):
+    path = tmp_path / "tag_index.pkl"
+    save_tag_index(index, str(path))
+
+    def fail(*args, **kwargs):
+        raise pickle.PicklingError("kaputt")
+
+    monkeypatch.setattr(tag_index_module.pickle, "dump", fail)
+    with pytest.raises(pickle.PicklingError):
+        save_tag_index(index, str(path))
+
+    assert os.listdir(tmp_path) == ["tag_index.pkl"]
+    monkeypatch.undo()
+    assert _cards(load_tag_index(str(path)), "removal") == ["a2", "b2"]
+
+
+def test_index_follows_the_deck_cache(deck_cache):
+    webapp_funs.save_processed_deck("deckA", DECKS["deckA"])
+    webapp_funs.save_processed_deck("deckB", DECKS["deckB"])
+    webapp_funs.flush_deck_tag_index()
+    assert webapp_funs.query_cached_decks("ramp") == ["deckA", "deckB"]
+
+    # Ein anderer Prozess ändert den Cache, während der Index nicht geladen ist
+    webapp_funs._tag_index = None
+    path_b = webapp_funs.get_processed_deck_cache_filename("deckB")
+    entry = webapp_funs._read_cache_entry(path_b)
+    entry["data"] = {"b1": {"tags": ["card-draw"]}}
+    webapp_funs._write_cache_entry(path_b, entry)
+    webapp_funs._write_cache_entry(webapp_funs.get_processed_deck_cache_filename("deckC"),
+                                   dict(entry, deck_id="deckC", data=DECKS["deckC"]))
+    os.remove(webapp_funs.get_processed_deck_cache_filename("deckA"))
+
+    assert webapp_funs.query_cached_decks("ramp") == ["deckC"]
+    assert webapp_funs.query_cached_decks("card-draw") == ["deckB", "deckC"]
+
+
+def test_unchanged_decks_are_not_read_again(deck_cache, monkeypatch):
+    webapp_funs.save_processed_deck("deckA", DECKS["deckA"])
+    webapp_funs.flush_deck_tag_index()
+    webapp_funs._tag_index = None
+    webapp_funs._hot_cache.clear()
+    # Treffer ändern den Stempel nicht
+    assert webapp_funs.load_cached_processed_deck("deckA") is not None
+
+    def fail(*args, **kwargs):
+        pytest.fail("unchanged deck was read again")
+
+    monkeypatch.setattr(webapp_funs, "_read_cache_entry", fail)
+    assert webapp_funs.query_cached_decks("removal") == ["deckA"]
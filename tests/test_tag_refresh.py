@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import pickle
+
+from functions import tag_store as tag_store_module
+from functions import webapp_funs
+from functions.tag_refresh import diff_card_tags, read_card_tags, refresh_card_tags
+
+SOL_RING = "6ad8011d-3471-4369-9d68-b264cc027487"
+ARCANE_SIGNET = "0bc7f093-bef0-4f1a-852c-4b75ebf54838"
+COMMAND_TOWER = "0895c9b7-ae7d-4bb3-af17-3b75deb50a25"
+SWORDS = "b1544f21-7e98-461b-aed5-e748b0168c52"
+
+CARD_TAGS = {
+    SOL_RING: ["ramp", "mana-rock"],
+    ARCANE_SIGNET: ["ramp", "mana-rock"],
+    COMMAND_TOWER: ["land"],
+}
+NEW_CARD_TAGS = {
+    SOL_RING: ["mana-rock", "ramp"],  # nur umsortiert
+    ARCANE_SIGNET: ["ramp", "mana-rock", "color-fixing"],
+    SWORDS: ["removal"],
+}
+
+
+def test_diff_card_tags(tag_store):
+    store = tag_store(CARD_TAGS)
+
+    assert diff_card_tags(store, NEW_CARD_TAGS) == {
+        "added": [SWORDS],
+        "removed": [COMMAND_TOWER],
+        "changed": [ARCANE_SIGNET],
+    }
+    assert diff_card_tags(store, CARD_TAGS) == {"added": [], "removed": [], "changed": []}
+
+
+def test_read_card_tags():
+    payload = {"object": "list", "data": [
+        {"label": "ramp", "oracle_ids": [SOL_RING, ARCANE_SIGNET]},
+        {"label": "removal", "oracle_ids": [SWORDS]},
+        {"label": "mana-rock", "oracle_ids": [SOL_RING]},
+    ]}
+
+    assert read_card_tags(io.StringIO(json.dumps(payload))) == {
+        SOL_RING: ["ramp", "mana-rock"], ARCANE_SIGNET: ["ramp"], SWORDS: ["removal"]}
+
+
+def _card(oracle_id, tags):
+    return {"name": oracle_id[:8], "quantity": 1, "oracle_id": oracle_id, "tags": tags}
+
+
+def test_refresh_patches_only_affected_decks(tag_store, deck_cache, card_cache):
+    old_store = tag_store(CARD_TAGS)
+    # Die Tags von Sol Ring im Cache weichen bewusst vom Store ab: unveränderte Karten werden nicht neu getaggt
+    webapp_funs.save_processed_deck("rocks", {"0": _card(SOL_RING, ["cached"]), "1": _card(ARCANE_SIGNET, ["ramp"])})
+    webapp_funs.save_processed_deck("tower", {"0": _card(SOL_RING, ["cached"]), "1": _card(COMMAND_TOWER, ["land"])})
+    webapp_funs.save_processed_deck("untouched", {"0": _card(SOL_RING, ["cached"])})
+    untouched_path = webapp_funs.get_processed_deck_cache_filename("untouched")
+    atime_ns = os.stat(untouched_path).st_atime_ns - 10 ** 9
+    os.utime(untouched_path, ns=(atime_ns, os.stat(untouched_path).st_mtime_ns))
+
+    summary = refresh_card_tags(NEW_CARD_TAGS)
+
+    new_store = tag_store_module.get_tag_store()
+    assert new_store.version == summary["new_version"] != old_store.version
+    assert (summary["added"], summary["removed"], summary["changed"]) == (1, 1, 1)
+    assert (summary["patched"], summary["migrated"], summary["skipped"]) == (2, 1, 0)
+
+    webapp_funs._hot_cache.clear()
+    rocks = webapp_funs.load_cached_processed_deck("rocks")
+    assert rocks["0"]["tags"] == ["cached"]
+    assert sorted(rocks["1"]["tags"]) == ["color-fixing", "mana-rock", "ramp"]
+    tower = webapp_funs.load_cached_processed_deck("tower")
+    assert tower["0"]["tags"] == ["cached"] and tower["1"]["tags"] == []
+    # Nicht betroffene Decks bleiben gültig und behalten ihre Zugriffszeit
+    assert os.stat(untouched_path).st_atime_ns == atime_ns
+    assert webapp_funs.load_cached_processed_deck("untouched") == {"0": _card(SOL_RING, ["cached"])}
+    assert webapp_funs.query_cached_decks("color-fixing") == ["rocks"]
+    assert webapp_funs.query_cached_decks("land") == []
+
+    with open(tag_store_module.CARD_TAGS_DICT_PATH, "rb") as f:
+        assert pickle.load(f) == NEW_CARD_TAGS
+
+
+def test_refresh_with_the_same_tags_changes_nothing(tag_store, deck_cache, card_cache):
+    store = tag_store(CARD_TAGS)
+    with open(tag_store_module.CARD_TAGS_DICT_PATH, "rb") as f:
+        content = f.read()
+
+    summary = refresh_card_tags(dict(CARD_TAGS))
+
+    assert summary["new_version"] == summary["old_version"] == store.version
+    assert "patched" not in summary
+    with open(tag_store_module.CARD_TAGS_DICT_PATH, "rb") as f:
+        assert f.read() == content
+
+
+def test_refresh_migrates_cached_tag_ids_of_unchanged_printings(tag_store, deck_cache, card_cache):
+    old_store = tag_store(CARD_TAGS)
+    card_cache.put_oracle_ids({"sol-ring-c21": SOL_RING, "signet-c21": ARCANE_SIGNET})
+    for scryfall_id, oracle_id in (("sol-ring-c21", SOL_RING), ("signet-c21", ARCANE_SIGNET)):
+        card_cache.put_tag_ids(scryfall_id, old_store.get_tag_ids(oracle_id), old_store.version)
+
+    refresh_card_tags(NEW_CARD_TAGS)
+
+    new_store = tag_store_module.get_tag_store()
+    assert card_cache.tags_version == new_store.version
+    assert new_store.labels(card_cache.get_tag_ids("sol-ring-c21", new_store.version)) == ["ramp", "mana-rock"]
+    assert card_cache.get_tag_ids("signet-c21", new_store.version) is None  # Tags geändert
+    assert not card_cache.dirty  # Gleich nach der Übernahme gespeichert
+
+
+def test_cli_reads_a_downloaded_payload(tag_store, deck_cache, card_cache, tmp_path, capsys):
+    from functions.tag_refresh import main
+
+    tag_store(CARD_TAGS)
+    payload = tmp_path / "oracle_tags.json"
+    payload.write_text(json.dumps({"data": [{"label": "removal", "oracle_ids": [SWORDS]}]}), encoding="utf-8")
+
+    assert main(["--input", str(payload)]) == 0
+
+    summary = json.loads(capsys.readouterr().err)
+    assert (summary["cards"], summary["added"], summary["removed"]) == (1, 1, 3)
+    assert tag_store_module.get_tag_store().get_tags(SWORDS) == ["removal"]
+    # Die vorherige Store-Version wird nach dem Umschalten gelöscht
+    assert set(os.listdir(tag_store_module.TAG_STORE_FOLDER)) == {tag_store_module.CURRENT_FILE, summary["new_version"]}
@@ -0,0 +1,38 @@
+import os
+
+from functions import tag_store as tag_store_module
+from functions.tag_store import CardTagStore, _oracle_key, build_tag_store
+
+SOL_RING = "6ad8011d-3471-4369-9d68-b264cc027487"
+# Endet auf Null-Bytes, die numpy bei S16 Werten abschneidet
+ZERO_TAIL = "00000000-0000-0000-0000-000000000000"
+CARD_TAGS = {SOL_RING: ["ramp", "mana-rock"], ZERO_TAIL: ["removal"], "not-an-id": ["ramp"]}
+
+
+def test_invalid_oracle_ids_map_onto_an_empty_key():
+    assert len(_oracle_key(SOL_RING)) == 16
+    assert _oracle_key("not-an-id") == b""
+    assert _oracle_key(None) == b""
+
+
+def test_store_lookup(tmp_path):
+    store = CardTagStore(build_tag_store(CARD_TAGS, "v1", str(tmp_path)))
+
+    assert len(store) == 2
+    assert store.get_tags(SOL_RING) == ["ramp", "mana-rock"]
+    assert store.get_tags(ZERO_TAIL) == ["removal"]
+    assert store.get_tags("not-an-id") == [] and "abcd" not in store
+    assert dict(store.items()) == {SOL_RING: ["ramp", "mana-rock"], ZERO_TAIL: ["removal"]}
+
+
+def test_new_version_replaces_the_old_ones(tmp_path):
+    build_tag_store(CARD_TAGS, "v1", str(tmp_path))
+    old_store = CardTagStore(os.path.join(tmp_path, "v1"))
+    os.mkdir(tmp_path / ".v3.abc.tmp")  # Temporärer Ordner eines laufenden Builds
+
+    build_tag_store({SOL_RING: ["ramp"]}, "v2", str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == [".v3.abc.tmp", tag_store_module.CURRENT_FILE, "v2"]
+    assert tag_store_module._current_store_path(str(tmp_path)) == os.path.join(tmp_path, "v2")
+    # Bereits geöffnete Stores lesen weiter
+    assert old_store.get_tags(SOL_RING) == ["ramp", "mana-rock"]
@@ -0,0 +1,42 @@
+from functions.general_funs import filter_tag_tree, get_matching_tags
+from functions.tag_tree_index import TagTreeIndex, get_tag_tree_index
+
+# "counterspell" kommt an zwei Stellen vor, "hard-counter" liegt zwei Ebenen tief
+TAG_TREE = {
+    "removal": {"board-wipe": {}, "counterspell": {"hard-counter": {}}},
+    "interaction": {"counterspell": {}},
+    "ramp": {"mana-rock": {}},
+}
+
+
+def test_closures_span_every_depth_and_merge_repeated_tags():
+    index = TagTreeIndex(TAG_TREE)
+
+    assert len(index) == 7 and "hard-counter" in index and "unknown" not in index
+    assert sorted(index.descendants("removal")) == ["board-wipe", "counterspell", "hard-counter"]
+    assert sorted(index.ancestors("hard-counter")) == ["counterspell", "interaction", "removal"]
+    assert index.descendants("unknown") == [] and index.ancestors("unknown") == []
+    assert sorted(index.tags_of(index.ancestor_closure(["counterspell", "unknown"]))) == \
+        ["counterspell", "interaction", "removal"]
+
+
+def test_matching_tags_keeps_selection_order_without_duplicates():
+    index = get_tag_tree_index(TAG_TREE)
+    selected = ["interaction", "ramp", "removal", "interaction", "custom", "removal"]
+
+    assert index.matching_tags(selected, ["hard-counter", "custom"]) == ["interaction", "removal", "custom"]
+    assert get_matching_tags(selected, TAG_TREE, ["mana-rock"]) == ["ramp"]
+    assert index.matching_tags(selected, []) == []
+
+
+def test_index_is_memoised_per_tree_object():
+    assert get_tag_tree_index(TAG_TREE) is get_tag_tree_index(TAG_TREE)
+    assert get_tag_tree_index(dict(TAG_TREE)) is not get_tag_tree_index(TAG_TREE)
+
+
+def test_filter_tag_tree_keeps_only_branches_leading_to_deck_tags():
+    assert filter_tag_tree(TAG_TREE, ["hard-counter"]) == {"removal": {"counterspell": {"hard-counter": {}}}}
+    assert filter_tag_tree(TAG_TREE, ["counterspell", "unknown"]) == {
+        "removal": {"counterspell": {}},
+        "interaction": {"counterspell": {}},
+    }
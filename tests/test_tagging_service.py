@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from functions import webapp_funs
+from functions.general_funs import DEFAULT_BOARDS
+from functions.tagging_service import ServiceError, SingleFlight, TaggingService
+
+TAG_TREE = {"ramp": {"mana-rock": {}}, "removal": {}}
+DECK = {
+    "0": {"name": "Sol Ring", "quantity": 1, "set": "c21", "cn": "263", "board": "mainboard", "tags": ["mana-rock"]},
+    "1": {"name": "Beast Within", "quantity": 1, "set": "c21", "cn": "151", "board": "mainboard", "tags": ["removal"]},
+}
+
+
+@pytest.fixture
+def service(deck_cache, card_cache):
+    webapp_funs.save_processed_deck("deckA", DECK, meta={"last_updated": None, "boards": list(DEFAULT_BOARDS)})
+    service = TaggingService(TAG_TREE, workers=2)
+    yield service
+    service.close()
+
+
+def test_single_flight_shares_running_calls():
+    from concurrent.futures import ThreadPoolExecutor
+
+    release = threading.Event()
+    calls = []
+
+    def load(key):
+        calls.append(key)
+        release.wait(5)
+        return key
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        flight = SingleFlight(executor)
+        first, second = flight.submit("a", load, "a"), flight.submit("a", load, "a")
+        assert first is second
+        release.set()
+        assert first.result(5) == "a"
+        assert flight.submit("a", load, "a").result(5) == "a"
+    assert calls == ["a", "a"] and flight.inflight == {}
+
+
+def test_tag_returns_json_and_text(service):
+    result = service.tag({"deck": "https://moxfield.com/decks/deckA", "tags": "ramp,unknown,ramp"})
+
+    assert result["selected_tags"] == ["ramp", "unknown"]
+    assert result["unknown_tags"] == ["unknown"]
+    assert [(card["name"], card["tags"]) for card in result["cards"]] == [("Beast Within", []), ("Sol Ring", ["ramp"])]
+    assert service.tag({"deck": "deckA", "tags": ["removal"], "format": "text"}) == \
+        "1 Beast Within (C21) 151 #removal\n1 Sol Ring (C21) 263 \n"
+
+
+@pytest.mark.parametrize("params, status", [
+    ({"deck": ""}, 400),
+    ({"deck": "deckA", "format": "xml"}, 400),
+    ({"deck": "deckA", "boards": [["mainboard"]]}, 400),
+    ({"deck": "deckA", "boards": {"mainboard": True}}, 400),
+])
+def test_invalid_parameters_are_client_errors(service, params, status):
+    with pytest.raises(ServiceError) as error:
+        service.tag(params)
+    assert error.value.status == status
+
+
+def test_card_cache_is_saved_in_the_background_and_on_close(deck_cache, card_cache, monkeypatch):
+    saved = threading.Event()
+    monkeypatch.setattr(card_cache, "save", saved.set)
+
+    service = TaggingService(TAG_TREE, workers=1, save_interval=0.01)
+    assert saved.wait(5)
+    saved.clear()
+    service.close()
+    assert saved.is_set() and not service.saver.is_alive()
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+from functions import tree_select_payload
+from functions.general_funs import convert_to_tree_select_format, filter_tag_tree
+from functions.tree_select_payload import (PLACEHOLDER_PREFIX, TreeSelectPayload, count_cards_per_tag,
+                                           get_tree_select_payload, tag_set_fingerprint)
+
+TAG_TREE = {"ramp": {"mana-rock": {}, "land-ramp": {"fetch-basic": {}}}, "removal": {"board-wipe": {}}}
+DECK = {
+    "0": {"name": "Sol Ring", "tags": ["mana-rock"]},
+    "1": {"name": "Cultivate", "tags": ["fetch-basic", "land-ramp"]},
+    "2": {"name": "Forest"},
+}
+DECK_TAGS = ["mana-rock", "fetch-basic", "land-ramp"]
+
+
+def test_card_counts_include_ancestors_once_per_card():
+    assert count_cards_per_tag(DECK, TAG_TREE) == {"mana-rock": 1, "fetch-basic": 1, "land-ramp": 1, "ramp": 2}
+
+
+def test_fingerprint_ignores_order_but_not_counts():
+    assert tag_set_fingerprint(["a", "b", "a"]) == tag_set_fingerprint(["b", "a"])
+    assert tag_set_fingerprint(["a"], {"a": 1}) != tag_set_fingerprint(["a"], {"a": 2}) != tag_set_fingerprint(["a"])
+
+
+def test_full_nodes_match_the_uncached_conversion():
+    payload = TreeSelectPayload(TAG_TREE, DECK_TAGS)
+
+    assert len(payload) == 4
+    assert payload.nodes() == convert_to_tree_select_format(filter_tag_tree(TAG_TREE, DECK_TAGS))
+    assert payload.nodes() is payload.nodes()
+
+
+def test_lazy_nodes_expand_on_demand():
+    payload = TreeSelectPayload(TAG_TREE, DECK_TAGS, count_cards_per_tag(DECK, TAG_TREE))
+
+    collapsed = payload.nodes((), depth=1)
+    assert [node["label"] for node in collapsed] == ["ramp (2)"]
+    assert [child["value"] for child in collapsed[0]["children"]] == [PLACEHOLDER_PREFIX + "ramp"]
+    assert payload.nodes((), depth=1) is collapsed
+
+    expanded = payload.nodes(["ramp"], depth=1)
+    assert [child["label"] for child in expanded[0]["children"]] == ["mana-rock (1)", "land-ramp (1)"]
+    assert expanded[0]["children"][1]["children"][0]["value"] == PLACEHOLDER_PREFIX + "land-ramp"
+    assert TreeSelectPayload.checked_tags(["ramp", PLACEHOLDER_PREFIX + "land-ramp"]) == ["ramp"]
+
+
+def test_payloads_are_shared_by_decks_with_the_same_tags_and_bounded(monkeypatch):
+    monkeypatch.setattr(tree_select_payload, "_payload_cache", OrderedDict())
+    monkeypatch.setattr(tree_select_payload, "PAYLOAD_CACHE_SIZE", 2)
+
+    payload = get_tree_select_payload(TAG_TREE, DECK_TAGS)
+    assert get_tree_select_payload(TAG_TREE, list(reversed(DECK_TAGS))) is payload
+    # Ein anderer Baum mit gleichen Tags bekommt eine eigene Payload
+    assert get_tree_select_payload(dict(TAG_TREE), DECK_TAGS) is not payload
+
+    get_tree_select_payload(TAG_TREE, ["board-wipe"])
+    assert len(tree_select_payload._payload_cache) == 2
+    assert get_tree_select_payload(TAG_TREE, DECK_TAGS) is not payload
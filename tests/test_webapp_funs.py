@@ -0,0 +1,83 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from functions import webapp_funs
+from functions.tag_store import get_tag_store
+
+DECK = {"0": {"name": "Sol Ring", "quantity": 1, "oracle_id": "6ad8011d-3471-4369-9d68-b264cc027487",
+              "tags": ["ramp"]}}
+
+
+def test_cache_paths_do_not_depend_on_the_working_directory():
+    assert os.path.isabs(webapp_funs.cache_folder)
+    assert os.path.dirname(webapp_funs.TAG_INDEX_PATH) == webapp_funs.cache_folder
+
+
+def test_saved_decks_are_served_from_memory_and_disk(deck_cache):
+    webapp_funs.save_processed_deck("deckA", DECK, meta={"boards": ["mainboard"]})
+
+    assert webapp_funs.load_cached_processed_deck("deckA") == DECK
+    webapp_funs._hot_cache.clear()
+    entry = webapp_funs.load_cached_processed_deck_entry("https://moxfield.com/decks/deckA")
+    assert entry["data"] == DECK and entry["meta"] == {"boards": ["mainboard"]}
+    assert entry["tags_version"] == get_tag_store().version
+    assert "deckA" in webapp_funs._hot_cache
+
+
+def test_legacy_entries_are_misses_but_stay_for_reuse(deck_cache):
+    path = webapp_funs.get_processed_deck_cache_filename("legacy")
+    with open(path, "wb") as f:
+        pickle.dump(DECK, f)
+
+    assert webapp_funs.load_cached_processed_deck("legacy") is None
+    entry = webapp_funs._read_cache_entry(path)
+    assert entry["tags_version"] is None and entry["data"] == DECK and entry["deck_id"] == "legacy"
+    assert os.path.exists(path)
+
+
+def test_expired_entries_are_misses_but_stay_for_reuse(deck_cache, monkeypatch):
+    webapp_funs.save_processed_deck("old", DECK)
+    webapp_funs._hot_cache.clear()
+    monkeypatch.setattr(webapp_funs.time, "time", lambda: time.time_ns() / 1e9 + webapp_funs.CACHE_TTL_SECONDS)
+
+    assert webapp_funs.load_cached_processed_deck("old") is None
+    assert os.path.exists(webapp_funs.get_processed_deck_cache_filename("old"))
+
+
+def test_unreadable_files_are_removed(deck_cache):
+    path = webapp_funs.get_processed_deck_cache_filename("broken")
+    with open(path, "wb") as f:
+        f.write(b"\x80\x05 kaputt")
+
+    assert webapp_funs.load_cached_processed_deck("broken") is None
+    assert not os.path.exists(path)
+
+
+def test_file_deleted_after_reading_is_a_miss(deck_cache, monkeypatch):
+    webapp_funs.save_processed_deck("gone", DECK)
+    webapp_funs._hot_cache.clear()
+    read_cache_entry = webapp_funs._read_cache_entry
+
+    def read_then_delete(path, remove_unreadable=False):
+        entry = read_cache_entry(path, remove_unreadable)
+        os.remove(path)
+        return entry
+
+    monkeypatch.setattr(webapp_funs, "_read_cache_entry", read_then_delete)
+
+    assert webapp_funs.load_cached_processed_deck("gone") is None
+    assert "gone" not in webapp_funs._hot_cache
+
+
+def test_parse_deck_id():
+    from functions.general_funs import parse_deck_id
+
+    for value in ("abc_-1", " abc_-1/ ", "abc_-1?x=1", "https://moxfield.com/decks/abc_-1",
+                  "https://www.moxfield.com/decks/abc_-1/primer", "moxfield.com/decks/abc_-1?tab=stats#top"):
+        assert parse_deck_id(value) == "abc_-1"
+    for value in ("", "https://moxfield.com/users/someone", "two words", "../etc/passwd"):
+        with pytest.raises(ValueError):
+            parse_deck_id(value)